@@ -1,9 +1,11 @@
-from csv import reader
+import queue
+import threading
 import tkinter as tk
 from tkinter import ttk
 from tkinter import messagebox
 
 import data_functions
+from mcmlstats import error_message, read_default_categories
 
 
 row_packing_args = {
@@ -22,6 +24,11 @@ inner_packing_args = {
 
 font = ('Arial', 18)
 
+CREATING = "Creating meet file"
+
+# How often the GUI checks on a task running in the background
+POLL_MS = 100
+
 
 class MCML_Frame(tk.Frame):
     ''' Top level GUI for the MCML statisticians to work on the
@@ -35,23 +42,58 @@ class MCML_Frame(tk.Frame):
         self.menu = Menu_Frame(self)
         self.menu.pack()
 
-        # Create Files Options
-        self.create_frame = Options_Frame(self)
+        # The default categories are read once and shared
+        self.categories = read_default_categories()
 
-        # Analyze Data Options
-        self.analyze_frame = Analyze_Frame(self)
+        # The option frames are only built the first time they're shown
+        self.create_frame = None
+        self.analyze_frame = None
+
+        # Shows the progress of work running in the background
+        self.progress_frame = Progress_Frame(self)
 
     def show_error_message(self, error: str) -> None:
         """ Displays an error message to the user. No side effects. """
         messagebox.showerror(title="ERROR", message=error)
 
+    def run_task(self, task, stages, success_message, show_options):
+        """ Runs task on a worker thread while showing its progress. task is
+        called with a progress function to call with each stage's name as it
+        starts. When it finishes, success_message is shown and the menu
+        returns. If it fails or is cancelled, the user is told why and
+        show_options is called to return to where they were. """
+        def succeeded():
+            messagebox.showinfo(title="Success!", message=success_message)
+            self.show_menu()
+
+        def failed(err):
+            if isinstance(err, Cancelled):
+                messagebox.showinfo(
+                    title="Cancelled",
+                    message=("The task was cancelled before the stage "
+                             f"'{err.args[0]}'. Any files it had already "
+                             "written have been left in place."))
+            elif isinstance(err, (OSError, ValueError)):
+                self.show_error_message(error_message(err))
+            else:
+                self.show_error_message(f"Unexpected error: {err!r}")
+            show_options()
+
+        self.empty()
+        self.progress_frame.pack()
+        self.progress_frame.run(task, stages, succeeded, failed)
+
     # The following four methods are to modify the contents of the main frame.
     def show_creation_options(self):
         self.empty()
+        if self.create_frame is None:
+            self.create_frame = Options_Frame(self, self.categories)
         self.create_frame.pack()
 
     def show_analyzing_options(self):
         self.empty()
+        if self.analyze_frame is None:
+            self.analyze_frame = Analyze_Frame(self)
         self.analyze_frame.pack()
 
     def show_menu(self):
@@ -96,61 +138,62 @@ class Analyze_Frame(tk.Frame):
     def __init__(self, master):
         tk.Frame.__init__(self, master, width=600)
 
-        self.categories = {}
-        with open('Default Categories.csv', 'r') as infile:
-            csv_reader = reader(infile)
-            for row in csv_reader:
-                self.categories[row[0]] = row[1:]
-
         self.shared = Shared_Options(self)
         self.shared.pack()
 
         # Row 2
         row_2 = tk.Frame(self)
         row_2.pack(**row_packing_args)
-        create_button = tk.Button(row_2, text='Create Reports', font=font,
+        self.profile = tk.BooleanVar(row_2, value=False)
+        profile_check = tk.Checkbutton(row_2, text='Profile this run',
+                                       variable=self.profile, font=font)
+        profile_check.pack(side=tk.TOP)
+        self.intervals = tk.BooleanVar(row_2, value=False)
+        intervals_check = tk.Checkbutton(
+            row_2, text='Estimate confidence intervals',
+            variable=self.intervals, font=font)
+        intervals_check.pack(side=tk.TOP)
+        self.rerun = tk.BooleanVar(row_2, value=False)
+        rerun_check = tk.Checkbutton(
+            row_2, text='Update a meet that was already analyzed',
+            variable=self.rerun, font=font)
+        rerun_check.pack(side=tk.TOP)
+
+        # Row 3
+        row_3 = tk.Frame(self)
+        row_3.pack(**row_packing_args)
+        create_button = tk.Button(row_3, text='Create Reports', font=font,
                                   command=self.analyze)
         create_button.pack(side=tk.TOP)
 
         # Blank Row for spacing
-        row_3 = tk.Frame(self)
-        row_3.pack(**row_packing_args)
+        row_4 = tk.Frame(self)
+        row_4.pack(**row_packing_args)
 
     def analyze(self):
         year = self.shared.get_year()
         meet = self.shared.get_meet()
+        profile = self.profile.get()
+        intervals = self.intervals.get()
+        rerun = self.rerun.get()
 
-        try:
-            data_functions.create_reports(year, meet)
-
-        except FileNotFoundError as err:
-            message = err.args[0]
-            self.master.show_error_message(message)
-
-        except FileExistsError as err:
-            message = err.args[0]
-            self.master.show_error_message(message)
-
-        else:
-            messagebox.showinfo(
-                title="Success!",
-                message=("All reports and data files were created "
-                         "successfully."))
-            self.master.show_menu()
+        self.master.run_task(
+            lambda progress: data_functions.create_reports(
+                year, meet, progress, profile, intervals=intervals,
+                rerun=rerun),
+            data_functions.report_stages(intervals),
+            "All reports and data files were created successfully.",
+            self.master.show_analyzing_options)
 
 
 class Options_Frame(tk.Frame):
     ''' Allows the user to set the meet information and create the
     csv file for the meet. '''
 
-    def __init__(self, master, font=('Arial', 18)):
+    def __init__(self, master, categories, font=('Arial', 18)):
         tk.Frame.__init__(self, master, width=600)
 
-        self.categories = {}
-        with open('Default Categories.csv', 'r') as infile:
-            csv_reader = reader(infile)
-            for row in csv_reader:
-                self.categories[int(row[0])] = row[1:]
+        self.categories = categories
 
         self.shared = Shared_Options(self, callback=self.selection_changed)
         self.shared.pack()
@@ -167,6 +210,9 @@ class Options_Frame(tk.Frame):
         create_button = tk.Button(row_3, text='Create Meet Files',
                                   font=font, command=self.create)
         create_button.pack(side=tk.TOP)
+        season_button = tk.Button(row_3, text='Create Files for Every Meet',
+                                  font=font, command=self.create_season)
+        season_button.pack(side=tk.TOP)
 
         # Blank Row for spacing
         row_4 = tk.Frame(self)
@@ -199,28 +245,128 @@ class Options_Frame(tk.Frame):
                       for key in self.row_2.children
                       if 'entry' in key]
 
-        try:
+        def create_meet_file(progress):
+            progress(CREATING)
             data_functions.create_meet_file(year, meet, categories)
 
-        except FileExistsError as err:
-            message = err.args[0]
-            self.master.show_error_message(message)
+        self.master.run_task(
+            create_meet_file, [CREATING],
+            ("The meet file was created successfully.\n\nIt is "
+             f"called 'Meet {meet}.csv' and can be found in the "
+             f"{year} directory.\n\nYou can open and edit it in "
+             "Excel, Open Office, or any spreadsheet "
+             "editor of your choice.\n\nWhen you are done, you "
+             "can use this program to analyze the student scores "
+             "and generate reports."),
+            self.master.show_creation_options)
+
+    def create_season(self):
+        year = self.shared.get_year()
+        categories = self.categories
+
+        def setup_season(progress):
+            progress(CREATING)
+            data_functions.setup_season(year, categories)
+
+        self.master.run_task(
+            setup_season, [CREATING],
+            (f"A meet file was created for each of the {len(categories)} "
+             "meets in 'Default Categories.csv'.\n\nThey can be found in "
+             f"the {year} directory."),
+            self.master.show_creation_options)
+
+
+class Cancelled(Exception):
+    ''' Raised on the worker thread to stop a task the user cancelled. Its
+    argument is the stage that was about to start. '''
 
-        except FileNotFoundError as err:
-            message = err.args[0]
-            self.master.show_error_message(message)
 
+class Progress_Frame(tk.Frame):
+    ''' Runs a task on a worker thread, showing which stage it is on and
+    letting the user cancel it. The worker only talks to the GUI through a
+    queue which is polled with after(), since tkinter isn't thread-safe. '''
+
+    def __init__(self, master):
+        tk.Frame.__init__(self, master, width=600)
+
+        self.queue = queue.Queue()
+        self.cancel_requested = threading.Event()
+
+        # Row 0
+        row_0 = tk.Frame(self)
+        row_0.pack(**row_packing_args)
+        self.status_label = tk.Label(row_0, text='', font=font, anchor='w',
+                                     width=40)
+        self.status_label.pack(**inner_packing_args)
+
+        # Row 1
+        row_1 = tk.Frame(self)
+        row_1.pack(**row_packing_args)
+        self.progress_bar = ttk.Progressbar(row_1, mode='determinate')
+        self.progress_bar.pack(**inner_packing_args)
+
+        # Row 2
+        row_2 = tk.Frame(self)
+        row_2.pack(**row_packing_args)
+        self.cancel_button = tk.Button(row_2, text='Cancel', font=font,
+                                       command=self.cancel)
+        self.cancel_button.pack(side=tk.TOP)
+
+        # Blank Row for spacing
+        row_3 = tk.Frame(self)
+        row_3.pack(**row_packing_args)
+
+    def run(self, task, stages, on_success, on_failure):
+        self.stages = stages
+        self.on_success = on_success
+        self.on_failure = on_failure
+
+        self.cancel_requested.clear()
+        self.cancel_button.config(state=tk.NORMAL)
+        self.progress_bar.config(maximum=len(stages), value=0)
+        self.status_label.config(text='Starting...')
+
+        worker = threading.Thread(target=self.work, args=(task,), daemon=True)
+        worker.start()
+        self.after(POLL_MS, self.poll)
+
+    def work(self, task):
+        ''' Runs on the worker thread. '''
+        try:
+            task(self.report_stage)
+        except Exception as err:
+            self.queue.put(('failed', err))
         else:
-            messagebox.showinfo(
-                title="Success!",
-                message=("The meet file was created successfully.\n\nIt is "
-                         f"called 'Meet {meet}.csv' and can be found in the "
-                         f"{year} directory.\n\nYou can open and edit it in "
-                         "Excel, Open Office, or any spreadsheet "
-                         "editor of your choice.\n\nWhen you are done, you "
-                         "can use this program to analyze the student scores "
-                         "and generate reports."))
-            self.master.show_menu()
+            self.queue.put(('succeeded', None))
+
+    def report_stage(self, stage):
+        ''' Runs on the worker thread as each stage starts. '''
+        if self.cancel_requested.is_set():
+            raise Cancelled(stage)
+        self.queue.put(('stage', stage))
+
+    def poll(self):
+        while not self.queue.empty():
+            message, value = self.queue.get()
+            if message == 'stage':
+                number = self.stages.index(value) + 1
+                self.progress_bar.config(value=number - 1)
+                self.status_label.config(
+                    text=f'Step {number} of {len(self.stages)}: {value}')
+            elif message == 'succeeded':
+                self.progress_bar.config(value=len(self.stages))
+                self.on_success()
+                return
+            else:
+                self.on_failure(value)
+                return
+
+        self.after(POLL_MS, self.poll)
+
+    def cancel(self):
+        self.cancel_requested.set()
+        self.cancel_button.config(state=tk.DISABLED)
+        self.status_label.config(text='Cancelling...')
 
 
 class Shared_Options(tk.Frame):
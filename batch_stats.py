@@ -0,0 +1,141 @@
+import argparse
+import glob
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+import data_functions
+from data_functions import FINAL_RATING, score_columns
+
+
+def find_meet_files(years: list[int],
+                    meets: list[int] = None) -> dict[tuple[int, int], str]:
+    """ Returns a dictionary mapping (year, meet) to the path of that meet's
+    scores file. If no meets are given, every 'Meet N.csv' file found in each
+    year's directory is used. Requested meets that don't exist raise a
+    FileNotFoundError. """
+    meet_files = {}
+    for year in sorted(years):
+        directory = str(year)
+        if meets is None:
+            found = []
+            for path in glob.glob(f'./{directory}/Meet *.csv'):
+                filename = os.path.basename(path)
+                match = re.fullmatch(r'Meet (\d+)\.csv', filename)
+                if match:
+                    found.append(int(match.group(1)))
+        else:
+            found = meets
+
+        for meet in sorted(found):
+            scores_path = f'./{directory}/Meet {meet}.csv'
+            if not os.path.exists(scores_path):
+                raise FileNotFoundError(
+                    "Meet Data Not Found\n\nThe batch run was asked for Meet "
+                    f"{meet} of {year}, but there is no file named "
+                    f"'Meet {meet}.csv' in the '{directory}' folder.")
+            meet_files[(year, meet)] = scores_path
+
+    return meet_files
+
+
+def batch_stats(meets: dict[tuple[int, int], pd.DataFrame]) \
+        -> dict[tuple[int, int], tuple[pd.DataFrame, pd.DataFrame]]:
+    """ Takes a dictionary of loaded meet data keyed by (year, meet) and
+    returns a dictionary with the same keys holding the same pair of DataFrames
+    that data_functions.meet_stats returns for each meet.
+
+    Every meet's scores are stacked into a single matrix so the category
+    aggregates and all of the student ratings are computed in one pass. """
+    keys = list(meets)
+    if not keys:
+        return {}
+
+    categories = {key: score_columns(meets[key].keys())
+                  for key in keys}
+    scores = np.concatenate(
+        [data_functions.score_matrix(meets[key], categories[key])
+         for key in keys])
+    sizes = [len(meets[key]) for key in keys]
+    meet_index = np.repeat(np.arange(len(keys)), sizes)
+
+    counts, totals = data_functions.category_aggregates(scores, meet_index,
+                                                        len(keys))
+    ratings = data_functions.category_ratings(counts, totals)
+    final = data_functions.student_ratings(scores, ratings[meet_index])
+
+    # Split the stacked results back up by meet
+    results = {}
+    bounds = np.cumsum([0] + sizes)
+    for i, key in enumerate(keys):
+        student_data = meets[key].copy()
+        student_data[FINAL_RATING] = final[bounds[i]:bounds[i+1]]
+        data_functions.restore_score_types(
+            student_data, categories[key], scores[bounds[i]:bounds[i+1]])
+
+        category_data = pd.DataFrame.from_dict({
+            "Category": categories[key],
+            data_functions.COUNT: counts[i],
+            data_functions.TOTAL: totals[i],
+            data_functions.RATINGS: ratings[i],
+        })
+        results[key] = (student_data, category_data)
+
+    return results
+
+
+def calculate_batch_stats(years: list[int], meets: list[int] = None) \
+        -> dict[tuple[int, int], tuple[pd.DataFrame, pd.DataFrame]]:
+    """ Loads the requested meets of the requested years and calculates all of
+    their stats at once. See find_meet_files and batch_stats. Every file is
+    validated before any are calculated; the first with problems raises
+    validation.InvalidMeetData. """
+    import validation
+
+    meet_files = find_meet_files(years, meets)
+    loaded = {key: data_functions.read_data_file(path, has_scores=True)
+              for key, path in meet_files.items()}
+    for key, meet_data in loaded.items():
+        validation.check(meet_data, meet_files[key])
+    return batch_stats(loaded)
+
+
+def write_batch_stats(
+        results: dict[tuple[int, int], tuple[pd.DataFrame, pd.DataFrame]]) \
+        -> list[str]:
+    """ Brings every file of each meet in results up to date from its stats,
+    in year and meet order, exactly as re-running the meet with
+    create_reports would: the data files (with Student IDs), leaderboards,
+    cumulative ratings (of the later meets too), season store and reports.
+    Interval files are recalculated for meets that have them. Only the files
+    whose contents changed are rewritten. Returns the paths written. """
+    written = []
+    for year, meet in sorted(results):
+        intervals = os.path.exists(
+            f'./{year}/Meet {meet}/Meet {meet} Rating Intervals.csv')
+        written += data_functions.create_reports(
+            year, meet, intervals=intervals, rerun=True,
+            stats=results[(year, meet)])
+    return written
+
+
+def main(argv: list[str] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Recalculate the student and category ratings for many "
+        "meets across many years in a single pass, and bring every file "
+        "made from them up to date.")
+    parser.add_argument('years', type=int, nargs='+',
+                        help="the years (folders) to recalculate")
+    parser.add_argument('--meets', type=int, nargs='+',
+                        help="the meets to recalculate (default: all found)")
+    args = parser.parse_args(argv)
+
+    results = calculate_batch_stats(args.years, args.meets)
+    for path in write_batch_stats(results):
+        print(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,288 @@
+""" Benchmarks for the MCML Stats data functions.
+
+Generates seeded, made up leagues of increasing size with test_data_generator
+and times each data function on them. Every case runs in a fresh process on
+its own copy of the league so that the peak memory (RSS) it reports belongs to
+that case alone. Results are written as JSON so runs from different versions
+can be compared:
+
+    python benchmark.py --sizes 100 10000 1000000 --meets 10 --output new.json
+    python benchmark.py --compare old.json new.json
+
+The scoring_formulas and hand_written_ratings cases do the same rating math,
+by the compiled scoring rules and written out in NumPy, to show the one is
+no slower than the other.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+
+YEAR = 2021
+DEFAULT_SIZES = [100, 1_000, 10_000, 100_000]
+
+
+def time_calculate_stats(meets: int) -> tuple[float, int]:
+    import data_functions
+
+    start = time.perf_counter()
+    student_data, _ = data_functions.calculate_stats(f'./{YEAR}/Meet 1.csv')
+    return time.perf_counter() - start, len(student_data)
+
+
+def time_create_meet_file(meets: int) -> tuple[float, int]:
+    import data_functions
+
+    categories = [f'Category {number}' for number in range(1, 7)]
+    start = time.perf_counter()
+    data_functions.create_meet_file(YEAR, meets + 1, categories)
+    seconds = time.perf_counter() - start
+    return seconds, _count_rows(f'./{YEAR}/Meet {meets + 1}.csv')
+
+
+def time_setup_season(meets: int) -> tuple[float, int]:
+    """ Times rolling the roster over to the next year and creating a whole
+    season of meet files for it. """
+    import data_functions
+
+    categories = {meet: [f'Category {number}' for number in range(1, 7)]
+                  for meet in range(1, 11)}
+    start = time.perf_counter()
+    paths = data_functions.setup_season(YEAR + 1, categories)
+    seconds = time.perf_counter() - start
+    return seconds, sum(map(_count_rows, paths))
+
+
+def time_update_grades(meets: int) -> tuple[float, int]:
+    import data_functions
+    import pandas as pd
+
+    roster = pd.read_csv(f'./{YEAR}/roster.csv')
+    start = time.perf_counter()
+    data_functions.update_grades(roster)
+    return time.perf_counter() - start, len(roster)
+
+
+def time_update_annual_ratings(meets: int) -> tuple[float, int]:
+    """ Times keeping the cumulative ratings up to date over a whole season.
+    The stats themselves are calculated beforehand and aren't timed. """
+    import data_functions
+
+    season = [data_functions.calculate_stats(f'./{YEAR}/Meet {meet}.csv')[0]
+              for meet in range(1, meets + 1)]
+    start = time.perf_counter()
+    for meet, student_data in enumerate(season, start=1):
+        data_functions.update_annual_ratings(student_data, YEAR, meet)
+    return time.perf_counter() - start, sum(map(len, season))
+
+
+def time_create_reports(meets: int) -> tuple[float, int]:
+    """ Times the whole pipeline for every meet of a season. """
+    import data_functions
+
+    start = time.perf_counter()
+    for meet in range(1, meets + 1):
+        data_functions.create_reports(YEAR, meet)
+    seconds = time.perf_counter() - start
+    rows = sum(_count_rows(f'./{YEAR}/Meet {meet}.csv')
+               for meet in range(1, meets + 1))
+    return seconds, rows
+
+
+def _meet_scores(meets: int) -> list:
+    import data_functions
+
+    scores = []
+    for meet in range(1, meets + 1):
+        meet_data = data_functions.read_data_file(f'./{YEAR}/Meet {meet}.csv',
+                                                  has_scores=True)
+        scores.append(data_functions.score_matrix(
+            meet_data, data_functions.score_columns(meet_data.keys())))
+    return scores
+
+
+def time_scoring_formulas(meets: int) -> tuple[float, int]:
+    """ Times rating every meet's scores with the compiled scoring formulas
+    (see scoring.py). Compare with hand_written_ratings. """
+    import data_functions
+    import numpy as np
+
+    season = _meet_scores(meets)
+    start = time.perf_counter()
+    for scores in season:
+        meet_index = np.zeros(len(scores), dtype=np.intp)
+        counts, totals = data_functions.category_aggregates(scores,
+                                                            meet_index, 1)
+        ratings = data_functions.category_ratings(counts, totals)
+        data_functions.student_ratings(scores, ratings[meet_index])
+    return time.perf_counter() - start, sum(map(len, season))
+
+
+def time_hand_written_ratings(meets: int) -> tuple[float, int]:
+    """ Times the same work as time_scoring_formulas with the MCML's rules
+    written out in NumPy, as they were before scoring.py. """
+    import data_functions
+    import numpy as np
+
+    season = _meet_scores(meets)
+    start = time.perf_counter()
+    for scores in season:
+        meet_index = np.zeros(len(scores), dtype=np.intp)
+        counts, totals = data_functions.category_aggregates(scores,
+                                                            meet_index, 1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratings = (totals / counts * 5)[meet_index]
+            played = ~np.isnan(scores)
+            total = np.where(played, scores, 0).sum(axis=1)
+            rating_sum = np.where(played, ratings, 0).sum(axis=1)
+            rating_sum[np.isnan(ratings).any(axis=1)] = np.nan
+            rating_a = total / rating_sum
+            relative = scores / ratings
+            rating_b = np.where(np.isnan(relative), 0, relative).sum(axis=1) \
+                / 3
+            (rating_a + rating_b) / 2
+    return time.perf_counter() - start, sum(map(len, season))
+
+
+CASES = {
+    'calculate_stats': time_calculate_stats,
+    'create_meet_file': time_create_meet_file,
+    'setup_season': time_setup_season,
+    'update_grades': time_update_grades,
+    'update_annual_ratings': time_update_annual_ratings,
+    'create_reports': time_create_reports,
+    'scoring_formulas': time_scoring_formulas,
+    'hand_written_ratings': time_hand_written_ratings,
+}
+
+
+def _count_rows(path: str) -> int:
+    with open(path, 'rb') as infile:
+        return sum(1 for _ in infile) - 1
+
+
+def run_case(case: str, league: str, meets: int) -> dict:
+    """ Runs in a fresh process: copies the league somewhere private, runs the
+    case in it and reports how it went. """
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from instrumentation import process_peak_rss_mb
+
+    with tempfile.TemporaryDirectory() as workspace:
+        shutil.copytree(league, os.path.join(workspace, str(YEAR)))
+        os.chdir(workspace)
+        seconds, rows = CASES[case](meets)
+        os.chdir(os.path.dirname(league))
+
+    return {'seconds': seconds, 'rows': rows,
+            'peak_rss_mb': process_peak_rss_mb()}
+
+
+def run_benchmarks(sizes: list[int], meets: int, cases: list[str],
+                   seed: int, repeat: int) -> dict:
+    import test_data_generator
+
+    results = []
+    spawn = get_context('spawn')
+    with tempfile.TemporaryDirectory() as leagues:
+        for students in sizes:
+            league = os.path.join(leagues, str(students), str(YEAR))
+            test_data_generator.generate_league(league, students, meets,
+                                                seed=seed)
+            for case in cases:
+                for run in range(repeat):
+                    with ProcessPoolExecutor(1, mp_context=spawn) as pool:
+                        result = pool.submit(run_case, case, league,
+                                             meets).result()
+                    result.update(case=case, students=students, meets=meets,
+                                  run=run)
+                    results.append(result)
+                    print(f"{case:<22} {students:>9,} students "
+                          f"{result['seconds']:9.3f} s "
+                          f"{result['peak_rss_mb'] or 0:9.1f} MB",
+                          file=sys.stderr)
+
+    return {'environment': environment(), 'seed': seed, 'results': results}
+
+
+def environment() -> dict:
+    import numpy
+    import pandas
+
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'pandas': pandas.__version__,
+        'numpy': numpy.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def best_times(results: dict) -> dict[tuple[str, int], float]:
+    best = {}
+    for result in results['results']:
+        key = (result['case'], result['students'])
+        best[key] = min(best.get(key, float('inf')), result['seconds'])
+    return best
+
+
+def compare(old_path: str, new_path: str) -> None:
+    """ Prints the best time of each case in two result files side by side. """
+    with open(old_path) as old_file, open(new_path) as new_file:
+        old = best_times(json.load(old_file))
+        new = best_times(json.load(new_file))
+
+    print(f"{'case':<22} {'students':>9} {'old s':>9} {'new s':>9} "
+          f"{'speedup':>8}")
+    for key in sorted(old.keys() & new.keys()):
+        print(f"{key[0]:<22} {key[1]:>9,} {old[key]:9.3f} {new[key]:9.3f} "
+              f"{old[key] / new[key]:7.2f}x")
+
+
+def main(argv: list[str] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Time the MCML Stats data functions on made up leagues.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help="numbers of students (default: %(default)s)")
+    parser.add_argument('--meets', type=int, default=5,
+                        help="meets in each season (default: %(default)s)")
+    parser.add_argument('--cases', nargs='+', choices=list(CASES),
+                        default=list(CASES))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--output', help="JSON file (default: stdout)")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help="compare two result files instead of running")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = run_benchmarks(args.sizes, args.meets, args.cases, args.seed,
+                             args.repeat)
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump(results, outfile, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+
+
+if __name__ == '__main__':
+    main()
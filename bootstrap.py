@@ -0,0 +1,197 @@
+""" Bootstrap confidence intervals for the category ratings and the students'
+Final Individual Ratings.
+
+Each resample draws the meet's students with replacement. Students with the
+same scores are interchangeable, and since scores are small whole numbers a
+meet has at most a few thousand distinct rows of scores however many students
+it has. So a resample is drawn as how many times each distinct row was drawn:
+from batches of random row indices for a small meet, or straight from the
+multinomial distribution for a large one. Either way the category counts and
+totals of a batch of resamples are matrix products of those counts with the
+distinct rows' scores.
+
+Every student with the same scores has the same interval, so the Final
+Individual Ratings under every resample are found for each distinct row, a
+chunk of rows at a time to bound memory, again as matrix products.
+
+Batches run in parallel threads (NumPy releases the GIL for the heavy
+lifting), each with its own random stream spawned from one seed, so the
+results are the same whatever the number of threads. """
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import scoring
+from data_functions import FINAL_RATING, KEY, RATINGS, STUDENT_ID, \
+    category_ratings, score_columns, score_matrix
+
+
+RESAMPLES = 10_000
+CONFIDENCE = 0.95
+SEED = 0
+
+LOWER_BOUND = "Lower Bound"
+UPPER_BOUND = "Upper Bound"
+
+# Resamples drawn at once
+BATCH = 64
+
+# Distinct rows of scores whose final ratings are found at once (each takes
+# RESAMPLES x 8 bytes per array)
+ROW_CHUNK = 256
+
+# Drawing an index for every student costs about an eighth as much as
+# drawing a count for every distinct row, so indices are drawn unless there
+# are more than this many students per distinct row.
+INDEX_DRAW_LIMIT = 8
+
+
+def distinct_rows(scores: np.ndarray) \
+        -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """ Returns the distinct rows of scores (NaN for categories not played),
+    the number of the distinct row each student has and how many students
+    have each distinct row. Each column is reduced to integer codes which
+    are folded into one key per row, which is much faster than sorting the
+    rows. """
+    key = np.zeros(len(scores), dtype=np.int64)
+    key_size = 1
+    for column in scores.T:
+        # NaN gets the code -1
+        codes, uniques = pd.factorize(column)
+        size = len(uniques) + 1
+
+        # Renumber the keys first if folding in the codes could overflow
+        if key_size * size >= 2**62:
+            key, uniques = pd.factorize(key)
+            key_size = len(uniques)
+        key = key * size + codes + 1
+        key_size *= size
+
+    inverse, uniques = pd.factorize(key)
+    first = np.empty(len(uniques), dtype=np.intp)
+    first[inverse[::-1]] = np.arange(len(scores))[::-1]
+    return scores[first], inverse, np.bincount(inverse,
+                                               minlength=len(uniques))
+
+
+def resample_category_ratings(scores: np.ndarray, resamples: int = RESAMPLES,
+                              seed: int = SEED, workers: int = None) \
+        -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """ Draws bootstrap resamples of the students whose scores are given and
+    returns a resamples x category matrix of their category ratings, along
+    with the distinct rows and the students' row numbers from
+    distinct_rows. """
+    rows, inverse, frequency = distinct_rows(scores)
+    students = len(scores)
+    played = (~np.isnan(rows)).astype(float)
+    points = np.where(np.isnan(rows), 0, rows)
+    use_indices = students <= INDEX_DRAW_LIMIT * len(rows)
+
+    batches = -(-resamples // BATCH)
+    streams = np.random.SeedSequence(seed).spawn(batches)
+
+    def run(batch: int) -> np.ndarray:
+        rng = np.random.default_rng(streams[batch])
+        size = min(BATCH, resamples - batch * BATCH)
+        if use_indices:
+            drawn = inverse[rng.integers(0, students, (size, students))]
+            drawn += np.arange(size)[:, np.newaxis] * len(rows)
+            counts = np.bincount(drawn.ravel(), minlength=size * len(rows)) \
+                .reshape(size, len(rows))
+        else:
+            counts = rng.multinomial(students, frequency / students, size)
+        counts = counts.astype(float)
+        return category_ratings(counts @ played, counts @ points)
+
+    if not students:
+        return np.full((resamples, scores.shape[1]), np.nan), rows, inverse
+    with ThreadPoolExecutor(workers or os.cpu_count()) as executor:
+        ratings = np.concatenate(list(executor.map(run, range(batches))))
+    return ratings, rows, inverse
+
+
+def final_rating_quantiles(rows: np.ndarray, ratings: np.ndarray,
+                           quantiles: list[float],
+                           workers: int = None) -> np.ndarray:
+    """ Returns a rows x quantiles matrix of the given quantiles of the Final
+    Individual Rating of a student with each row of scores over the
+    resampled category ratings. Resamples in which a category has no rating
+    are left out, since every Final Individual Rating is NaN in them. """
+    ratings = ratings[~np.isnan(ratings).any(axis=1)]
+    if not len(ratings):
+        return np.full((len(rows), len(quantiles)), np.nan)
+
+    rules = scoring.active()
+    played = (~np.isnan(rows)).astype(float)
+    points = np.where(np.isnan(rows), 0, rows)
+    total = points.sum(axis=1)
+    played_count = played.sum(axis=1)
+    with np.errstate(divide='ignore'):
+        # A category nobody scored in adds nothing to Rating B
+        inverse = np.where(ratings == 0, 0, 1 / ratings)
+
+    def run(start: int) -> np.ndarray:
+        chunk = slice(start, start + ROW_CHUNK)
+        inputs = {'total': total[chunk, np.newaxis],
+                  'rating_sum': played[chunk] @ ratings.T,
+                  'played': played_count[chunk, np.newaxis]}
+        if 'relative_sum' in rules.inputs:
+            inputs['relative_sum'] = points[chunk] @ inverse.T
+        results = rules.student_ratings(inputs)
+        final = results[rules.student_formulas[-1].name]
+        return np.quantile(final, quantiles, axis=1).T
+
+    with ThreadPoolExecutor(workers or os.cpu_count()) as executor:
+        chunks = list(executor.map(run, range(0, len(rows), ROW_CHUNK)))
+    return np.concatenate(chunks) if chunks else \
+        np.empty((0, len(quantiles)))
+
+
+def confidence_intervals(scores: np.ndarray, resamples: int = RESAMPLES,
+                         confidence: float = CONFIDENCE, seed: int = SEED,
+                         workers: int = None) \
+        -> tuple[np.ndarray, np.ndarray]:
+    """ Returns two arrays holding the lower and upper bounds of the
+    confidence intervals, first, a category x 2 array for the category
+    ratings, second, a students x 2 array for the Final Individual Ratings.
+    The same scores and seed always give the same intervals. """
+    tail = (1 - confidence) / 2
+    quantiles = [tail, 1 - tail]
+
+    ratings, rows, inverse = resample_category_ratings(scores, resamples,
+                                                       seed, workers)
+    category = np.full((scores.shape[1], 2), np.nan)
+    for i, column in enumerate(ratings.T):
+        # A category nobody played in any resample has no interval
+        rated = column[~np.isnan(column)]
+        if len(rated):
+            category[i] = np.quantile(rated, quantiles)
+
+    final = final_rating_quantiles(rows, ratings, quantiles, workers)
+    return category, final[inverse]
+
+
+def interval_tables(student_data: pd.DataFrame, category_data: pd.DataFrame,
+                    resamples: int = RESAMPLES,
+                    confidence: float = CONFIDENCE, seed: int = SEED) \
+        -> tuple[pd.DataFrame, pd.DataFrame]:
+    """ Takes the two DataFrames from calculate_stats and returns the
+    confidence intervals of their ratings as two DataFrames, first, each
+    student with their Final Individual Rating and its bounds, second, each
+    category with its rating and its bounds. """
+    categories = score_columns(student_data.keys())
+    category, final = confidence_intervals(
+        score_matrix(student_data, categories), resamples, confidence, seed)
+
+    students = student_data[[column for column in KEY + [STUDENT_ID]
+                             if column in student_data]
+                            + [FINAL_RATING]].copy()
+    students[LOWER_BOUND] = final[:, 0]
+    students[UPPER_BOUND] = final[:, 1]
+
+    categories = category_data[['Category', RATINGS]].copy()
+    categories[LOWER_BOUND] = category[:, 0]
+    categories[UPPER_BOUND] = category[:, 1]
+    return students, categories
@@ -1,6 +1,16 @@
+import hashlib
+import importlib.util
+import numpy as np
 import pandas as pd
 import os
+import re
+import warnings
+from concurrent.futures import ThreadPoolExecutor
 from pandas.core.frame import DataFrame
+from typing import Callable
+
+import scoring
+from instrumentation import STAGE_TIMINGS, Instrumentation
 
 
 # Define string constants
@@ -8,6 +18,7 @@ LAST_NAME = "Last Name"
 FIRST_NAME = "First Name"
 GRADE = "Grade"
 SCHOOL = "School"
+STUDENT_ID = "Student ID"
 TOTAL = "Total Points"
 COUNT = "# of Students"
 RATINGS = "Category Rating"
@@ -15,63 +26,348 @@ RAT_SUM = "Rating Sum"
 RAT_A = "Rating A"
 RAT_B = "Rating B"
 FINAL_RATING = "Final Individual Rating"
+AVERAGE = "Average Rating"
+DROP_ONE = "Average Dropping Lowest Meet"
+DROP_TWO = "Average Dropping 2 Lowest Meets"
 
 KEY = [LAST_NAME, FIRST_NAME, GRADE, SCHOOL]
 
+# Define the stages of create_reports
+LOADING = "Loading scores"
+VALIDATING = "Validating scores"
+CALCULATING = "Calculating stats"
+INTERVALS = "Estimating confidence intervals"
+RANKING = "Building leaderboards"
+WRITING = "Writing data files"
+CUMULATIVE = "Updating cumulative ratings"
+REPORTING = "Generating reports"
+ROSTER = "Backing up roster"
+REPORT_STAGES = [LOADING, VALIDATING, CALCULATING, RANKING, WRITING,
+                 CUMULATIVE, REPORTING, ROSTER]
+
+# Compact column types for reading the program's csv files
+COMPACT_TYPES = {
+    LAST_NAME: 'category',
+    FIRST_NAME: 'category',
+    GRADE: 'int8',
+    SCHOOL: 'category',
+    STUDENT_ID: 'Int64',
+}
+SCORE_TYPE = 'Int8'
+
+# Use the faster pyarrow csv parser when it's installed
+CSV_ENGINE = 'pyarrow' if importlib.util.find_spec('pyarrow') else 'c'
+
 
 def calculate_stats(filename: str) -> tuple[pd.DataFrame, pd.DataFrame]:
     """ Reads in the csv file provided and returns two DataFrames, first, one
     corresponding to the provided file with an additional column representing
     the students' ratings for the given meet, second, one with the category
-    stats. """
+    stats.
 
-    # Define the columns used for scoring
-    START_COL = 4
-    END_COL = 9
+    Raises validation.InvalidMeetData (a ValueError) if the file has problems
+    that would throw off the ratings. """
+    import validation
 
     # Load the data
-    meet_data = pd.read_csv(filename)
+    meet_data = read_data_file(filename, has_scores=True)
+    validation.check(meet_data, filename)
+
+    return meet_stats(meet_data)
+
+
+def read_data_file(path: str, has_scores: bool = False) -> pd.DataFrame:
+    """ Reads a meet, roster or cumulative ratings csv file with compact column
+    types: the names and School become categoricals and Grade an int8. When
+    the pyarrow parser is installed it's used, and if the file has_scores the
+    score columns become nullable Int8s too. (pandas' own parser is much
+    slower at filling nullable columns, so it leaves the scores as floats.)
+
+    A file that doesn't fit those types (a blank grade or a score that isn't
+    a whole number, for example) is read with pandas' default types instead,
+    so the values are always the same as pd.read_csv would give. """
+    columns = pd.read_csv(path, nrows=0).keys()
+    dtypes = {column: dtype for column, dtype in COMPACT_TYPES.items()
+              if column in columns}
+    if has_scores and CSV_ENGINE == 'pyarrow':
+        dtypes.update({column: SCORE_TYPE
+                       for column in score_columns(columns)})
+
+    try:
+        # pandas warns about a blank grade before giving up on int8
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            return pd.read_csv(path, dtype=dtypes, engine=CSV_ENGINE)
+    except (ValueError, TypeError, OverflowError):
+        return pd.read_csv(path)
+
+
+def score_columns(columns: pd.Index) -> list[str]:
+    """ Returns the names of the score columns of a meet file with the given
+    columns. They come right after the student's details, which include
+    STUDENT_ID in files written since the student registry was added. How
+    many of each there are is set by the scoring rules (see scoring.py). """
+    rules = scoring.active()
+    start = rules.details_columns + \
+        (STUDENT_ID in columns[:rules.details_columns + 1])
+    return list(columns[start:start + rules.score_columns])
+
+
+def score_matrix(meet_data: pd.DataFrame, categories: list[str]) -> np.ndarray:
+    """ Returns the scores in the given columns as a float matrix with NaN for
+    the categories each student didn't play. """
+    return meet_data[categories].to_numpy(dtype=float, na_value=np.nan)
+
+
+def meet_stats(meet_data: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """ Does the work of calculate_stats on a meet's data that has already been
+    loaded into a DataFrame. """
+
     columns_to_save = meet_data.keys()
 
     # Get the categories and rate them
-    categories = list(columns_to_save[START_COL:END_COL+1])
+    categories = score_columns(columns_to_save)
+    scores = score_matrix(meet_data, categories)
+    meet_index = np.zeros(len(scores), dtype=np.intp)
+    counts, totals = category_aggregates(scores, meet_index, 1)
+    ratings = category_ratings(counts, totals)
+
     category_dict = {}
     category_dict["Category"] = categories
-    category_dict[COUNT] = [meet_data[category].count()
-                            for category in categories]
-    category_dict[TOTAL] = [meet_data[category].sum()
-                            for category in categories]
+    category_dict[COUNT] = counts[0]
+    category_dict[TOTAL] = totals[0]
+    category_dict[RATINGS] = ratings[0]
 
-    category_dict[RATINGS] = \
-        [meet_data[category].sum()/meet_data[category].count() * 5
-            for category in categories]
+    # Add the rating to the columns I want to return
+    student_data = meet_data[columns_to_save].copy()
+    student_data[FINAL_RATING] = student_ratings(scores, ratings[meet_index])
 
-    # Get the sum of each student's points
-    meet_data[TOTAL] = meet_data[categories].sum(axis=1)
+    restore_score_types(student_data, categories, scores)
 
-    # Map played categories to 1 and unplayed to 0
-    categories_played = meet_data[categories].notnull().astype(int)
+    # Name return data in a readable way
+    category_data = pd.DataFrame.from_dict(category_dict)
 
-    # Create a Series to use for dot-product to find the sum of 3 category
-    # ratings for each student amd store in original DataFrame
-    rating_series = pd.Series(category_dict[RATINGS], index=categories)
-    rating_sum = categories_played.dot(rating_series)
-    meet_data[RAT_SUM] = rating_sum
+    return student_data, category_data
 
-    # Calculate Rating A, Rating B, and Final Rating
-    meet_data[RAT_A] = meet_data[TOTAL] / meet_data[RAT_SUM]
-    meet_data[RAT_B] = (meet_data[categories] / rating_series).sum(axis=1) / 3
-    meet_data[FINAL_RATING] = (meet_data[RAT_A] + meet_data[RAT_B]) / 2
 
-    # Add the rating to the columns I want to return
-    final_rating_index = pd.Index([FINAL_RATING])
-    columns_to_save = columns_to_save.append(final_rating_index)
+def restore_score_types(meet_data: pd.DataFrame, categories: list[str],
+                        scores: np.ndarray) -> None:
+    """ Puts compactly loaded scores back to the types pd.read_csv would give
+    them, so the files written from meet_data are unchanged. (The one
+    exception is a column with no blanks whose scores were typed like '4.0',
+    which is now written as 4.) """
+    for i, category in enumerate(categories):
+        if isinstance(meet_data[category].dtype, pd.Int8Dtype):
+            played = scores[:, i]
+            meet_data[category] = played if np.isnan(played).any() \
+                else played.astype(np.int64)
+
+
+def stream_stats(filename: str, ratings_path: str, category_path: str,
+                 chunksize: int = 100_000) -> pd.DataFrame:
+    """ Does the same job as calculate_stats followed by writing its two
+    DataFrames to ratings_path and category_path, but never holds more than
+    chunksize rows of the scores file in memory.
+
+    The file is read twice. The first pass validates it (see
+    validation.ChunkedValidation) and collects the category counts and
+    totals (and the column types the in-memory path would give), the
+    second computes each chunk's ratings and appends them to ratings_path. The
+    files written are byte-for-byte the same as the in-memory path's. Returns
+    the category stats.
+
+    A file with problems raises validation.InvalidMeetData, as
+    calculate_stats does, before anything is written. """
+    import validation
+
+    columns = pd.read_csv(filename, nrows=0).keys()
+    categories = score_columns(columns)
+
+    # Pass 1: validation, category aggregates and whole-file column types
+    validator = validation.ChunkedValidation(columns)
+    valid = True
+    dtypes = {}
+    counts = np.zeros((1, len(categories)), dtype=np.int64)
+    totals = np.zeros((1, len(categories)))
+    blanks = np.zeros(len(categories), dtype=bool)
+    compact = CSV_ENGINE == 'pyarrow'
+    for chunk in pd.read_csv(filename, chunksize=chunksize):
+        # Once a problem is found the rest is only checked, not rated
+        valid = validator.add(chunk) and valid
+        if not valid:
+            continue
+
+        for column in columns:
+            dtypes[column] = _combine_dtypes(dtypes.get(column),
+                                             chunk[column].dtype)
+
+        scores = score_matrix(chunk, categories)
+        meet_index = np.zeros(len(scores), dtype=np.intp)
+        chunk_counts, chunk_totals = category_aggregates(scores, meet_index, 1)
+        counts += chunk_counts
+        totals += chunk_totals
+
+        # Track whether read_data_file could load the whole file compactly
+        blanks |= np.isnan(scores).any(axis=0)
+        compact = compact and _fits_compact_types(chunk, scores)
+    validator.check(filename)
+
+    ratings = category_ratings(counts, totals)
+    category_data = pd.DataFrame.from_dict({
+        "Category": categories,
+        COUNT: counts[0],
+        TOTAL: totals[0],
+        RATINGS: ratings[0],
+    })
+    category_data.to_csv(category_path, index=False)
 
-    # Name return data in a readable way
-    student_data = meet_data[columns_to_save]
-    category_data = pd.DataFrame.from_dict(category_dict)
+    # Pass 2: student ratings, one chunk at a time
+    header = True
+    whole_numbers = [category for category, blank in zip(categories, blanks)
+                     if compact and not blank]
+    for chunk in pd.read_csv(filename, chunksize=chunksize, dtype=dtypes):
+        scores = score_matrix(chunk, categories)
+        chunk[whole_numbers] = chunk[whole_numbers].astype(np.int64)
+        chunk[FINAL_RATING] = student_ratings(
+            scores, np.broadcast_to(ratings[0], scores.shape))
+        chunk.to_csv(ratings_path, index=False, header=header,
+                     mode='w' if header else 'a')
+        header = False
+
+    # An empty scores file still gets a header
+    if header:
+        empty = pd.DataFrame(columns=columns.append(pd.Index([FINAL_RATING])))
+        empty.to_csv(ratings_path, index=False)
+
+    return category_data
+
+
+def stream_meet(year: int, meet: int, chunksize: int = 100_000,
+                rerun: bool = False) -> list[str]:
+    """ Writes the meet's 'with Student Ratings' and 'Category Ratings' files
+    with stream_stats, for a scores file too big to analyze in memory. The
+    leaderboards, cumulative ratings, reports and roster each need the whole
+    meet at once, so they aren't made, and students are written with
+    whatever Student IDs the scores file gives them.
+
+    Raises FileExistsError if the meet already has a ratings file, unless
+    rerun is True. Returns the paths written. """
+    scores_path = f'./{year}/Meet {meet}.csv'
+    if not os.path.exists(scores_path):
+        raise FileNotFoundError(
+            f"Meet Data Not Found\n\nThere is no file named 'Meet {meet}.csv' "
+            f"in the '{year}' folder.")
 
-    return student_data, category_data
+    subdirectory = f'./{year}/Meet {meet}'
+    ratings_path = f'{subdirectory}/Meet {meet} with Student Ratings.csv'
+    category_path = f'{subdirectory}/Meet {meet} Category Ratings.csv'
+    if os.path.exists(ratings_path) and not rerun:
+        raise FileExistsError(
+            f"Existing Results Error\n\nMeet {meet} of {year} has already "
+            "been analyzed. Re-run the meet to replace its ratings.")
+
+    os.makedirs(subdirectory, exist_ok=True)
+    stream_stats(scores_path, ratings_path, category_path, chunksize)
+    return [ratings_path, category_path]
+
+
+def _fits_compact_types(chunk: pd.DataFrame, scores: np.ndarray) -> bool:
+    """ Returns whether read_data_file's compact types fit this chunk of a
+    scores file, i.e. the grades and scores are all whole numbers that fit in
+    an int8. """
+    int8 = np.iinfo(np.int8)
+    played = scores[~np.isnan(scores)]
+    if not (np.all(played == np.round(played)) and
+            np.all((played >= int8.min) & (played <= int8.max))):
+        return False
+    if GRADE not in chunk:
+        return True
+
+    grades = chunk[GRADE]
+    return pd.api.types.is_integer_dtype(grades) and \
+        grades.between(int8.min, int8.max).all()
+
+
+def _combine_dtypes(first, second):
+    """ Returns the type pandas would give a column whose chunks were read as
+    the two given types. """
+    if first is None or first == second:
+        return second
+    if pd.api.types.is_numeric_dtype(first) and \
+            pd.api.types.is_numeric_dtype(second):
+        return np.dtype(float)
+    return np.dtype(object)
+
+
+def category_aggregates(scores: np.ndarray, meet_index: np.ndarray,
+                        meet_count: int) -> tuple[np.ndarray, np.ndarray]:
+    """ Takes a matrix of scores (one row per student, one column per category,
+    NaN for categories not played) along with the meet each row belongs to and
+    returns two meet_count x category matrices, first, the number of students
+    who played each category, second, the total points scored in it.
+
+    All meets are reduced together with a single bincount, so any number of
+    meets can be stacked into one matrix. """
+    category_count = scores.shape[1]
+    played = ~np.isnan(scores)
+
+    # Give every (meet, category) pair its own bin
+    bins = (meet_index[:, np.newaxis] * category_count
+            + np.arange(category_count)).ravel()
+    size = meet_count * category_count
+    shape = (meet_count, category_count)
+
+    counts = np.bincount(bins, weights=played.ravel(), minlength=size)
+    totals = np.bincount(bins, weights=np.where(played, scores, 0).ravel(),
+                         minlength=size)
+    return counts.astype(np.int64).reshape(shape), totals.reshape(shape)
+
+
+def category_ratings(counts: np.ndarray, totals: np.ndarray) -> np.ndarray:
+    """ Returns the category ratings for the given counts and totals, by the
+    scoring rules' category formula. A category that nobody played has no
+    rating (NaN) by the default rules. """
+    return scoring.active().category_ratings(counts, totals)
+
+
+def student_ratings(scores: np.ndarray, ratings: np.ndarray,
+                    details: bool = False):
+    """ Returns each student's Final Individual Rating given their scores and
+    the ratings of the categories in each of their rows, by the scoring
+    rules' student formulas.
+
+    If details is True, a dictionary is returned instead holding the arrays
+    for TOTAL, RAT_SUM and FINAL_RATING along with the result of each of the
+    other student formulas by name (RAT_A and RAT_B by the default rules).
+    """
+    rules = scoring.active()
+    played = ~np.isnan(scores)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Get the sum of each student's points
+        total = np.where(played, scores, 0).sum(axis=1)
+
+        # Sum the ratings of the categories each student played
+        rating_sum = np.where(played, ratings, 0).sum(axis=1)
+        rating_sum[np.isnan(ratings).any(axis=1)] = np.nan
+
+        inputs = {'total': total, 'rating_sum': rating_sum}
+        if 'relative_sum' in rules.inputs:
+            relative = scores / ratings
+            inputs['relative_sum'] = \
+                np.where(np.isnan(relative), 0, relative).sum(axis=1)
+        if 'played' in rules.inputs:
+            inputs['played'] = played.sum(axis=1)
+
+    results = rules.student_ratings(inputs)
+    final = results.pop(rules.student_formulas[-1].name)
+    if details:
+        names = {'rating_a': RAT_A, 'rating_b': RAT_B}
+        return {TOTAL: total, RAT_SUM: rating_sum,
+                **{names.get(name, name): result
+                   for name, result in results.items()},
+                FINAL_RATING: final}
+    return final
 
 
 def create_meet_file(year: int, meet: int, categories: list[str]) -> None:
@@ -90,23 +386,83 @@ def create_meet_file(year: int, meet: int, categories: list[str]) -> None:
     The existing roster is a requirement. If there isn't one in the current
     year, this function will look to the previous year and update all the
     students' grades, creating a new roster file for this year. If the previous
-    year also doesn't have a roster, a FileNotFoundError is raised. """
-    directory = str(year)
-    filename = f'Meet {meet}.csv'
+    year also doesn't have a roster, a FileNotFoundError is raised.
 
-    # Check for directory and create if needed.
-    if not os.path.exists(directory):
-        os.mkdir(directory)
+    Students on the roster without a Student ID are given one from the
+    student registry (see student_registry.py). """
+    setup_season(year, {meet: categories})
+
+
+def setup_season(year: int, categories: dict[int, list[str]],
+                 workers: int = None) -> list[str]:
+    """ Creates the meet file for every meet in categories, which maps each
+    meet to its categories as in 'Default Categories.csv', the same way
+    create_meet_file creates one. The roster is loaded, and if need be rolled
+    over from the previous year, only once. Each distinct number of
+    categories has the roster's rows formatted once, and the files are written
+    in parallel threads.
 
-    # Check for file to prevent it being overwritten.
+    If any of the meet files already exists, FileExistsError is raised before
+    anything is written. Returns the paths of the files created. """
+    directory = str(year)
+    paths = {meet: f'./{directory}/Meet {meet}.csv' for meet in categories}
+
+    # Check for files to prevent them being overwritten.
     # Provide error message in this case.
-    relative_file_path = f'./{directory}/{filename}'
-    if os.path.exists(relative_file_path):
+    existing = [f'Meet {meet}.csv' for meet, path in paths.items()
+                if os.path.exists(path)]
+    if len(existing) == 1:
         raise FileExistsError(
             "A file for this meet already exists.\n\nIf you wish to replace "
             "it, you must delete the existing file manually before creating "
             "the new one with this program.\n\nYou can find the existing file "
-            f"in the {directory} directory. It will be titled '{filename}'.")
+            f"in the {directory} directory. It will be titled "
+            f"'{existing[0]}'.")
+    if existing:
+        raise FileExistsError(
+            "Files for some of these meets already exist.\n\nIf you wish to "
+            "replace them, you must delete the existing files manually before "
+            "creating the new ones with this program.\n\nThe existing files "
+            f"in the {directory} directory are " +
+            ", ".join(f"'{filename}'" for filename in existing) + ".")
+
+    # Check for directory and create if needed.
+    if not os.path.exists(directory):
+        os.mkdir(directory)
+
+    roster = load_roster(year)
+
+    # The rows are the same in every meet file apart from the blank score
+    # columns at the end of each line. Lines end with os.linesep, as the
+    # header's do.
+    header = roster.columns.to_list()
+    rows = {}
+    for meet_categories in categories.values():
+        blanks = len(meet_categories)
+        if blanks not in rows:
+            rows[blanks] = roster.to_csv(
+                index=False, header=False,
+                lineterminator=',' * blanks + os.linesep).encode('utf-8')
+
+    def write(meet: int) -> None:
+        columns = pd.DataFrame(columns=header + categories[meet])
+        with open(paths[meet], 'xb') as file:
+            file.write(columns.to_csv(index=False).encode('utf-8'))
+            file.write(rows[len(categories[meet])])
+
+    with ThreadPoolExecutor(workers) as executor:
+        list(executor.map(write, paths))
+    return list(paths.values())
+
+
+def load_roster(year: int) -> pd.DataFrame:
+    """ Returns the year's roster, with a Student ID for every student. If
+    the year doesn't have a roster yet, the previous year's roster has its
+    grades moved up and is saved as this year's. If neither year has one, a
+    FileNotFoundError is raised. """
+    import student_registry
+
+    directory = str(year)
 
     # Get the roster, provide error if one doesn't exist
     roster: DataFrame
@@ -115,12 +471,13 @@ def create_meet_file(year: int, meet: int, categories: list[str]) -> None:
     previous_roster_path = f'./{int(directory)-1}/{roster_filename}'
 
     if os.path.exists(current_roster_path):
-        roster = pd.read_csv(current_roster_path)
+        roster = read_data_file(current_roster_path)
 
     # Otherwise get and update the previous year's roster
     elif os.path.exists(previous_roster_path):
-        roster = pd.read_csv(previous_roster_path)
+        roster = read_data_file(previous_roster_path)
         roster = update_grades(roster)
+        roster = student_registry.with_ids(roster, year)
         roster.to_csv(f'./{directory}/{roster_filename}', index=False)
 
     # If neither exist, they need to create a roster first.
@@ -133,16 +490,111 @@ def create_meet_file(year: int, meet: int, categories: list[str]) -> None:
             "found in the file 'README.md' which can be opened with any text "
             "editor or online at https://github.com/pbarringer3/MCMLStats.")
 
-    # Add columns for the categories
-    roster[categories] = None
+    # Every student in the meet file carries their Student ID
+    if STUDENT_ID not in roster or roster[STUDENT_ID].isna().any():
+        roster = student_registry.with_ids(roster, year)
+    return roster
+
+
+def report_stages(intervals: bool = False) -> list[str]:
+    """ Returns the stages create_reports goes through. """
+    if not intervals:
+        return REPORT_STAGES
+    return REPORT_STAGES[:REPORT_STAGES.index(CALCULATING) + 1] + \
+        [INTERVALS] + REPORT_STAGES[REPORT_STAGES.index(CALCULATING) + 1:]
+
+
+def write_if_changed(path: str, content: bytes) -> bool:
+    """ Writes content to path unless the file there already holds exactly
+    the same bytes, going by their size and hash. The content is written to a
+    temporary file that then replaces the old one, so a run that's stopped
+    part way never leaves half a file. Returns whether the file was written.
+    """
+    if os.path.exists(path) and os.path.getsize(path) == len(content):
+        with open(path, 'rb') as file:
+            digest = hashlib.file_digest(file, 'blake2b').digest()
+        if digest == hashlib.blake2b(content).digest():
+            return False
 
-    # Write the desired contents to the file.
-    roster.to_csv(relative_file_path, index=False)
+    temporary_path = f'{path}.{os.getpid()}.tmp'
+    with open(temporary_path, 'wb') as file:
+        file.write(content)
+    os.replace(temporary_path, path)
+    return True
 
 
-def create_reports(year: int, meet: int) -> None:
+def write_csv_if_changed(data: pd.DataFrame, path: str) -> bool:
+    """ Writes data to the csv file at path with write_if_changed. """
+    import meet_outputs
+
+    return write_if_changed(path, meet_outputs.CsvText(data).csv())
+
+
+def create_reports(year: int, meet: int,
+                   progress: Callable[[str], None] = None,
+                   profile: bool = False, use_cache: bool = True,
+                   intervals: bool = False, rerun: bool = False,
+                   bundle: str = None,
+                   stats: tuple[pd.DataFrame, pd.DataFrame] = None) \
+        -> list[str]:
     """ This function triggers the analasys of the provided file and the
-    creation of all the files and reports needed for the given meet. """
+    creation of all the files and reports needed for the given meet.
+
+    If provided, progress is called with the name of each stage in
+    report_stages(intervals) as it begins. It may raise an exception to stop
+    the run; no files are written until the 'Writing data files' stage.
+
+    How long each stage took, along with the rows, bytes and memory it used,
+    is logged and saved to 'Meet N Stage Timings.json'. If profile is True,
+    the run is also captured with cProfile and tracemalloc (see
+    instrumentation.py).
+
+    Unless use_cache is False, the stats for a scores file that hasn't changed
+    since it was last analyzed are taken from the cache (see stats_cache.py).
+
+    A scores file with problems that would throw off the ratings raises
+    validation.InvalidMeetData (a ValueError) before anything is written.
+
+    If intervals is True, bootstrap confidence intervals of the category and
+    final ratings are also written to 'Meet N Category Rating Intervals.csv'
+    and 'Meet N Rating Intervals.csv' (see bootstrap.py). The meet's
+    leaderboards and team totals are always written to
+    'Meet N Leaderboards.csv' and 'Meet N Team Totals.csv' (see
+    leaderboards.py).
+
+    The data files are written together from one pass of formatting (see
+    meet_outputs.py). If bundle is 'xlsx' they're also written as the sheets
+    of 'Meet N Results.xlsx', or if it's 'parquet' as the Parquet files in
+    'Meet N Results.parquet.zip'. A bundle format whose package isn't
+    installed raises ValueError before anything is calculated.
+
+    If stats is given, it's used as the meet's student and category data
+    (as meet_stats returns them) and the scores file isn't read or checked;
+    batch_stats passes the stats it calculated for many meets at once.
+
+    Students in the scores file without a Student ID are given one from the
+    student registry, and every file written for the meet carries it.
+
+    A meet that has already been analyzed raises FileExistsError unless rerun
+    is True. A meet counts as analyzed once its stage timings, which are
+    written last, or its roster backup exist, so a run that was cancelled or
+    failed partway is simply run again and still backs up the roster. A rerun
+    recalculates everything but only rewrites the files whose contents
+    changed, and the cumulative files of the meets after it are brought up to
+    date too. The roster backup from the first run
+    is left alone, and roster.csv is only rewritten if no later meet has been
+    started. Interval files from an earlier run are only updated if intervals
+    is True again.
+
+    Returns the paths of the files written, other than the stage timings.
+    """
+    import leaderboards
+    import meet_outputs
+    import season_store
+    import stats_cache
+    import student_registry
+    import validation
+
     directory = str(year)
     filename = f'Meet {meet}.csv'
 
@@ -158,92 +610,240 @@ def create_reports(year: int, meet: int) -> None:
             "the file 'README.md' which can be opened with any text editor "
             "or online at https://github.com/pbarringer3/MCMLStats.")
 
-    # Create subdirectory for reports and data files.
+    # Check whether the meet was analyzed before
     subdirectory = f'./{directory}/Meet {meet}'
     prefix = f'{subdirectory}/Meet {meet}'
-    if not os.path.exists(subdirectory):
-        os.mkdir(subdirectory)
-    else:
+    backup_path = f'{prefix} Roster Backup.csv'
+    rerunning = os.path.exists(f'{prefix} {STAGE_TIMINGS}') or \
+        os.path.exists(backup_path)
+    if rerunning and not rerun:
         raise FileExistsError(
             "Existing Folder Error\n\nThis program will create a subfolder in "
             f"the {directory} folder called 'Meet {meet}' along with all of "
             "its contents. Please remove or rename the existing folder "
-            f"'Meet {meet}' in the {directory} folder.")
-
-    # Analyze file
-    student_data, category_data = calculate_stats(scores_path)
-
-    # Create csv file with student scores and ratings
-    ratings_path = f'{prefix} with Student Ratings.csv'
-    student_data.to_csv(ratings_path, index=False)
-
-    # Create csv file with category ratings
-    category_path = f'{prefix} Category Ratings.csv'
-    category_data.to_csv(category_path, index=False)
-
-    # Create csv file with just roster and ratings for the year
-    update_annual_ratings(student_data, year, meet)
-
-    # Generate all pdf reports
-    generate_reports()
-
-    # Create backup of old roster file if it exists
-    roster_path = f'./{directory}/roster.csv'
-    if os.path.exists(roster_path):
-        new_roster_path = f'{prefix} Roster Backup.csv'
-        os.rename(roster_path, new_roster_path)
-
-    # Create updated roster file based on this meet's students
-    student_data[KEY].to_csv(roster_path, index=False)
-
-
-def generate_reports():
-    pass
+            f"'Meet {meet}' in the {directory} folder, or re-run the meet to "
+            "update only the files that changed.")
+
+    if bundle:
+        meet_outputs.bundle_package(bundle)
+
+    written = []
+
+    with Instrumentation(progress, profile) as instruments:
+        # Analyze file
+        with instruments.stage(LOADING) as stage:
+            # Results for an unchanged file come straight from the cache
+            cached = stats
+            if cached is None and use_cache:
+                key = stats_cache.cache_key(scores_path)
+                cached = stats_cache.load(key)
+            if cached is None:
+                meet_data = read_data_file(scores_path, has_scores=True)
+                stage.rows = len(meet_data)
+            stage.read(scores_path)
+
+        # Only files that passed are cached, so cached results skip this
+        with instruments.stage(VALIDATING) as stage:
+            if cached is None:
+                validation.check(meet_data, scores_path)
+                stage.rows = len(meet_data)
+
+        with instruments.stage(CALCULATING) as stage:
+            if cached is None:
+                student_data, category_data = meet_stats(meet_data)
+                if use_cache:
+                    stats_cache.save(key, student_data, category_data)
+            else:
+                student_data, category_data = cached
+            student_data = student_registry.with_ids(student_data, year)
+            stage.rows = len(student_data)
+
+        if intervals:
+            import bootstrap
+
+            with instruments.stage(INTERVALS) as stage:
+                student_intervals, category_intervals = \
+                    bootstrap.interval_tables(student_data, category_data)
+                stage.rows = len(student_data)
+
+        with instruments.stage(RANKING) as stage:
+            boards = leaderboards.leaderboards(student_data)
+            teams = leaderboards.team_totals(student_data)
+            stage.rows = len(student_data)
+
+        # Create subdirectory for reports and data files.
+        with instruments.stage(WRITING) as stage:
+            os.makedirs(subdirectory, exist_ok=True)
+
+            # The students' scores and ratings, and the category ratings
+            outputs = {f'{prefix} with Student Ratings.csv': student_data,
+                       f'{prefix} Category Ratings.csv': category_data}
+            if intervals:
+                outputs[f'{prefix} Rating Intervals.csv'] = student_intervals
+                outputs[f'{prefix} Category Rating Intervals.csv'] = \
+                    category_intervals
+            outputs.update(zip(leaderboards.leaderboard_paths(year, meet),
+                               (boards, teams)))
+
+            # Each column is formatted once; the roster reuses the students'
+            student_text = meet_outputs.CsvText(student_data)
+            roster_csv = student_text.csv(KEY + [STUDENT_ID])
+            contents = {path: (student_text if data is student_data else
+                               meet_outputs.CsvText(data)).csv()
+                        for path, data in outputs.items()}
+            if bundle:
+                tables = {path[len(prefix) + 1:-len('.csv')]: data
+                          for path, data in outputs.items()}
+                contents.update(
+                    meet_outputs.bundle_contents(tables, prefix, bundle))
+
+            paths = meet_outputs.write_files(contents)
+            stage.wrote(*paths)
+            written.extend(paths)
+            stage.rows = len(student_data) + len(category_data)
+
+        # Create csv file with just roster and ratings for the year
+        with instruments.stage(CUMULATIVE) as stage:
+            paths = update_annual_ratings(student_data, year, meet)
+            stage.wrote(*paths)
+            written.extend(paths)
+            stage.rows = len(student_data)
+
+        # Generate all pdf reports
+        with instruments.stage(REPORTING) as stage:
+            paths = generate_reports(student_data, category_data, year, meet,
+                                     prefix)
+            stage.wrote(*paths)
+            written.extend(paths)
+            stage.rows = len(student_data)
+
+        with instruments.stage(ROSTER) as stage:
+            roster_path = f'./{directory}/roster.csv'
+            if not rerunning:
+                # Create backup of old roster file if it exists
+                if os.path.exists(roster_path):
+                    os.rename(roster_path, backup_path)
+                update_roster = True
+            else:
+                # Once the next meet is started, the roster belongs to it
+                update_roster = \
+                    max(season_store.stored_meets(year)) <= meet and \
+                    not os.path.exists(f'./{directory}/Meet {meet + 1}.csv')
+
+            # Create updated roster file based on this meet's students
+            if update_roster and write_if_changed(roster_path, roster_csv):
+                stage.wrote(roster_path)
+                written.append(roster_path)
+            stage.rows = len(student_data)
+
+    instruments.write(prefix)
+    return written
+
+
+def generate_reports(student_data: pd.DataFrame, category_data: pd.DataFrame,
+                     year: int, meet: int, prefix: str) -> list[str]:
+    """ Creates a PDF report for every school and every student in the meet and
+    bundles them into '<prefix> Reports.zip'. See reports.py. Returns the
+    files written. """
+    import reports
+
+    return reports.write_report_bundle(student_data, category_data, year,
+                                       meet, prefix)
 
 
 def update_annual_ratings(student_data: pd.DataFrame, year: int,
-                          meet: int) -> None:
+                          meet: int) -> list[str]:
     """ Creates a file comprised of each student with their ratings for each
     meet along with columns for their average rating and averages with dropped
-    meet(s)."""
-    personal_with_rating = KEY + [FINAL_RATING]
-    prefix = f'./{year}/Cumulative Ratings - Meet'
-    out_path = f'{prefix} {meet}.csv'
-    renamed = {FINAL_RATING: f'Meet {meet} Rating'}
-    data_out = student_data[personal_with_rating].rename(columns=renamed)
+    meet(s).
 
-    # If Meet 1, just create with personal info and this meet rating
-    if meet == 1:
-        data_out.to_csv(out_path, index=False)
-        return
+    The ratings themselves are kept in the year's season store (see
+    season_store.py). This meet's ratings are saved there and the cumulative
+    file is built from the store, so it doesn't depend on the previous meet's
+    cumulative file. Students are matched from meet to meet by their Student
+    ID, which is looked up in the student registry if student_data doesn't
+    have one.
 
-    # Check for previous ratings file existence.
+    The cumulative files of any later meets in the store are rewritten too,
+    if this meet's ratings changed them. Returns the files written. """
+    import season_store
+
+    personal_with_rating = [column for column in KEY + [STUDENT_ID]
+                            if column in student_data] + [FINAL_RATING]
+    prefix = f'./{year}/Cumulative Ratings - Meet'
+
+    # Seasons started before the store existed only have cumulative files, so
+    # bring the earlier meets into the store from the most recent one.
     previous_path = f'{prefix} {meet-1}.csv'
-    if not os.path.exists(previous_path):
-        raise FileNotFoundError(
-            "Cumulative Ratings File Error\n\nThe cumulative ratings file from"
-            f" Meet {meet-1} wasn't found in the {year} folder. You should be "
-            "able to recover from this error by rerunning the stats for any "
-            "meets that are missing their cumulative data files.\n\nRemember, "
-            "No statistics files in this folder or any subfolders should be "
-            "deleted. They are very small files and aren't taking up an "
-            "appreciable amount of hard drive space.\n\nIf you can't figure "
-            "out how to recover from this error, contact the program designer "
-            "at patrick.barringer@gmail.com"
-        )
-
-    # Open previous ratings, merge with current ratings, and save to csv
-    previous_ratings = pd.read_csv(previous_path)
-    merged = pd.merge(previous_ratings, data_out, on=KEY, how='outer')
-    merged.to_csv(out_path, index=False)
+    if meet > 1 and meet-1 not in season_store.stored_meets(year) and \
+            os.path.exists(previous_path):
+        season_store.import_cumulative_file(year, previous_path)
+
+    # Save this meet's ratings and write out the cumulative views
+    season_store.save_meet_ratings(year, meet,
+                                   student_data[personal_with_rating])
+    written = []
+    for cumulative_meet in [meet] + [later for later in
+                                     season_store.stored_meets(year)
+                                     if later > meet]:
+        if write_cumulative_ratings(year, cumulative_meet):
+            written.append(f'{prefix} {cumulative_meet}.csv')
+    return written
+
+
+def write_cumulative_ratings(year: int, meet: int) -> bool:
+    """ Writes 'Cumulative Ratings - Meet N.csv' for the given meet from the
+    year's season store, unless it's already up to date. Returns whether it
+    was written. """
+    import season_store
+
+    cumulative = season_store.cumulative_ratings(year, meet)
+    cumulative = add_season_averages(cumulative)
+    return write_csv_if_changed(
+        cumulative, f'./{year}/Cumulative Ratings - Meet {meet}.csv')
+
+
+def add_season_averages(cumulative: pd.DataFrame) -> pd.DataFrame:
+    """ Adds three columns to a cumulative ratings DataFrame: each student's
+    average rating over the meets they took part in, and their average over
+    the best k-1 and best k-2 of the season's k meets so far. A meet a
+    student missed counts as a rating of 0 in the dropped averages, so it's
+    the first to be dropped.
+
+    All students are handled at once with a partial sort of the students x
+    meets matrix of ratings. """
+    meet_columns = [column for column in cumulative.keys()
+                    if re.fullmatch(r'Meet \d+ Rating', column)]
+    ratings = cumulative[meet_columns].to_numpy(dtype=float)
+    meets = ratings.shape[1]
+
+    cumulative = cumulative.copy()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        attended = (~np.isnan(ratings)).sum(axis=1)
+        cumulative[AVERAGE] = np.where(np.isnan(ratings), 0,
+                                       ratings).sum(axis=1) / attended
+
+    # Move each student's two lowest ratings to the front, leaving the rest
+    # unsorted, and average what's left behind them.
+    filled = np.where(np.isnan(ratings), 0, ratings)
+    lowest = [kth for kth in (0, 1) if kth < meets]
+    if lowest:
+        filled = np.partition(filled, lowest, axis=1)
+    for dropped, column in ((1, DROP_ONE), (2, DROP_TWO)):
+        if meets > dropped:
+            cumulative[column] = filled[:, dropped:].sum(axis=1) \
+                / (meets - dropped)
+        else:
+            cumulative[column] = np.nan
+
+    return cumulative
 
 
 def update_grades(roster: pd.DataFrame) -> pd.DataFrame:
     """ This function removes all the seniors from the roster
     DataFrame and adds a year to all the remaining students' grades."""
-    roster = roster[roster['Grade'] != 12]
-    roster['Grade'] = roster['Grade'] + 1
-    return roster
+    returning = roster[GRADE] != 12
+    return roster[returning].assign(**{GRADE: roster[GRADE][returning] + 1})
 
 
 if __name__ == '__main__':
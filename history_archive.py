@@ -0,0 +1,285 @@
+""" An archive of every season's results for questions that span years, like
+how a school's category ratings have moved over the last five seasons.
+
+build_archive reads each analyzed meet's 'with Student Ratings' and
+'Category Ratings' files once and compacts them into plain NumPy arrays in
+the 'History Archive' folder: one row per student per meet (meet, Student
+ID, school code, grade, scores and Final Individual Rating) and one row per
+category per meet (category code, count, total and rating). Rows are in
+year and meet order, so each meet is a contiguous slice. A small JSON index
+names the meets, schools and categories the codes stand for.
+
+HistoryArchive opens the arrays memory-mapped, so opening takes the same
+time however many seasons it holds, and answers queries with array
+operations without parsing any csv:
+
+    python -m mcmlstats archive build
+    python -m mcmlstats archive categories --school Penfield """
+import json
+import os
+import re
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from data_functions import COUNT, FINAL_RATING, GRADE, RATINGS, SCHOOL, \
+    STUDENT_ID, TOTAL, category_ratings, read_data_file, score_columns, \
+    score_matrix
+
+
+ARCHIVE_DIRECTORY = './History Archive'
+INDEX_FILENAME = 'index.json'
+
+# Bump this whenever the arrays or index change shape, so that old archives
+# are rebuilt rather than misread.
+ARCHIVE_VERSION = 1
+
+# Student IDs of students in meets analyzed before there were IDs
+NO_ID = -1
+
+# The arrays, by file name, and their types
+ENTRY_ARRAYS = {
+    'meet_index': np.int32,
+    'student_id': np.int64,
+    'school': np.int32,
+    'grade': np.int8,
+    'scores': np.float32,
+    'final_rating': np.float64,
+}
+CATEGORY_ARRAYS = {
+    'category_meet_index': np.int32,
+    'category': np.int32,
+    'count': np.int64,
+    'total': np.float64,
+    'rating': np.float64,
+}
+
+
+def analyzed_meets(root: str = '.') -> list[tuple[int, int]]:
+    """ Returns the (year, meet) of every meet under root with results, in
+    order. """
+    meets = []
+    for year in sorted(int(name) for name in os.listdir(root)
+                       if name.isdigit()):
+        folder = os.path.join(root, str(year))
+        if not os.path.isdir(folder):
+            continue
+        for name in os.listdir(folder):
+            match = re.fullmatch(r'Meet (\d+)', name)
+            if match and os.path.exists(
+                    _results_path(root, year, int(match.group(1)),
+                                  'with Student Ratings')):
+                meets.append((year, int(match.group(1))))
+    return sorted(meets)
+
+
+def _results_path(root: str, year: int, meet: int, name: str) -> str:
+    return os.path.join(root, str(year), f'Meet {meet}',
+                        f'Meet {meet} {name}.csv')
+
+
+def build_archive(root: str = '.',
+                  directory: str = ARCHIVE_DIRECTORY) -> dict:
+    """ Compacts the results of every meet under root into the archive in
+    directory, replacing any archive there, and returns its index. The new
+    archive is written to a folder beside directory and then renamed into
+    its place, so it's never opened half written and the old arrays are
+    never mixed with the new. (For the moment between moving the old archive
+    aside and the new one in, there's no archive to open.) """
+    meets, schools, categories = [], {}, {}
+    entries = {name: [] for name in ENTRY_ARRAYS}
+    category_rows = {name: [] for name in CATEGORY_ARRAYS}
+    start = 0
+
+    for number, (year, meet) in enumerate(analyzed_meets(root)):
+        student_data = read_data_file(
+            _results_path(root, year, meet, 'with Student Ratings'),
+            has_scores=True)
+        category_data = read_data_file(
+            _results_path(root, year, meet, 'Category Ratings'))
+        names = score_columns(student_data.keys())
+        rows = len(student_data)
+
+        school_names = student_data[SCHOOL].astype(str).to_numpy()
+        uniques, inverse = np.unique(school_names, return_inverse=True)
+        codes = np.array([schools.setdefault(school, len(schools))
+                          for school in uniques], dtype=np.int32)
+
+        entries['meet_index'].append(np.full(rows, number))
+        entries['student_id'].append(
+            student_data[STUDENT_ID].to_numpy(dtype=np.int64,
+                                              na_value=NO_ID)
+            if STUDENT_ID in student_data else np.full(rows, NO_ID))
+        entries['school'].append(codes[inverse])
+        entries['grade'].append(student_data[GRADE].to_numpy())
+        entries['scores'].append(score_matrix(student_data, names))
+        entries['final_rating'].append(
+            student_data[FINAL_RATING].to_numpy(dtype=float,
+                                                na_value=np.nan))
+
+        category_codes = [categories.setdefault(str(name), len(categories))
+                          for name in category_data['Category']]
+        category_rows['category_meet_index'].append(
+            np.full(len(category_data), number))
+        category_rows['category'].append(category_codes)
+        category_rows['count'].append(category_data[COUNT].to_numpy())
+        category_rows['total'].append(category_data[TOTAL].to_numpy())
+        category_rows['rating'].append(category_data[RATINGS].to_numpy())
+
+        meets.append({'year': year, 'meet': meet, 'start': start,
+                      'stop': start + rows,
+                      'categories': [categories[str(name)]
+                                     for name in names]})
+        start += rows
+
+    # Meets with fewer categories have their scores padded with NaN
+    width = max((len(meet['categories']) for meet in meets), default=0)
+    entries['scores'] = [np.pad(scores, ((0, 0), (0, width - scores.shape[1])),
+                                constant_values=np.nan)
+                         for scores in entries['scores']]
+
+    index = {
+        'version': ARCHIVE_VERSION,
+        'meets': meets,
+        'schools': list(schools),
+        'categories': list(categories),
+    }
+
+    directory = os.path.normpath(directory)
+    building = f'{directory}.{os.getpid()}.tmp'
+    replaced = f'{directory}.{os.getpid()}.old'
+    os.makedirs(building)
+    try:
+        for arrays, types in ((entries, ENTRY_ARRAYS),
+                              (category_rows, CATEGORY_ARRAYS)):
+            for name, dtype in types.items():
+                empty = np.empty((0, width) if name == 'scores' else 0)
+                np.save(os.path.join(building, f'{name}.npy'),
+                        np.concatenate(arrays[name]).astype(dtype)
+                        if arrays[name] else empty.astype(dtype))
+        with open(os.path.join(building, INDEX_FILENAME), 'w') as outfile:
+            json.dump(index, outfile, indent=1)
+
+        # A folder can't be replaced while it has files in it, so the old
+        # archive is moved aside first
+        if os.path.exists(directory):
+            os.rename(directory, replaced)
+        os.rename(building, directory)
+    except BaseException:
+        if os.path.exists(replaced) and not os.path.exists(directory):
+            os.rename(replaced, directory)
+        shutil.rmtree(building, ignore_errors=True)
+        raise
+
+    # On Windows, arrays another process still has open can keep some of the
+    # old archive from being removed; it's only ever left beside the new one
+    shutil.rmtree(replaced, ignore_errors=True)
+    return index
+
+
+class HistoryArchive:
+    ''' The archive in directory, opened memory-mapped. Only the pages a
+    query touches are ever read. '''
+
+    def __init__(self, directory: str = ARCHIVE_DIRECTORY):
+        index_path = os.path.join(directory, INDEX_FILENAME)
+        if not os.path.exists(index_path):
+            raise FileNotFoundError(
+                f"No history archive was found in '{directory}'.\n\nBuild it "
+                "with 'python -m mcmlstats archive build'.")
+        with open(index_path) as infile:
+            index = json.load(infile)
+        if index['version'] != ARCHIVE_VERSION:
+            raise ValueError(
+                f"The history archive in '{directory}' was built by another "
+                "version of this program.\n\nRebuild it with "
+                "'python -m mcmlstats archive build'.")
+
+        self.meets = pd.DataFrame(index['meets'],
+                                  columns=['year', 'meet', 'start', 'stop',
+                                           'categories'])
+        self.schools = index['schools']
+        self.school_codes = {school: code
+                             for code, school in enumerate(self.schools)}
+        self.categories = index['categories']
+        self.arrays = {
+            name: np.load(os.path.join(directory, f'{name}.npy'),
+                          mmap_mode='r')
+            for name in list(ENTRY_ARRAYS) + list(CATEGORY_ARRAYS)}
+
+    def _school_rows(self, school: str) -> np.ndarray:
+        if school not in self.school_codes:
+            raise ValueError(f"'{school}' isn't in the history archive.")
+        return np.flatnonzero(self.arrays['school'] ==
+                              self.school_codes[school])
+
+    def school_trend(self, school: str = None) -> pd.DataFrame:
+        """ Returns, for each year, how many students competed in all and
+        their average and best Final Individual Rating, across the league or
+        for one school. """
+        years = self.meets['year'].to_numpy()
+        if school is None:
+            rows = slice(None)
+        else:
+            rows = self._school_rows(school)
+        entry_years = years[self.arrays['meet_index'][rows]]
+        final = np.asarray(self.arrays['final_rating'][rows])
+
+        rated = ~np.isnan(final)
+        trend = pd.DataFrame({'Year': entry_years[rated],
+                              FINAL_RATING: final[rated]})
+        trend = trend.groupby('Year')[FINAL_RATING].agg(
+            ['count', 'mean', 'max'])
+        trend.columns = ['Ratings', 'Average Rating', 'Best Rating']
+        return trend.reset_index()
+
+    def category_trend(self, school: str = None) -> pd.DataFrame:
+        """ Returns, for each year and category, how many students played
+        it, their total points and the category rating those give. Across
+        the league these are the meets' own category ratings combined; for
+        one school they're worked out from its students' scores. """
+        years = self.meets['year'].to_numpy()
+        if school is None:
+            meet_years = years[self.arrays['category_meet_index']]
+            categories = np.asarray(self.arrays['category'])
+            counts = np.asarray(self.arrays['count'])
+            totals = np.asarray(self.arrays['total'])
+        else:
+            rows = self._school_rows(school)
+            meet_index = np.asarray(self.arrays['meet_index'][rows])
+            scores = np.asarray(self.arrays['scores'][rows], dtype=float)
+
+            # The category each score column was in each meet
+            columns = np.full((len(self.meets), scores.shape[1]), -1)
+            for number, codes in enumerate(self.meets['categories']):
+                columns[number, :len(codes)] = codes
+            played = ~np.isnan(scores)
+            meet_years = np.broadcast_to(years[meet_index][:, np.newaxis],
+                                         scores.shape)[played]
+            categories = columns[meet_index][played]
+            counts = np.ones(len(categories), dtype=np.int64)
+            totals = scores[played]
+
+        trend = pd.DataFrame({'Year': meet_years, 'Category': categories,
+                              COUNT: counts, TOTAL: totals})
+        trend = trend.groupby(['Year', 'Category'], as_index=False).sum()
+        trend[RATINGS] = category_ratings(trend[COUNT].to_numpy(),
+                                          trend[TOTAL].to_numpy())
+        trend['Category'] = np.asarray(self.categories,
+                                       dtype=object)[trend['Category']]
+        return trend
+
+    def student_history(self, student_id: int) -> pd.DataFrame:
+        """ Returns every meet the student competed in, with their school,
+        grade and Final Individual Rating. """
+        rows = np.flatnonzero(self.arrays['student_id'] == student_id)
+        meet_index = np.asarray(self.arrays['meet_index'][rows])
+        return pd.DataFrame({
+            'Year': self.meets['year'].to_numpy()[meet_index],
+            'Meet': self.meets['meet'].to_numpy()[meet_index],
+            SCHOOL: np.asarray(self.schools, dtype=object)[
+                self.arrays['school'][rows]],
+            GRADE: self.arrays['grade'][rows],
+            FINAL_RATING: self.arrays['final_rating'][rows],
+        })
@@ -0,0 +1,186 @@
+""" Measures each stage of a run: its wall time, the rows it handled, the bytes
+it read and wrote and the peak memory it reached. Each stage is logged as a
+JSON event on the 'mcmlstats' logger as it finishes.
+
+A stage's peak_rss_mb is the most memory the process held during that stage.
+Only Linux lets the peak be started over at each stage, so elsewhere it's
+None. process_peak_rss_mb is the most the process has held since it started,
+which every stage after the heaviest one repeats.
+
+Profiling is opt-in. When it's on, the whole run is captured with cProfile
+and tracemalloc, and each stage also records the peak memory allocated
+through Python (which includes pandas and NumPy arrays). """
+import cProfile
+import contextlib
+import io
+import json
+import logging
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from typing import Callable
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+logger = logging.getLogger('mcmlstats')
+
+# How many functions and allocation sites the profile summary lists
+PROFILE_LINES = 30
+
+# What the stage timings file's name ends with, after the meet's prefix
+STAGE_TIMINGS = 'Stage Timings.json'
+
+# Starting the peak over also lowers the process's own record of it, so the
+# highest peak started over from is kept here
+_earlier_peak_mb = 0
+
+
+class Stage:
+    ''' What one stage did. The code running the stage fills in rows and
+    reports the files it read and wrote. '''
+
+    def __init__(self, name: str):
+        self.name = name
+        self.rows = None
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def read(self, *paths: str) -> None:
+        for path in paths:
+            self.bytes_read += os.path.getsize(path)
+
+    def wrote(self, *paths: str) -> None:
+        for path in paths:
+            self.bytes_written += os.path.getsize(path)
+
+
+class Instrumentation:
+    ''' Times the stages of a run. Use it as a context manager around the run
+    and wrap each stage in stage(). progress, if given, is called with each
+    stage's name as it begins, before timing starts. '''
+
+    def __init__(self, progress: Callable[[str], None] = None,
+                 profile: bool = False):
+        self.progress = progress
+        self.profile = profile
+        self.stages = []
+        self.profiler = None
+        self.snapshot = None
+        self.started_tracing = False
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        if self.profile:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.started_tracing = True
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds = time.perf_counter() - self.start
+        if self.profile:
+            self.profiler.disable()
+            self.snapshot = tracemalloc.take_snapshot()
+            if self.started_tracing:
+                tracemalloc.stop()
+        return False
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        if self.progress is not None:
+            self.progress(name)
+
+        stage = Stage(name)
+        measuring_rss = reset_peak_rss()
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        completed = False
+        try:
+            yield stage
+            completed = True
+        finally:
+            event = {
+                'stage': name,
+                'seconds': time.perf_counter() - start,
+                'rows': stage.rows,
+                'bytes_read': stage.bytes_read,
+                'bytes_written': stage.bytes_written,
+                'peak_rss_mb': peak_rss_mb() if measuring_rss else None,
+                'process_peak_rss_mb': process_peak_rss_mb(),
+                'completed': completed,
+            }
+            if tracemalloc.is_tracing():
+                event['peak_traced_mb'] = tracemalloc.get_traced_memory()[1] \
+                    / 2**20
+            self.stages.append(event)
+            logger.info(json.dumps(event))
+
+    def summary(self) -> dict:
+        return {'total_seconds': self.seconds, 'stages': self.stages}
+
+    def write(self, prefix: str) -> None:
+        """ Writes '<prefix> Stage Timings.json' and, when profiling, the
+        cProfile data to '<prefix> Profile.prof' and a readable summary of it
+        and the largest memory allocations to '<prefix> Profile.txt'. """
+        with open(f'{prefix} {STAGE_TIMINGS}', 'w') as outfile:
+            json.dump(self.summary(), outfile, indent=2)
+
+        if not self.profile:
+            return
+
+        self.profiler.dump_stats(f'{prefix} Profile.prof')
+        text = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=text)
+        stats.sort_stats('cumulative').print_stats(PROFILE_LINES)
+        text.write('\nLargest memory allocations still held at the end:\n')
+        for statistic in self.snapshot.statistics('lineno')[:PROFILE_LINES]:
+            text.write(f'{statistic}\n')
+        with open(f'{prefix} Profile.txt', 'w') as outfile:
+            outfile.write(text.getvalue())
+
+
+def reset_peak_rss() -> bool:
+    """ Starts the peak resident memory over from what the process holds
+    now, where the platform allows it (Linux). Returns whether it did. """
+    global _earlier_peak_mb
+
+    _earlier_peak_mb = max(_earlier_peak_mb, peak_rss_mb() or 0)
+    try:
+        with open('/proc/self/clear_refs', 'w') as outfile:
+            outfile.write('5')
+    except OSError:
+        return False
+    return True
+
+
+def peak_rss_mb() -> float:
+    """ The most memory this process has held since reset_peak_rss was last
+    called, or None where the platform doesn't say. """
+    try:
+        with open('/proc/self/status') as infile:
+            for line in infile:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 2**10
+    except OSError:
+        pass
+    return None
+
+
+def process_peak_rss_mb() -> float:
+    """ The most memory this process has held since it started, or None where
+    the platform doesn't say. """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return max(peak / (2**20 if sys.platform == 'darwin' else 2**10),
+               _earlier_peak_mb)
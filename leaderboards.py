@@ -0,0 +1,170 @@
+""" Leaderboards for a meet: the top students overall, in each school, in each
+grade and in each category, and every school's team totals.
+
+Only the top of each group is ever ordered. The students are split into
+their groups by integer code, each group's cutoff is found by partial
+selection (np.partition, linear in the group's size), and only the students
+at or above it are sorted. Students tied with the last place are all
+included, and tied students share a rank (1, 2, 2, 4).
+
+create_reports saves the leaderboards in 'Meet N Leaderboards.csv', already
+in order, and the team totals in 'Meet N Team Totals.csv'. leaderboard looks
+a board up from the saved file without sorting anything. """
+import numpy as np
+import pandas as pd
+
+from data_functions import FINAL_RATING, GRADE, KEY, SCHOOL, STUDENT_ID, \
+    read_data_file, score_columns, score_matrix
+
+
+# How many places each leaderboard has
+TOP_N = 10
+
+# How many of a school's best Final Individual Ratings make its Team Rating.
+# None counts every student who competed; a league that only counts its best
+# few can set how many.
+TEAM_SIZE = None
+
+BOARD = 'Board'
+GROUP = 'Group'
+RANK = 'Rank'
+SCORE = 'Score'
+TEAM_RATING = 'Team Rating'
+OVERALL = 'Overall'
+BOARDS = [OVERALL, SCHOOL, GRADE, 'Category']
+
+
+def top_rows(values: np.ndarray, groups: np.ndarray, n: int) \
+        -> tuple[np.ndarray, np.ndarray]:
+    """ Returns the positions of the rows with the n highest values in each
+    group, and any tied with the nth, along with their ranks. groups holds
+    each row's group as a code from 0 (-1 for none). The rows come group by
+    group and best first within each, ties in row order. Rows with a NaN
+    value are left out. """
+    positions = np.flatnonzero(~np.isnan(values) & (groups >= 0))
+    codes = groups[positions]
+    positions = positions[np.argsort(codes, kind='stable')]
+    ends = np.cumsum(np.bincount(codes))
+
+    chosen, ranks = [], []
+    for start, end in zip(np.concatenate([[0], ends[:-1]]), ends):
+        members = positions[start:end]
+        member_values = values[members]
+        if len(members) > n:
+            cutoff = np.partition(member_values, len(members) - n)[
+                len(members) - n]
+            top = member_values >= cutoff
+            members, member_values = members[top], member_values[top]
+
+        order = np.argsort(-member_values, kind='stable')
+        ordered = -member_values[order]
+        chosen.append(members[order])
+        ranks.append(np.searchsorted(ordered, ordered, side='left') + 1)
+
+    if not chosen:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    return np.concatenate(chosen), np.concatenate(ranks)
+
+
+def _board(student_data: pd.DataFrame, name: str, labels: np.ndarray,
+           rows: np.ndarray, ranks: np.ndarray,
+           scores: np.ndarray = None) -> pd.DataFrame:
+    details = [column for column in KEY + [STUDENT_ID]
+               if column in student_data]
+    board = student_data[details + [FINAL_RATING]].iloc[rows] \
+        .reset_index(drop=True)
+    board.insert(0, BOARD, name)
+    board.insert(1, GROUP, labels)
+    board.insert(2, RANK, ranks)
+    board.insert(len(board.columns) - 1, SCORE,
+                 np.nan if scores is None else scores)
+    return board
+
+
+def leaderboards(student_data: pd.DataFrame, n: int = TOP_N) -> pd.DataFrame:
+    """ Takes the students' ratings from calculate_stats and returns every
+    leaderboard as one table, board by board, group by group and place by
+    place. Students are ranked by Final Individual Rating, and in a category
+    by their score there with ties broken by Final Individual Rating. """
+    final = student_data[FINAL_RATING].to_numpy(dtype=float, na_value=np.nan)
+    boards = []
+
+    overall = np.zeros(len(final), dtype=np.intp)
+    rows, ranks = top_rows(final, overall, n)
+    boards.append(_board(student_data, OVERALL, '', rows, ranks))
+
+    for column in (SCHOOL, GRADE):
+        codes, labels = pd.factorize(student_data[column], sort=True)
+        rows, ranks = top_rows(final, codes, n)
+        boards.append(_board(student_data, column,
+                             np.asarray(labels.astype(str))[codes[rows]],
+                             rows, ranks))
+
+    # Every category is a group of one selection over all the scores. Adding
+    # less than a point for the Final Individual Rating breaks ties.
+    categories = score_columns(student_data.keys())
+    scores = score_matrix(student_data, categories)
+    scale = np.nanmax(final, initial=0) + 1
+    ranking = (scores * scale + np.nan_to_num(final)[:, np.newaxis])
+    codes = np.broadcast_to(np.arange(len(categories)), scores.shape)
+    rows, ranks = top_rows(ranking.T.ravel(), codes.T.ravel(), n)
+    category, student = np.divmod(rows, len(final))
+    boards.append(_board(student_data, 'Category',
+                         np.asarray(categories, dtype=object)[category],
+                         student, ranks, scores[student, category]))
+
+    return pd.concat(boards, ignore_index=True)
+
+
+def team_totals(student_data: pd.DataFrame,
+                team_size: int = TEAM_SIZE) -> pd.DataFrame:
+    """ Returns each school's number of students who competed, its points in
+    each category and in all, and its Team Rating, the total of its
+    students' Final Individual Ratings, or of only its team_size best if
+    that's given. Schools are ranked by Team Rating. """
+    final = student_data[FINAL_RATING].to_numpy(dtype=float, na_value=np.nan)
+    categories = score_columns(student_data.keys())
+    scores = np.nan_to_num(score_matrix(student_data, categories))
+    codes, schools = pd.factorize(student_data[SCHOOL], sort=True)
+    counted = codes >= 0
+    size = len(schools)
+
+    totals = pd.DataFrame({SCHOOL: schools.astype(str)})
+    totals['Students'] = np.bincount(codes[counted & ~np.isnan(final)],
+                                     minlength=size)
+    for i, category in enumerate(categories):
+        totals[category] = np.bincount(codes[counted],
+                                       scores[counted, i], minlength=size)
+    totals['Total Points'] = totals[categories].sum(axis=1)
+
+    if team_size is None:
+        rows = np.flatnonzero(counted & ~np.isnan(final))
+    else:
+        # Ties at the last place count once
+        rows, _ = top_rows(final, codes, team_size)
+        place = np.arange(len(rows)) - \
+            np.searchsorted(codes[rows], codes[rows])
+        rows = rows[place < team_size]
+    totals[TEAM_RATING] = np.bincount(codes[rows], final[rows],
+                                      minlength=size)
+
+    ranked = -totals[TEAM_RATING].to_numpy()
+    totals.insert(0, RANK, pd.Series(ranked).rank(method='min').astype(int))
+    return totals.sort_values([RANK, SCHOOL], ignore_index=True)
+
+
+def leaderboard_paths(year: int, meet: int) -> tuple[str, str]:
+    """ Returns the paths of the meet's leaderboards and team totals. """
+    prefix = f'./{year}/Meet {meet}/Meet {meet}'
+    return f'{prefix} Leaderboards.csv', f'{prefix} Team Totals.csv'
+
+
+def leaderboard(year: int, meet: int, board: str = OVERALL,
+                group: str = None) -> pd.DataFrame:
+    """ Returns one of a meet's saved leaderboards, for example
+    leaderboard(2021, 1, 'School', 'Penfield'), in order. """
+    boards = read_data_file(leaderboard_paths(year, meet)[0])
+    found = boards[BOARD] == board
+    if group is not None:
+        found &= boards[GROUP].astype(str) == str(group)
+    return boards[found].reset_index(drop=True)
@@ -0,0 +1,222 @@
+""" Provisional ratings while a meet's scores are still being entered.
+
+A LiveMeet keeps the count and total of every category as running aggregates.
+Each time the scores file is read again, it finds the rows that were inserted,
+edited or deleted since the last read and applies them to the aggregates as
+deltas. Then only the ratings that could have changed are recalculated: the
+edited and inserted rows, and the rows of students who played a category
+whose rating moved. The results are always exactly what calculate_stats gives
+for the same file.
+
+watch polls a meet's scores file and rewrites the provisional ratings files
+whenever it changes. A read with problems, like a score that isn't a number,
+is reported and the last good provisional files are kept until it's fixed:
+
+    python -m mcmlstats live 2021 1 """
+import os
+import time
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+import validation
+from data_functions import COUNT, FINAL_RATING, RATINGS, TOTAL, \
+    category_aggregates, category_ratings, read_data_file, \
+    restore_score_types, score_columns, score_matrix, student_ratings
+
+
+# How often watch checks the scores file, in seconds
+POLL_SECONDS = 2.0
+
+# Students with only some of their scores entered yet are expected
+ALLOWED_PROBLEMS = validation.WRONG_CATEGORY_COUNT
+
+
+class LiveMeet:
+    ''' The ratings of a meet whose scores file is being filled in. Call
+    update with each new read of the file. '''
+
+    def __init__(self):
+        self.categories = None
+        self.meet_data = None
+        self.positions = {}
+        self.scores = np.empty((0, 0))
+        self.final = np.empty(0)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.totals = np.zeros(0)
+        self.ratings = np.zeros(0)
+
+    def update(self, meet_data: pd.DataFrame) -> dict[str, int]:
+        """ Brings the ratings up to date with the given read of the scores
+        file. Returns how many rows were inserted, edited and deleted and how
+        many students' ratings were recalculated. """
+        categories = score_columns(meet_data.keys())
+        if categories != self.categories:
+            # New categories mean nothing carries over
+            self.__init__()
+            self.categories = categories
+            self.scores = np.empty((0, len(categories)))
+            self.counts = np.zeros(len(categories), dtype=np.int64)
+            self.totals = np.zeros(len(categories))
+            self.ratings = np.full(len(categories), np.nan)
+
+        identity = [column for column in meet_data.keys()
+                    if column not in categories]
+        keys = _row_keys(meet_data, identity)
+        scores = score_matrix(meet_data, categories)
+
+        # Match each row to the row it was in the last read, if any
+        old_rows = np.fromiter((self.positions.get(key, -1) for key in keys),
+                               dtype=np.intp, count=len(keys))
+        matched = old_rows >= 0
+        same = np.zeros(len(keys), dtype=bool)
+        before = self.scores[old_rows[matched]]
+        after = scores[matched]
+        same[matched] = ((before == after) |
+                         (np.isnan(before) & np.isnan(after))).all(axis=1)
+        kept = np.zeros(len(self.scores), dtype=bool)
+        kept[old_rows[same]] = True
+
+        # Apply the deleted and edited rows' old scores and the inserted and
+        # edited rows' new scores to the aggregates
+        removed = self.scores[~kept]
+        added = scores[~same]
+        if _whole_numbers(scores) and _whole_numbers(removed):
+            # Sums of whole numbers are exact in any order, so they match the
+            # full calculation's
+            self.counts = self.counts - (~np.isnan(removed)).sum(axis=0) \
+                + (~np.isnan(added)).sum(axis=0)
+            self.totals = self.totals - np.nansum(removed, axis=0) \
+                + np.nansum(added, axis=0)
+        else:
+            meet_index = np.zeros(len(scores), dtype=np.intp)
+            counts, totals = category_aggregates(scores, meet_index, 1)
+            self.counts, self.totals = counts[0], totals[0]
+
+        ratings = category_ratings(self.counts, self.totals)
+        changed = ~((ratings == self.ratings) |
+                    (np.isnan(ratings) & np.isnan(self.ratings)))
+
+        # A missing category rating makes every Rating Sum NaN, so a rating
+        # appearing or disappearing changes every student
+        if (np.isnan(ratings) != np.isnan(self.ratings)).any():
+            affected = np.ones(len(keys), dtype=bool)
+        else:
+            affected = ~same | \
+                (~np.isnan(scores[:, changed])).any(axis=1)
+
+        final = np.empty(len(keys))
+        final[same] = self.final[old_rows[same]]
+        final[affected] = student_ratings(
+            scores[affected],
+            np.broadcast_to(ratings, (int(affected.sum()), len(ratings))))
+
+        changes = {
+            'inserted': int((~matched).sum()),
+            'edited': int((matched & ~same).sum()),
+            'deleted': int(len(self.scores) - matched.sum()),
+            'recalculated': int(affected.sum()),
+        }
+
+        self.meet_data = meet_data
+        self.positions = {key: row for row, key in enumerate(keys)}
+        self.scores = scores
+        self.final = final
+        self.ratings = ratings
+        return changes
+
+    def student_data(self) -> pd.DataFrame:
+        """ The students' provisional ratings, as calculate_stats' first
+        DataFrame. """
+        student_data = self.meet_data.copy()
+        student_data[FINAL_RATING] = self.final
+        restore_score_types(student_data, self.categories, self.scores)
+        return student_data
+
+    def category_data(self) -> pd.DataFrame:
+        """ The provisional category stats, as calculate_stats' second
+        DataFrame. """
+        return pd.DataFrame.from_dict({
+            "Category": self.categories,
+            COUNT: self.counts,
+            TOTAL: self.totals,
+            RATINGS: self.ratings,
+        })
+
+
+def _row_keys(meet_data: pd.DataFrame, identity: list[str]) -> list[tuple]:
+    """ Returns a key for each row made of its non-score columns and, for rows
+    that share those, which of them it is. """
+    labels = meet_data[identity].astype(str)
+    occurrence = labels.groupby(identity, sort=False).cumcount()
+    return list(zip(*(labels[column] for column in identity), occurrence))
+
+
+def _whole_numbers(scores: np.ndarray) -> bool:
+    played = scores[~np.isnan(scores)]
+    return bool(np.all(played == np.round(played)))
+
+
+def provisional_paths(year: int, meet: int) -> tuple[str, str]:
+    """ Returns the paths watch writes the provisional student and category
+    ratings to. They sit beside the scores file since the 'Meet N' folder is
+    only made once the meet is analyzed. """
+    prefix = f'./{year}/Meet {meet} Provisional'
+    return f'{prefix} Ratings.csv', f'{prefix} Category Ratings.csv'
+
+
+def watch(year: int, meet: int, interval: float = POLL_SECONDS,
+          on_update: Callable[[dict[str, int]], None] = None,
+          polls: int = None,
+          on_problem: Callable[[str], None] = None) -> LiveMeet:
+    """ Checks the meet's scores file every interval seconds and, whenever it
+    has changed, updates the provisional ratings files. on_update, if given,
+    is called with the changes after each update. Runs until interrupted, or
+    for the given number of polls. A file that can't be read yet (because it's
+    being saved, for example) is tried again on the next poll. A file that
+    doesn't pass validation, apart from students whose scores aren't all in
+    yet, leaves the provisional files as they were; on_problem, if given, is
+    called with the message listing its problems. """
+    scores_path = f'./{year}/Meet {meet}.csv'
+    ratings_path, category_path = provisional_paths(year, meet)
+    live = LiveMeet()
+    seen = None
+
+    poll = 0
+    while polls is None or poll < polls:
+        if poll:
+            time.sleep(interval)
+        poll += 1
+
+        try:
+            status = os.stat(scores_path)
+            if (status.st_mtime_ns, status.st_size) == seen:
+                continue
+            meet_data = read_data_file(scores_path, has_scores=True)
+        except (OSError, ValueError, pd.errors.ParserError):
+            continue
+        seen = (status.st_mtime_ns, status.st_size)
+
+        report = validation.validate(meet_data)
+        report.row_masks &= ~np.uint8(ALLOWED_PROBLEMS)
+        if not report.ok:
+            if on_problem is not None:
+                on_problem(report.message(scores_path))
+            continue
+
+        changes = live.update(meet_data)
+        _replace_csv(live.student_data(), ratings_path)
+        _replace_csv(live.category_data(), category_path)
+        if on_update is not None:
+            on_update(changes)
+
+    return live
+
+
+def _replace_csv(data: pd.DataFrame, path: str) -> None:
+    """ Writes the csv to a temporary file first so that a spreadsheet
+    reloading it never sees half of it. """
+    temporary_path = f'{path}.{os.getpid()}.tmp'
+    data.to_csv(temporary_path, index=False)
+    os.replace(temporary_path, path)
@@ -0,0 +1,222 @@
+""" Load test for the stats service (stats_server.py).
+
+Generates a seeded, made up league with test_data_generator, analyzes every
+meet, starts the service on it in a separate process and has many clients
+request a mix of per-meet, per-school and per-student URLs over kept-alive
+connections for a while. Reports the requests per second and latency
+percentiles as JSON:
+
+    python load_test.py --students 10000 --meets 5 --clients 50
+    python load_test.py --url http://127.0.0.1:8080 --year 2021
+
+With --url, an already running service is tested instead and nothing is
+generated. """
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import quote, urlsplit
+
+import numpy as np
+
+
+YEAR = 2021
+
+# How long to wait for the service to start, in seconds
+START_TIMEOUT = 30
+
+
+async def fetch(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                host: str, path: str) -> tuple[int, bytes]:
+    """ Sends one GET request on a kept-alive connection and returns the
+    status and body of the response. """
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n"
+                 .encode('latin-1'))
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if not line.strip():
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+def query_paths(host: str, port: int, year: int) -> list[str]:
+    """ Asks the service for the year's meets and standings and returns a
+    mix of URL paths to request: each meet's category ratings, each school's
+    results in each meet and for the season, and a sample of students. """
+    async def ask(path: str):
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            status, body = await fetch(reader, writer, host, path)
+        finally:
+            writer.close()
+        if status != 200:
+            raise ValueError(f"{path} answered {status}: {body!r}")
+        return json.loads(body)
+
+    meets = asyncio.run(ask(f'/years/{year}/meets'))
+    standings = asyncio.run(ask(f'/years/{year}/standings'))
+    schools = sorted({row['School'] for row in standings})
+    students = [row['Student ID'] for row in standings
+                if row.get('Student ID') is not None]
+
+    paths = [f'/years/{year}/standings']
+    for meet in meets:
+        paths.append(f'/years/{year}/meets/{meet}')
+        paths += [f'/years/{year}/meets/{meet}/schools/{quote(school)}'
+                  for school in schools]
+    paths += [f'/years/{year}/schools/{quote(school)}' for school in schools]
+    sample = random.Random(0).sample(students, min(len(students), 1000))
+    paths += [f'/years/{year}/students/{student}' for student in sample]
+    return paths
+
+
+async def run_clients(host: str, port: int, paths: list[str], clients: int,
+                      seconds: float, seed: int) -> dict:
+    """ Runs the clients for the given number of seconds and returns what
+    they measured. """
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + seconds
+
+    async def client(number: int) -> None:
+        nonlocal errors
+        rng = random.Random(seed + number)
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            while time.perf_counter() < deadline:
+                path = rng.choice(paths)
+                start = time.perf_counter()
+                status, _ = await fetch(reader, writer, host, path)
+                latencies.append(time.perf_counter() - start)
+                if status != 200:
+                    errors += 1
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(number) for number in range(clients)))
+    elapsed = time.perf_counter() - start
+
+    milliseconds = np.array(latencies) * 1000
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'seconds': elapsed,
+        'requests_per_second': len(latencies) / elapsed,
+        'p50_ms': float(np.percentile(milliseconds, 50)),
+        'p99_ms': float(np.percentile(milliseconds, 99)),
+        'max_ms': float(milliseconds.max()),
+    }
+
+
+def build_league(directory: str, students: int, meets: int,
+                 seed: int) -> None:
+    """ Generates a league in directory and analyzes every meet of it. """
+    import data_functions
+    import test_data_generator
+
+    test_data_generator.generate_league(os.path.join(directory, str(YEAR)),
+                                        students, meets, seed=seed)
+    working_directory = os.getcwd()
+    os.chdir(directory)
+    try:
+        for meet in range(1, meets + 1):
+            data_functions.create_reports(YEAR, meet)
+    finally:
+        os.chdir(working_directory)
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def start_service(directory: str, port: int) -> subprocess.Popen:
+    """ Starts 'mcmlstats serve' on the league and waits until it answers. """
+    package = os.path.dirname(os.path.abspath(__file__))
+    environment = dict(os.environ)
+    environment['PYTHONPATH'] = os.pathsep.join(
+        [package] + [path for path in [environment.get('PYTHONPATH')] if path])
+    service = subprocess.Popen(
+        [sys.executable, '-m', 'mcmlstats', 'serve', '--port', str(port)],
+        cwd=directory, env=environment, stdout=subprocess.DEVNULL)
+
+    deadline = time.monotonic() + START_TIMEOUT
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return service
+        except OSError:
+            if service.poll() is not None or time.monotonic() > deadline:
+                service.kill()
+                raise RuntimeError("The stats service didn't start")
+            time.sleep(0.1)
+
+
+def main(argv: list[str] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Measure the requests per second and latency of the "
+        "stats service.")
+    parser.add_argument('--url', help="test a running service instead of a "
+                        "made up league")
+    parser.add_argument('--year', type=int, default=YEAR,
+                        help="the year to query (default: %(default)s)")
+    parser.add_argument('--students', type=int, default=10_000)
+    parser.add_argument('--meets', type=int, default=5)
+    parser.add_argument('--clients', type=int, default=50,
+                        help="concurrent connections (default: %(default)s)")
+    parser.add_argument('--seconds', type=float, default=10,
+                        help="how long to run (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="JSON file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as league:
+        service = None
+        if args.url:
+            url = urlsplit(args.url)
+            host, port = url.hostname, url.port or 80
+        else:
+            print(f"Analyzing a league of {args.students:,} students...",
+                  file=sys.stderr)
+            build_league(league, args.students, args.meets, args.seed)
+            host, port = '127.0.0.1', free_port()
+            service = start_service(league, port)
+
+        try:
+            paths = query_paths(host, port, args.year)
+            print(f"Requesting {len(paths):,} URLs from {args.clients} "
+                  f"clients for {args.seconds:g} s...", file=sys.stderr)
+            results = asyncio.run(run_clients(host, port, paths,
+                                              args.clients, args.seconds,
+                                              args.seed))
+        finally:
+            if service is not None:
+                service.terminate()
+                service.wait()
+
+    results.update(clients=args.clients, urls=len(paths),
+                   students=None if args.url else args.students,
+                   meets=None if args.url else args.meets)
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump(results, outfile, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,424 @@
+""" Command line interface for the MCML statisticians.
+
+Usage:
+    python -m mcmlstats create-meet 2021 1
+    python -m mcmlstats setup-season 2021
+    python -m mcmlstats analyze 2021 1
+    python -m mcmlstats rebuild 2020 2021 --meets 1 2 3
+    python -m mcmlstats live 2021 1
+    python -m mcmlstats validate 2021 1
+    python -m mcmlstats reconcile suggest
+    python -m mcmlstats serve
+    python -m mcmlstats archive build
+    python -m mcmlstats scoring
+
+Nothing here imports tkinter, and pandas is only imported once a command that
+needs it runs, so the program starts quickly on a server or from cron. """
+import argparse
+import os
+import sys
+
+
+DEFAULT_CATEGORIES = 'Default Categories.csv'
+
+# How much longer than the Python interpreter alone ('python -c pass')
+# 'python -m mcmlstats --help' may take to run, in milliseconds. It takes
+# 40 to 50 ms, most of it argparse, where importing pandas would add several
+# hundred. The interpreter's own startup varies too much from machine to
+# machine to budget for.
+STARTUP_BUDGET_MS = 60
+
+
+def read_default_categories(path: str = DEFAULT_CATEGORIES) \
+        -> dict[int, list[str]]:
+    """ Reads the default categories file, in which each row is a meet number
+    followed by that meet's categories, into a dictionary keyed by meet. """
+    from csv import reader
+
+    categories = {}
+    with open(path, 'r') as infile:
+        csv_reader = reader(infile)
+        for row in csv_reader:
+            categories[int(row[0])] = row[1:]
+    return categories
+
+
+def error_message(err: Exception) -> str:
+    """ The message to show the user for an error. The program's own errors
+    carry it as their first argument, while the ones the operating system
+    raises start with an error number, so those are shown whole. """
+    if len(err.args) == 1 and isinstance(err.args[0], str):
+        return err.args[0]
+    return str(err)
+
+
+def create_meet(args: argparse.Namespace) -> None:
+    categories = args.categories
+    if not categories:
+        try:
+            categories = read_default_categories()[args.meet]
+        except (FileNotFoundError, KeyError):
+            raise FileNotFoundError(
+                f"No categories were given for Meet {args.meet} and none were "
+                f"found for it in '{DEFAULT_CATEGORIES}'.\n\nEither list the "
+                "categories after --categories or add a row for the meet to "
+                "that file.")
+
+    import data_functions
+    data_functions.create_meet_file(args.year, args.meet, categories)
+    print(f"Created ./{args.year}/Meet {args.meet}.csv")
+
+
+def setup_season(args: argparse.Namespace) -> None:
+    try:
+        categories = read_default_categories()
+    except FileNotFoundError:
+        raise FileNotFoundError(
+            f"'{DEFAULT_CATEGORIES}' was not found.\n\nIt needs a row for "
+            "each meet: the meet number followed by its categories.")
+    if args.meets:
+        missing = [meet for meet in args.meets if meet not in categories]
+        if missing:
+            raise FileNotFoundError(
+                f"No categories were found in '{DEFAULT_CATEGORIES}' for "
+                "Meet(s) " + ", ".join(str(meet) for meet in missing) + ".")
+        categories = {meet: categories[meet] for meet in args.meets}
+
+    import data_functions
+    for path in data_functions.setup_season(args.year, categories):
+        print(f"Created {path}")
+
+
+def analyze(args: argparse.Namespace) -> None:
+    import data_functions
+    if args.verbose:
+        import logging
+        logging.basicConfig(level=logging.INFO, format='%(message)s')
+    if args.stream:
+        if args.intervals or args.bundle or args.profile:
+            raise ValueError("--stream can't be combined with --intervals, "
+                             "--bundle or --profile.")
+        for path in data_functions.stream_meet(args.year, args.meet,
+                                               args.chunksize, args.rerun):
+            print(f"Wrote {path}")
+        return
+
+    written = data_functions.create_reports(
+        args.year, args.meet, profile=args.profile,
+        use_cache=not args.no_cache, intervals=args.intervals,
+        rerun=args.rerun, bundle=args.bundle)
+    if not args.rerun:
+        print(f"Created the reports and data files in ./{args.year}/"
+              f"Meet {args.meet}")
+    elif written:
+        print(f"Updated {len(written)} file(s):")
+        for path in written:
+            print(path)
+    else:
+        print("Every file was already up to date")
+
+
+def validate(args: argparse.Namespace) -> None:
+    import data_functions
+    import validation
+
+    scores_path = f'./{args.year}/Meet {args.meet}.csv'
+    if not os.path.exists(scores_path):
+        raise FileNotFoundError(f"'{scores_path}' was not found.")
+
+    report = validation.validate(
+        data_functions.read_data_file(scores_path, has_scores=True))
+    if report.ok:
+        print(f"{scores_path} has no problems")
+        return
+    report.problems().to_csv(sys.stdout, index=False)
+    raise SystemExit(1)
+
+
+def rebuild(args: argparse.Namespace) -> None:
+    import batch_stats
+    results = batch_stats.calculate_batch_stats(args.years, args.meets)
+    for path in batch_stats.write_batch_stats(results):
+        print(path)
+
+
+def live(args: argparse.Namespace) -> None:
+    import live_scoring
+
+    scores_path = f'./{args.year}/Meet {args.meet}.csv'
+    if not os.path.exists(scores_path):
+        raise FileNotFoundError(f"'{scores_path}' was not found.")
+
+    def report(changes: dict[str, int]) -> None:
+        print(f"{changes['inserted']} inserted, {changes['edited']} edited, "
+              f"{changes['deleted']} deleted; "
+              f"{changes['recalculated']} ratings recalculated", flush=True)
+
+    def problem(message: str) -> None:
+        print(message, file=sys.stderr, flush=True)
+
+    paths = live_scoring.provisional_paths(args.year, args.meet)
+    print(f"Watching {scores_path}; provisional ratings go to "
+          f"{' and '.join(paths)}. Press Ctrl+C to stop.", flush=True)
+    try:
+        live_scoring.watch(args.year, args.meet, args.interval, report,
+                           on_problem=problem)
+    except KeyboardInterrupt:
+        pass
+
+
+def reconcile(args: argparse.Namespace) -> None:
+    import reconcile
+
+    path = args.file or reconcile.MERGES_FILENAME
+    if args.action == 'suggest':
+        suggestions = reconcile.suggest_merges()
+        suggestions.to_csv(path, index=False)
+        print(f"Wrote {len(suggestions)} suggested merges to {path}")
+    else:
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"'{path}' was not found. Run "
+                                    "'reconcile suggest' first.")
+        import pandas as pd
+        written = reconcile.apply_merges(pd.read_csv(path))
+        print(f"Applied the merges in {path}")
+        for written_path in written:
+            print(written_path)
+
+
+def archive(args: argparse.Namespace) -> None:
+    import history_archive
+
+    if args.action == 'build':
+        index = history_archive.build_archive()
+        print(f"Archived {len(index['meets'])} meets in "
+              f"{history_archive.ARCHIVE_DIRECTORY}")
+        return
+
+    history = history_archive.HistoryArchive()
+    if args.action == 'ratings':
+        trend = history.school_trend(args.school)
+    else:
+        trend = history.category_trend(args.school)
+    trend.to_csv(sys.stdout, index=False)
+
+
+def cache(args: argparse.Namespace) -> None:
+    import stats_cache
+    if args.action == 'clear':
+        print(f"Removed {stats_cache.clear()} cached results")
+    elif args.action == 'invalidate':
+        removed = 0
+        for path in args.files:
+            removed += stats_cache.invalidate(path)
+        print(f"Removed {removed} cached results")
+    else:
+        for name, value in stats_cache.cache_info().items():
+            print(f"{name}: {value}")
+
+
+def show_scoring(args: argparse.Namespace) -> None:
+    import json
+    import scoring
+    rules = scoring.load(args.file) if args.file else scoring.active()
+    print(json.dumps(rules.rules, indent=4))
+
+
+def serve(args: argparse.Namespace) -> None:
+    import stats_server
+    print(f"Serving the results in {os.path.abspath('.')} at "
+          f"http://{args.host}:{args.port}/years (Ctrl+C to stop)")
+    try:
+        stats_server.serve(host=args.host, port=args.port,
+                           cache_size=args.cache_size)
+    except KeyboardInterrupt:
+        pass
+
+
+def startup_check(args: argparse.Namespace) -> None:
+    """ Times 'python -m mcmlstats --help' against 'python -c pass', one
+    after the other in each run so both see the same machine load, and
+    fails if the median difference is over budget. """
+    import statistics
+    import subprocess
+    import time
+
+    def run(*arguments: str) -> float:
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *arguments], check=True,
+                       stdout=subprocess.DEVNULL)
+        return (time.perf_counter() - start) * 1000
+
+    timings, overheads = [], []
+    for _ in range(args.runs):
+        interpreter = run('-c', 'pass')
+        timings.append(run('-m', 'mcmlstats', '--help'))
+        overheads.append(timings[-1] - interpreter)
+
+    median = statistics.median(overheads)
+    print(f"--help median {statistics.median(timings):.1f} ms, "
+          f"{median:.1f} ms more than the interpreter alone, over "
+          f"{args.runs} runs (budget {args.budget} ms)")
+    if median > args.budget:
+        raise SystemExit(1)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='mcmlstats',
+        description="Create meet files and analyze meet data without the "
+        "GUI. Run from the directory that holds the year folders.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser(
+        'create-meet', help="create the scores file for a meet",
+        description="Create 'Meet N.csv' in the year's folder from its roster "
+        "(or last year's roster with the grades moved up).")
+    command.add_argument('year', type=int)
+    command.add_argument('meet', type=int)
+    command.add_argument('--categories', nargs='+',
+                         help="the meet's categories (default: the meet's row "
+                         f"in '{DEFAULT_CATEGORIES}')")
+    command.set_defaults(run=create_meet)
+
+    command = commands.add_parser(
+        'setup-season', help="create the scores files for every meet",
+        description="Create 'Meet N.csv' in the year's folder for every meet "
+        f"in '{DEFAULT_CATEGORIES}' from the roster (or last year's roster "
+        "with the grades moved up).")
+    command.add_argument('year', type=int)
+    command.add_argument('--meets', type=int, nargs='+',
+                         help="only these meets (default: every meet)")
+    command.set_defaults(run=setup_season)
+
+    command = commands.add_parser(
+        'analyze', help="calculate the stats and create the reports",
+        description="Calculate the stats for 'Meet N.csv' and create the "
+        "'Meet N' folder of data files and reports.")
+    command.add_argument('year', type=int)
+    command.add_argument('meet', type=int)
+    command.add_argument('-v', '--verbose', action='store_true',
+                         help="print each stage's timings as JSON")
+    command.add_argument('--profile', action='store_true',
+                         help="capture the run with cProfile and tracemalloc")
+    command.add_argument('--no-cache', action='store_true',
+                         help="recalculate even if the scores haven't changed")
+    command.add_argument('--intervals', action='store_true',
+                         help="also estimate 95%% bootstrap confidence "
+                         "intervals of the ratings")
+    command.add_argument('--rerun', action='store_true',
+                         help="update an analyzed meet, rewriting only the "
+                         "files that changed")
+    command.add_argument('--bundle', choices=['xlsx', 'parquet'],
+                         help="also write the results as an Excel workbook "
+                         "or as a zip of Parquet files")
+    command.add_argument('--stream', action='store_true',
+                         help="only write the ratings files, reading the "
+                         "scores a chunk at a time (for sheets too big to "
+                         "analyze in memory)")
+    command.add_argument('--chunksize', type=int, default=100_000,
+                         help="rows read at a time with --stream "
+                         "(default: %(default)s)")
+    command.set_defaults(run=analyze)
+
+    command = commands.add_parser(
+        'validate', help="list the problems in a meet's scores",
+        description="Check 'Meet N.csv' for the problems that stop it being "
+        "analyzed and list every one, with its row and column, as csv.")
+    command.add_argument('year', type=int)
+    command.add_argument('meet', type=int)
+    command.set_defaults(run=validate)
+
+    command = commands.add_parser(
+        'rebuild', help="recalculate the ratings of many meets at once",
+        description="Recalculate the ratings of the given meets (default: "
+        "all found) in the given years in one pass, and bring every file made "
+        "from them up to date.")
+    command.add_argument('years', type=int, nargs='+')
+    command.add_argument('--meets', type=int, nargs='+')
+    command.set_defaults(run=rebuild)
+
+    command = commands.add_parser(
+        'live', help="keep provisional ratings up to date during a meet",
+        description="Watch 'Meet N.csv' while scores are being entered and "
+        "rewrite the provisional ratings files beside it whenever it's saved."
+        )
+    command.add_argument('year', type=int)
+    command.add_argument('meet', type=int)
+    command.add_argument('--interval', type=float, default=2.0,
+                         help="seconds between checks (default: %(default)s)")
+    command.set_defaults(run=live)
+
+    command = commands.add_parser(
+        'reconcile', help="find and merge students listed under two IDs",
+        description="'suggest' writes the pairs of students who are probably "
+        "the same person to a csv file. Remove any rows you disagree with, "
+        "then 'apply' merges the rest.")
+    command.add_argument('action', choices=['suggest', 'apply'])
+    command.add_argument('file', nargs='?',
+                         help="the suggestions file (default: "
+                         "'Suggested Merges.csv')")
+    command.set_defaults(run=reconcile)
+
+    command = commands.add_parser(
+        'archive', help="build or query the archive of every season",
+        description="'build' compacts every analyzed meet into the "
+        "'History Archive' folder. 'ratings' and 'categories' print each "
+        "year's ratings or category ratings from it as csv.")
+    command.add_argument('action', choices=['build', 'ratings', 'categories'])
+    command.add_argument('--school', help="only this school's students")
+    command.set_defaults(run=archive)
+
+    command = commands.add_parser(
+        'cache', help="show or clear the cache of calculated stats",
+        description="Show the size of the stats cache, clear it, or remove "
+        "the cached results for particular scores files.")
+    command.add_argument('action', choices=['info', 'clear', 'invalidate'])
+    command.add_argument('files', nargs='*',
+                         help="scores files to invalidate, e.g. "
+                         "'2021/Meet 1.csv'")
+    command.set_defaults(run=cache)
+
+    command = commands.add_parser(
+        'scoring', help="show the scoring rules in use",
+        description="Check the scoring rules in 'Scoring.json' (or the "
+        "defaults, if there isn't one) and print them in full.")
+    command.add_argument('--file', help="check another rules file instead")
+    command.set_defaults(run=show_scoring)
+
+    command = commands.add_parser(
+        'serve', help="answer queries for ratings over HTTP",
+        description="Serve the meets' results, read-only, as JSON over HTTP. "
+        "See stats_server.py for the URLs it answers.")
+    command.add_argument('--host', default='127.0.0.1',
+                         help="address to listen on (default: %(default)s)")
+    command.add_argument('--port', type=int, default=8080,
+                         help="(default: %(default)s)")
+    command.add_argument('--cache-size', type=int, default=64,
+                         help="results files kept in memory "
+                         "(default: %(default)s)")
+    command.set_defaults(run=serve)
+
+    command = commands.add_parser(
+        'startup-check', help="check that this program starts quickly",
+        description="Time '--help' against starting Python alone and exit "
+        "with an error if the median difference is over the budget.")
+    command.add_argument('--runs', type=int, default=10)
+    command.add_argument('--budget', type=float, default=STARTUP_BUDGET_MS,
+                         help="milliseconds (default: %(default)s)")
+    command.set_defaults(run=startup_check)
+
+    return parser
+
+
+def main(argv: list[str] = None) -> None:
+    args = build_parser().parse_args(argv)
+    try:
+        args.run(args)
+    except (OSError, ValueError) as err:
+        print(error_message(err), file=sys.stderr)
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+""" Writes a meet's results files from the results held in memory.
+
+Turning numbers into csv text is the slow part of writing a results file,
+and the meet's files share columns: the roster is the first columns of the
+students' ratings, for one. CsvText formats each column of a DataFrame once,
+as an array of cells, and any selection of its columns is then written by
+joining those cells, byte for byte what DataFrame.to_csv would write. A
+column with few distinct values (names, schools, grades, scores) only has
+those values formatted. The files' contents are then written from a pool of
+threads, each skipped if the file already holds them.
+
+The results can also be written as one workbook with a sheet for each table,
+or as one zip of Parquet files, for anyone who'd rather not parse csv at
+all. """
+import importlib.util
+import io
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from data_functions import write_if_changed
+
+
+# The formats the results can also be written in, and the package each needs
+BUNDLE_FORMATS = {
+    'xlsx': ['openpyxl', 'xlsxwriter'],
+    'parquet': ['pyarrow', 'fastparquet'],
+}
+
+# Excel doesn't allow longer sheet names
+SHEET_NAME_LIMIT = 31
+
+
+def column_text(values: pd.Series) -> np.ndarray:
+    """ Returns the column's values as the cells to_csv would write for
+    them, quoting included, with '' for blanks. """
+    if values.dtype == np.float64:
+        # Python's repr is what to_csv writes for a float
+        text = np.array(list(map(repr, values.tolist())), dtype=object)
+        text[values.isna().to_numpy()] = ''
+        return text
+
+    if pd.api.types.is_integer_dtype(values.dtype) and \
+            not isinstance(values.dtype, pd.CategoricalDtype):
+        blank = values.isna().to_numpy()
+        text = values.to_numpy(dtype=np.int64, na_value=0).astype(str) \
+            .astype(object)
+        text[blank] = ''
+        return text
+
+    # Everything else has each distinct value formatted by to_csv itself.
+    # A second column keeps a lone blank from being quoted.
+    codes, uniques = pd.factorize(values)
+    lines = _csv_lines(uniques)
+    if len(lines) != len(uniques):
+        # A value with a line break in it spans lines
+        lines = [_csv_lines(uniques[i:i + 1])[0] for i in range(len(uniques))]
+    return np.array([line[:-2] for line in lines] + [''], dtype=object)[codes]
+
+
+def _csv_lines(uniques) -> list[str]:
+    text = pd.DataFrame({'value': uniques, 'end': 0}).to_csv(
+        index=False, header=False, lineterminator='\n')
+    if len(uniques) == 1:
+        return [text[:-1]]
+    return text.split('\n')[:-1]
+
+
+class CsvText:
+    ''' A DataFrame's columns formatted for csv, each at most once. '''
+
+    def __init__(self, data: pd.DataFrame):
+        self.data = data
+        self.cells = {}
+
+    def column(self, column: str) -> np.ndarray:
+        if column not in self.cells:
+            self.cells[column] = column_text(self.data[column])
+        return self.cells[column]
+
+    def csv(self, columns: list[str] = None) -> bytes:
+        """ The csv file of the given columns (all of them by default), as
+        to_csv(index=False) would write it. """
+        if columns is None:
+            columns = list(self.data.columns)
+        header = pd.DataFrame(columns=columns).to_csv(
+            index=False, lineterminator=os.linesep)
+        rows = map(','.join, zip(*(self.column(column)
+                                   for column in columns)))
+        if len(columns) == 1:
+            # The csv module quotes a blank that is the whole row
+            rows = (row or '""' for row in rows)
+        body = os.linesep.join(rows)
+        if len(self.data):
+            body += os.linesep
+        return (header + body).encode('utf-8')
+
+
+def write_files(contents: dict[str, bytes], workers: int = None) -> list[str]:
+    """ Writes each file's contents with write_if_changed, in parallel
+    threads. Returns the paths of the files written. """
+    with ThreadPoolExecutor(workers) as executor:
+        written = list(executor.map(write_if_changed, contents,
+                                    contents.values()))
+    return [path for path, wrote in zip(contents, written) if wrote]
+
+
+def bundle_package(bundle: str) -> str:
+    """ Returns the installed package that writes the bundle format, or
+    raises ValueError if there isn't one. """
+    if bundle not in BUNDLE_FORMATS:
+        raise ValueError(f"Results can't be bundled as '{bundle}'. Choose "
+                         + " or ".join(BUNDLE_FORMATS) + ".")
+    for package in BUNDLE_FORMATS[bundle]:
+        if importlib.util.find_spec(package):
+            return package
+    raise ValueError(
+        f"Writing the results as {bundle} needs one of the packages "
+        + ", ".join(BUNDLE_FORMATS[bundle]) + f".\n\nInstall one with "
+        f"'pip install {BUNDLE_FORMATS[bundle][0]}'.")
+
+
+def bundle_contents(tables: dict[str, pd.DataFrame], prefix: str,
+                    bundle: str) -> dict[str, bytes]:
+    """ Returns the file, by path, that holds the tables (keyed by name) in
+    the bundle format: '<prefix> Results.xlsx' with a sheet for each table,
+    or, since a Parquet file holds only one table, '<prefix>
+    Results.parquet.zip' with a '<name>.parquet' file for each. """
+    package = bundle_package(bundle)
+    if bundle == 'xlsx':
+        workbook_file = io.BytesIO()
+        with pd.ExcelWriter(workbook_file, engine=package) as workbook:
+            for name, table in tables.items():
+                table.to_excel(workbook, sheet_name=name[:SHEET_NAME_LIMIT],
+                               index=False)
+        return {f'{prefix} Results.xlsx': workbook_file.getvalue()}
+
+    # Parquet files are compressed already, so they're stored as they are
+    archive_file = io.BytesIO()
+    with zipfile.ZipFile(archive_file, 'w', zipfile.ZIP_STORED) as archive:
+        for name, table in tables.items():
+            table_file = io.BytesIO()
+            table.to_parquet(table_file, engine=package, index=False)
+            # A fixed date keeps the bundle identical when nothing changed
+            info = zipfile.ZipInfo(f'{name}.parquet',
+                                   date_time=(1980, 1, 1, 0, 0, 0))
+            archive.writestr(info, table_file.getvalue())
+    return {f'{prefix} Results.parquet.zip': archive_file.getvalue()}
@@ -0,0 +1,225 @@
+""" Finds students who are probably the same person under two Student IDs,
+usually because of a typo in a name, school or grade in one meet's file, and
+merges them.
+
+Rather than comparing every student with every other, only likely pairs are
+compared: students at the same school in the same graduating class, and
+students whose normalized names sort near each other. The number of pairs is
+close to linear in the number of students.
+
+    python -m mcmlstats reconcile suggest
+    python -m mcmlstats reconcile apply
+
+suggest writes 'Suggested Merges.csv'. Delete the rows of any students who
+really are different people, then apply merges the rest all at once. """
+import difflib
+import glob
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+import season_store
+from data_functions import STUDENT_ID, read_data_file, \
+    write_cumulative_ratings
+from student_registry import StudentRegistry
+
+
+MERGES_FILENAME = 'Suggested Merges.csv'
+
+# How alike two names in the same school and class must be, from 0 to 1
+MATCH_THRESHOLD = 0.85
+
+# How many neighbors each student is compared with in the sorted names
+WINDOW = 5
+
+KEEP_ID = 'Keep ID'
+MERGE_ID = 'Merge ID'
+SIMILARITY = 'Similarity'
+
+
+def normalize(names: pd.Series) -> pd.Series:
+    """ Lowercases the names and strips accents and anything that isn't a
+    letter, so 'O'Brien' and 'obrien' match. """
+    return names.astype(str).str.normalize('NFKD') \
+        .str.encode('ascii', 'ignore').str.decode('ascii').str.lower() \
+        .str.replace('[^a-z]', '', regex=True)
+
+
+def candidate_pairs(students: pd.DataFrame) -> np.ndarray:
+    """ Returns the pairs of rows of students (as an n x 2 array of positions,
+    smaller first) that are worth comparing: those in the same school and
+    graduating class, and those within WINDOW of each other when sorted by
+    last then first name or by first then last name. """
+    rows = pd.DataFrame({'row': np.arange(len(students)),
+                         'school': students['school'].to_numpy(),
+                         'class_of': students['class_of'].to_numpy()})
+    blocked = rows.merge(rows, on=['school', 'class_of'])
+    blocked = blocked[blocked['row_x'] < blocked['row_y']]
+    pairs = [blocked[['row_x', 'row_y']].to_numpy()]
+
+    last = normalize(students['last_name']).to_numpy()
+    first = normalize(students['first_name']).to_numpy()
+    for keys in ((first, last), (last, first)):
+        # lexsort sorts by its last key first
+        order = np.lexsort(keys)
+        for offset in range(1, WINDOW + 1):
+            pairs.append(np.column_stack([order[:-offset], order[offset:]]))
+
+    pairs = np.concatenate(pairs).astype(np.int64)
+    pairs.sort(axis=1)
+
+    # Drop repeated pairs, encoded as one integer each for speed
+    encoded = pd.unique(pairs[:, 0] * len(students) + pairs[:, 1])
+    return np.column_stack([encoded // len(students),
+                            encoded % len(students)])
+
+
+def letter_counts(names: np.ndarray) -> np.ndarray:
+    """ Returns how many of each letter, and spaces, are in each normalized
+    name, as an n x 27 array. """
+    counts = np.zeros((len(names), 27), dtype=np.int16)
+    codes = np.frombuffer(''.join(names).encode('ascii'), dtype=np.uint8)
+    rows = np.repeat(np.arange(len(names)),
+                     np.char.str_len(names.astype(str)))
+    columns = np.where(codes == ord(' '), 26, codes - ord('a'))
+    np.add.at(counts, (rows, columns), 1)
+    return counts
+
+
+def name_similarity(first: str, second: str) -> float:
+    """ How alike two normalized names are, from 0 to 1. """
+    return difflib.SequenceMatcher(None, first, second).ratio()
+
+
+def suggest_merges() -> pd.DataFrame:
+    """ Returns a row for each pair of Student IDs that are probably the same
+    student, with the ID to keep, the ID to merge into it, how alike their
+    names are and the details of both. The ID kept is the one with more
+    ratings. Students who both competed in the same meet are never suggested.
+    """
+    with StudentRegistry() as registry:
+        students = registry.frame()
+
+    columns = [KEEP_ID, MERGE_ID, SIMILARITY] + [
+        f'{which} {detail}' for which in ('Keep', 'Merge')
+        for detail in ('Last Name', 'First Name', 'School', 'Class Of')]
+    if len(students) < 2:
+        return pd.DataFrame(columns=columns)
+
+    # The meets each student competed in, across every year
+    competed = {}
+    for year in stored_years():
+        rated = season_store.rated_meets(year)
+        for student_id, meet in rated.itertuples(index=False):
+            competed.setdefault(student_id, set()).add((year, meet))
+
+    last = normalize(students['last_name']).to_numpy().astype(str)
+    first = normalize(students['first_name']).to_numpy().astype(str)
+    names = np.char.add(np.char.add(last, ' '), first)
+    swapped = np.char.add(np.char.add(first, ' '), last)
+    ids = students['student_id'].to_numpy()
+
+    # Compare integer codes rather than strings
+    codes = pd.factorize(np.concatenate([names, swapped]))[0]
+    name_codes, swapped_codes = codes[:len(names)], codes[len(names):]
+    schools = pd.factorize(students['school'])[0]
+    classes = students['class_of'].to_numpy()
+
+    # Narrow the pairs down with array operations before comparing names one
+    # pair at a time. Within a school and class, names may differ by a typo;
+    # otherwise the school or grade was the typo and the names must match.
+    a, b = candidate_pairs(students).T
+    same_block = (schools[a] == schools[b]) & (classes[a] == classes[b])
+    same_name = (name_codes[a] == name_codes[b]) | \
+        (swapped_codes[a] == name_codes[b])
+    either = (schools[a] == schools[b]) | (classes[a] == classes[b])
+
+    # An upper bound on the similarity from the letters the names share,
+    # which is the same for a name and its swap
+    counts = letter_counts(names)
+    shared = np.minimum(counts[a], counts[b]).sum(axis=1)
+    lengths = counts.sum(axis=1)
+    bound = 2 * shared / (lengths[a] + lengths[b])
+
+    likely = (same_block & (bound >= MATCH_THRESHOLD)) | (either & same_name)
+
+    suggestions = []
+    for left, right, blocked in zip(a[likely], b[likely], same_block[likely]):
+        if name_codes[left] == name_codes[right] or \
+                swapped_codes[left] == name_codes[right]:
+            similarity = 1.0
+        elif blocked:
+            similarity = max(name_similarity(names[left], names[right]),
+                             name_similarity(swapped[left], names[right]))
+            if similarity < MATCH_THRESHOLD:
+                continue
+        else:
+            continue
+
+        meets_left = competed.get(ids[left], set())
+        meets_right = competed.get(ids[right], set())
+        if meets_left & meets_right:
+            continue
+
+        kept, merged = (left, right) if (len(meets_left), -ids[left]) >= \
+            (len(meets_right), -ids[right]) else (right, left)
+        suggestions.append(
+            [ids[kept], ids[merged], round(similarity, 3)] +
+            [students.iloc[row][detail] for row in (kept, merged)
+             for detail in ('last_name', 'first_name', 'school',
+                            'class_of')])
+
+    return pd.DataFrame(suggestions, columns=columns)
+
+
+def stored_years() -> list[int]:
+    """ Returns the years that have a season store. """
+    years = []
+    for path in glob.glob(f'./*/{season_store.STORE_FILENAME}'):
+        year = os.path.basename(os.path.dirname(path))
+        if year.isdigit():
+            years.append(int(year))
+    return sorted(years)
+
+
+def apply_merges(merges: pd.DataFrame) -> list[str]:
+    """ Merges each MERGE_ID into its KEEP_ID: the registry resolves the
+    merged ID and name to the kept ID from now on, every season store moves
+    the merged ID's ratings over, and every cumulative ratings file is
+    rewritten. Rosters listing a merged ID have it replaced, or the row
+    dropped if the kept ID is listed too. Returns the files rewritten. """
+    merges = dict(zip(merges[MERGE_ID].astype(int),
+                      merges[KEEP_ID].astype(int)))
+    if not merges:
+        return []
+
+    with StudentRegistry() as registry:
+        registry.merge(merges)
+        resolved = {student_id: registry.canonical(student_id)
+                    for student_id in merges}
+
+    written = []
+    for path in glob.glob('./*/roster.csv'):
+        roster = read_data_file(path)
+        if STUDENT_ID not in roster:
+            continue
+        merged = roster[STUDENT_ID].isin(list(resolved))
+        if not merged.any():
+            continue
+        duplicate = merged & roster[STUDENT_ID].map(resolved).isin(
+            roster[STUDENT_ID])
+        roster = roster[~duplicate].copy()
+        roster[STUDENT_ID] = roster[STUDENT_ID].replace(resolved)
+        roster.to_csv(path, index=False)
+        written.append(path)
+
+    for year in stored_years():
+        season_store.merge_students(year, resolved)
+        for path in glob.glob(f'./{year}/Cumulative Ratings - Meet *.csv'):
+            match = re.search(r'Meet (\d+)\.csv$', path)
+            if match:
+                if write_cumulative_ratings(year, int(match.group(1))):
+                    written.append(path)
+    return written
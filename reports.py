@@ -0,0 +1,291 @@
+""" PDF reports for a meet: one for every school and one for every student.
+
+The layout of each kind of report comes from a small template in the
+report_templates folder. Each template is parsed once per process and cached.
+Reports are rendered across a pool of processes and collected into a single
+'Meet N Reports.zip' bundle along with a csv of how long each one took. """
+import functools
+import io
+import math
+import os
+import re
+import string
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from data_functions import COUNT, FINAL_RATING, FIRST_NAME, GRADE, \
+    LAST_NAME, RATINGS, SCHOOL, TOTAL, score_columns, write_if_changed
+
+
+TEMPLATE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                  'report_templates')
+SCHOOL_REPORT = 'school'
+STUDENT_REPORT = 'student'
+
+# Reports take about a tenth of a millisecond each to render while starting a
+# process pool takes a good fraction of a second, so below this many reports
+# they're rendered in this process.
+SERIAL_LIMIT = 2000
+
+# Page layout, in points
+PAGE_WIDTH = 612
+PAGE_HEIGHT = 792
+MARGIN = 54
+LINE_SPACING = 1.3
+TABLE_FONT = ('Courier', 10)
+
+FONTS = ['Helvetica', 'Helvetica-Bold', 'Courier']
+
+
+@functools.lru_cache(maxsize=None)
+def load_template(name: str) -> tuple:
+    """ Parses the named layout template into a tuple of operations. Each is
+    one of ('font', name, size), ('space', points), ('table', name) or
+    ('text', string.Template). """
+    operations = []
+    with open(os.path.join(TEMPLATE_DIRECTORY, f'{name}.txt'), 'r') as infile:
+        for line in infile.read().splitlines():
+            if line.startswith('#'):
+                continue
+
+            if not line.startswith('@'):
+                operations.append(('text', string.Template(line)))
+                continue
+
+            directive, *args = line[1:].split()
+            if directive == 'font' and len(args) == 2 and args[0] in FONTS:
+                operations.append(('font', args[0], float(args[1])))
+            elif directive == 'space' and len(args) == 1:
+                operations.append(('space', float(args[0])))
+            elif directive == 'table' and len(args) == 1:
+                operations.append(('table', args[0]))
+            else:
+                raise ValueError(f"Unknown layout directive in the '{name}' "
+                                 f"report template: {line}")
+
+    return tuple(operations)
+
+
+def render_report(job: tuple) -> tuple[str, bytes, float]:
+    """ Renders one report. job is (file name, template name, fields, tables)
+    where fields fills in the template's text and tables maps each table's
+    name to its rows, the first row being the headings. Returns the file name,
+    the PDF and the seconds it took. """
+    start = time.perf_counter()
+    filename, template, fields, tables = job
+
+    pages = [[]]
+    y = PAGE_HEIGHT - MARGIN
+    font, size = 'Helvetica', 12.0
+
+    def place(text, font, size):
+        nonlocal y
+        if y - size < MARGIN:
+            pages.append([])
+            y = PAGE_HEIGHT - MARGIN
+        y -= size
+        pages[-1].append((MARGIN, y, font, size, text))
+        y -= size * (LINE_SPACING - 1)
+
+    for operation in load_template(template):
+        if operation[0] == 'font':
+            font, size = operation[1], operation[2]
+        elif operation[0] == 'space':
+            y -= operation[1]
+        elif operation[0] == 'table':
+            for line in format_table(tables.get(operation[1], [])):
+                place(line, *TABLE_FONT)
+        else:
+            place(operation[1].safe_substitute(fields), font, size)
+
+    pdf = pdf_document(pages)
+    return filename, pdf, time.perf_counter() - start
+
+
+def format_table(rows: list[list[str]]) -> list[str]:
+    """ Lays out rows of text as fixed width lines, the first row being the
+    headings which are underlined. """
+    if not rows:
+        return []
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    lines = ['  '.join(cell.ljust(width) for cell, width in zip(row, widths))
+             .rstrip() for row in rows]
+    lines.insert(1, '  '.join('-' * width for width in widths))
+    return lines
+
+
+def pdf_document(pages: list[list[tuple]]) -> bytes:
+    """ Writes a minimal PDF in which each page is a list of
+    (x, y, font, size, text) lines using the standard PDF fonts. """
+    objects = []
+    font_ids = {font: 3 + i for i, font in enumerate(FONTS)}
+    first_page_id = 3 + len(FONTS)
+    page_ids = [first_page_id + 2*i for i in range(len(pages))]
+
+    objects.append(b'<< /Type /Catalog /Pages 2 0 R >>')
+    kids = ' '.join(f'{page_id} 0 R' for page_id in page_ids)
+    objects.append(f'<< /Type /Pages /Kids [{kids}] '
+                   f'/Count {len(pages)} >>'.encode())
+    for font in FONTS:
+        objects.append(f'<< /Type /Font /Subtype /Type1 /BaseFont /{font} '
+                       '/Encoding /WinAnsiEncoding >>'.encode())
+
+    resources = ' '.join(f'/F{font_ids[font]} {font_ids[font]} 0 R'
+                         for font in FONTS)
+    for page_id, lines in zip(page_ids, pages):
+        objects.append(
+            f'<< /Type /Page /Parent 2 0 R '
+            f'/MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] '
+            f'/Resources << /Font << {resources} >> >> '
+            f'/Contents {page_id + 1} 0 R >>'.encode())
+
+        content = b''.join(
+            f'BT /F{font_ids[font]} {size:g} Tf {x:g} {y:g} Td ('.encode()
+            + escape_pdf_text(text) + b') Tj ET\n'
+            for x, y, font, size, text in lines)
+        objects.append(f'<< /Length {len(content)} >>\nstream\n'.encode()
+                       + content + b'endstream')
+
+    document = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(document))
+        document += f'{number} 0 obj\n'.encode() + body + b'\nendobj\n'
+
+    xref = len(document)
+    document += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode()
+    for offset in offsets:
+        document += f'{offset:010d} 00000 n \n'.encode()
+    document += (f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n'
+                 f'startxref\n{xref}\n%%EOF\n').encode()
+    return bytes(document)
+
+
+def escape_pdf_text(text: str) -> bytes:
+    encoded = text.encode('cp1252', errors='replace')
+    return encoded.replace(b'\\', b'\\\\').replace(b'(', b'\\(') \
+        .replace(b')', b'\\)')
+
+
+def format_number(value, digits: int = 3) -> str:
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ''
+    if float(value).is_integer():
+        return str(int(value))
+    return f'{value:.{digits}f}'
+
+
+def safe_filename(name: str) -> str:
+    return re.sub(r'[\\/:*?"<>|]+', '_', name).strip() or '_'
+
+
+def report_jobs(student_data: pd.DataFrame, category_data: pd.DataFrame,
+                year: int, meet: int) -> list[tuple]:
+    """ Builds the rendering job for every school and student report. """
+    categories = score_columns(student_data.keys())
+    category_table = [['Category', COUNT, TOTAL, RATINGS]] + [
+        [str(row['Category']), format_number(row[COUNT]),
+         format_number(row[TOTAL]), format_number(row[RATINGS])]
+        for _, row in category_data.iterrows()]
+    category_ratings = dict(zip(category_data['Category'],
+                                category_data[RATINGS]))
+
+    jobs = []
+    ranked = student_data.sort_values(FINAL_RATING, ascending=False,
+                                      kind='stable')
+    for school, students in ranked.groupby(SCHOOL, sort=True, observed=True):
+        rows = [[LAST_NAME, FIRST_NAME, GRADE, FINAL_RATING]] + [
+            [str(last), str(first), format_number(grade),
+             format_number(rating)]
+            for last, first, grade, rating in students[
+                [LAST_NAME, FIRST_NAME, GRADE, FINAL_RATING]].itertuples(
+                    index=False)]
+        fields = {'school': school, 'year': year, 'meet': meet,
+                  'student_count': len(students)}
+        tables = {'categories': category_table, 'students': rows}
+        jobs.append((f'Schools/{safe_filename(str(school))}.pdf',
+                     SCHOOL_REPORT, fields, tables))
+
+    used = set()
+    for student in student_data.to_dict('records'):
+        scores = [['Category', 'Score', RATINGS]] + [
+            [str(category), format_number(student[category]),
+             format_number(category_ratings.get(category))]
+            for category in categories
+            if not pd.isna(student[category])]
+        points = sum(student[category] for category in categories
+                     if not pd.isna(student[category]))
+        fields = {'last_name': student[LAST_NAME],
+                  'first_name': student[FIRST_NAME],
+                  'grade': format_number(student[GRADE]),
+                  'school': student[SCHOOL], 'year': year, 'meet': meet,
+                  'points': format_number(points),
+                  'final_rating': format_number(student[FINAL_RATING])}
+
+        name = safe_filename(f'{student[LAST_NAME]}, {student[FIRST_NAME]} '
+                             f'(Grade {fields["grade"]})')
+        filename = f'Students/{safe_filename(str(student[SCHOOL]))}/{name}'
+        duplicate = 1
+        while filename in used:
+            duplicate += 1
+            filename = f'Students/{safe_filename(str(student[SCHOOL]))}/' \
+                f'{name} {duplicate}'
+        used.add(filename)
+        jobs.append((f'{filename}.pdf', STUDENT_REPORT, fields,
+                     {'scores': scores}))
+
+    return jobs
+
+
+def _load_templates() -> None:
+    """ Parses the templates when a worker process starts. """
+    load_template(SCHOOL_REPORT)
+    load_template(STUDENT_REPORT)
+
+
+def render_reports(jobs: list[tuple], workers: int = None):
+    """ Renders every job, across a pool of processes when there are enough
+    of them to be worth it. Yields (file name, PDF, seconds) in job order. """
+    workers = workers or os.cpu_count() or 1
+    if len(jobs) < SERIAL_LIMIT or workers == 1:
+        _load_templates()
+        yield from map(render_report, jobs)
+        return
+
+    chunksize = max(1, len(jobs) // (workers * 4))
+    with ProcessPoolExecutor(workers, initializer=_load_templates) as pool:
+        yield from pool.map(render_report, jobs, chunksize=chunksize)
+
+
+def write_report_bundle(student_data: pd.DataFrame,
+                        category_data: pd.DataFrame, year: int, meet: int,
+                        prefix: str, workers: int = None) -> list[str]:
+    """ Renders all of the meet's reports into '<prefix> Reports.zip' and
+    writes how long each took to '<prefix> Report Timings.csv'. The bundle is
+    built in memory and only written if it differs from the one already
+    there, and the timings only along with it. Returns the files written. """
+    jobs = report_jobs(student_data, category_data, year, meet)
+
+    timings = []
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as bundle:
+        for filename, pdf, seconds in render_reports(jobs, workers):
+            # A fixed date keeps the bundle identical when nothing changed
+            info = zipfile.ZipInfo(filename, date_time=(1980, 1, 1, 0, 0, 0))
+            info.compress_type = zipfile.ZIP_DEFLATED
+            bundle.writestr(info, pdf)
+            timings.append((filename, seconds, len(pdf)))
+
+    bundle_path = f'{prefix} Reports.zip'
+    timings_path = f'{prefix} Report Timings.csv'
+    if not write_if_changed(bundle_path, buffer.getvalue()) and \
+            os.path.exists(timings_path):
+        return []
+
+    timings = pd.DataFrame(timings, columns=['File', 'Seconds', 'Bytes'])
+    timings.to_csv(timings_path, index=False)
+    return [bundle_path, timings_path]
@@ -0,0 +1,243 @@
+""" The league's scoring rules: how many score columns a meet file has, how
+many categories each student plays, and the formulas that turn scores into
+ratings.
+
+The MCML's own rules are the defaults. A league with other rules puts them
+in 'Scoring.json' next to the year folders, giving only what differs, for
+example:
+
+    {
+        "score_columns": 4,
+        "categories_played": 2,
+        "constants": {"weight_a": 0.75},
+        "student_formulas": {
+            "rating_a": "total / rating_sum",
+            "rating_b": "relative_sum / categories_played",
+            "final": "weight_a * rating_a + (1 - weight_a) * rating_b"
+        }
+    }
+
+Each formula is an arithmetic expression checked and compiled once, then
+evaluated on whole arrays, so it's applied to every student (or category) of
+a sheet at once just as hand-written NumPy would be. The category formula
+sees each category's count (students who played it) and total (their
+points). The student formulas are evaluated in order, and each sees the
+student's total (points), rating_sum (the ratings of the categories they
+played added up), relative_sum (their score in each category divided by its
+rating, added up), played (how many categories they played), the formulas
+before it, categories_played and the constants. The last is the Final
+Individual Rating. The functions where, minimum, maximum, abs, sqrt, log
+and exp may be used too.
+
+    python -m mcmlstats scoring
+
+prints the rules in use. """
+import ast
+import json
+import os
+
+import numpy as np
+
+
+SCORING_FILE = 'Scoring.json'
+
+DEFAULT_SCORING = {
+    # The student's details (names, grade and school) come before the scores
+    'details_columns': 4,
+    'score_columns': 6,
+    'categories_played': 3,
+    'min_score': 0,
+    'max_score': 6,
+    'constants': {},
+    'category_formula': 'total / count * 5',
+    'student_formulas': {
+        'rating_a': 'total / rating_sum',
+        'rating_b': 'relative_sum / categories_played',
+        'final': '(rating_a + rating_b) / 2',
+    },
+}
+
+CATEGORY_INPUTS = ['count', 'total']
+STUDENT_INPUTS = ['total', 'rating_sum', 'relative_sum', 'played']
+
+FUNCTIONS = {
+    'where': np.where,
+    'minimum': np.minimum,
+    'maximum': np.maximum,
+    'abs': np.abs,
+    'sqrt': np.sqrt,
+    'log': np.log,
+    'exp': np.exp,
+}
+
+# The parts an expression may be made of
+ALLOWED_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Compare, ast.Call, ast.Name,
+    ast.Load, ast.Constant, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow,
+    ast.USub, ast.UAdd, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq,
+)
+
+# The scoring rules last loaded, with the file's path and modification time
+_loaded = {}
+
+
+class Formula:
+    ''' One formula of the scoring rules, compiled. names is every name it
+    may use; the ones it does use are kept in inputs. '''
+
+    def __init__(self, name: str, text: str, names: set[str]):
+        try:
+            tree = ast.parse(text.strip(), mode='eval')
+        except (SyntaxError, AttributeError):
+            raise ValueError(f"The scoring formula {name} ({text!r}) isn't "
+                             "an expression.")
+
+        self.inputs = set()
+        for node in ast.walk(tree):
+            if not isinstance(node, ALLOWED_NODES):
+                raise ValueError(
+                    f"The scoring formula {name} ({text!r}) can only use "
+                    "numbers, names, + - * / **, comparisons and the "
+                    "functions " + ", ".join(FUNCTIONS) + ".")
+            if isinstance(node, ast.Call) and \
+                    not (isinstance(node.func, ast.Name) and
+                         node.func.id in FUNCTIONS and not node.keywords):
+                raise ValueError(
+                    f"The scoring formula {name} ({text!r}) can only call "
+                    + ", ".join(FUNCTIONS) + ".")
+            if isinstance(node, ast.Constant) and \
+                    not isinstance(node.value, (int, float)):
+                raise ValueError(f"The scoring formula {name} ({text!r}) has "
+                                 f"a value that isn't a number.")
+            if isinstance(node, ast.Name) and node.id not in FUNCTIONS:
+                if node.id not in names:
+                    raise ValueError(
+                        f"The scoring formula {name} ({text!r}) uses "
+                        f"'{node.id}', which isn't one of "
+                        + ", ".join(sorted(names)) + ".")
+                self.inputs.add(node.id)
+
+        self.name = name
+        self.text = text
+        self.code = compile(tree, f'<scoring formula {name}>', 'eval')
+
+    def __call__(self, values: dict[str, np.ndarray]) -> np.ndarray:
+        return eval(self.code, {'__builtins__': {}, **FUNCTIONS}, values)
+
+
+class Scoring:
+    ''' A league's scoring rules, its formulas compiled. rules may give only
+    the settings that differ from DEFAULT_SCORING. '''
+
+    def __init__(self, rules: dict = None):
+        rules = dict(rules or {})
+        unknown = rules.keys() - DEFAULT_SCORING.keys()
+        if unknown:
+            raise ValueError("The scoring rules have no setting(s) "
+                             + ", ".join(map(repr, sorted(unknown))) + ".")
+        self.rules = {**DEFAULT_SCORING, **rules}
+
+        for setting in ('details_columns', 'score_columns',
+                        'categories_played', 'min_score', 'max_score'):
+            value = self.rules[setting]
+            if not isinstance(value, int) or isinstance(value, bool) or \
+                    value < 0:
+                raise ValueError(f"The scoring setting {setting} must be a "
+                                 f"whole number, not {value!r}.")
+        self.details_columns = self.rules['details_columns']
+        self.score_columns = self.rules['score_columns']
+        self.categories_played = self.rules['categories_played']
+        self.min_score = self.rules['min_score']
+        self.max_score = self.rules['max_score']
+        if not 0 < self.categories_played <= self.score_columns:
+            raise ValueError("Students must play at least one category and no "
+                             "more than there are score columns.")
+
+        self.constants = {'categories_played': self.categories_played}
+        for name, value in self.rules['constants'].items():
+            if not name.isidentifier() or name in FUNCTIONS or \
+                    name in STUDENT_INPUTS + CATEGORY_INPUTS or \
+                    not isinstance(value, (int, float)):
+                raise ValueError(f"The scoring constant {name!r} must be a "
+                                 "number with a name of its own.")
+            self.constants[name] = value
+
+        self.category_formula = Formula(
+            'category_formula', self.rules['category_formula'],
+            set(CATEGORY_INPUTS) | self.constants.keys())
+
+        if not self.rules['student_formulas']:
+            raise ValueError("The scoring rules need at least one student "
+                             "formula.")
+        names = set(STUDENT_INPUTS) | self.constants.keys()
+        self.student_formulas = []
+        for name, text in self.rules['student_formulas'].items():
+            if not name.isidentifier() or name in names or name in FUNCTIONS:
+                raise ValueError(f"The student formula {name!r} needs a name "
+                                 "of its own.")
+            self.student_formulas.append(Formula(name, text, names))
+            names.add(name)
+
+        # The student inputs the formulas use, so no others are worked out
+        self.inputs = set().union(
+            *(formula.inputs for formula in self.student_formulas)) \
+            & set(STUDENT_INPUTS)
+
+    def category_ratings(self, counts: np.ndarray,
+                         totals: np.ndarray) -> np.ndarray:
+        """ Returns the ratings of categories with the given counts and
+        totals. """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.category_formula(
+                {**self.constants, 'count': counts, 'total': totals})
+
+    def student_ratings(self, inputs: dict[str, np.ndarray]) \
+            -> dict[str, np.ndarray]:
+        """ Evaluates the student formulas in order given the arrays of
+        their inputs, and returns the result of each by name. The last is
+        the Final Individual Rating. """
+        values = {**self.constants, **inputs}
+        results = {}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for formula in self.student_formulas:
+                results[formula.name] = values[formula.name] = \
+                    formula(values)
+        return results
+
+    def fingerprint(self) -> str:
+        """ The rules as text, the same whenever they are. """
+        return json.dumps(self.rules, sort_keys=True)
+
+
+def load(path: str = SCORING_FILE) -> Scoring:
+    """ Reads the scoring rules from the JSON file at path. Raises ValueError
+    if they can't be used. """
+    with open(path) as infile:
+        try:
+            rules = json.load(infile)
+        except json.JSONDecodeError as err:
+            raise ValueError(f"Invalid Scoring Rules\n\nThe file '{path}' "
+                             f"isn't valid JSON: {err}")
+    if not isinstance(rules, dict):
+        raise ValueError(f"Invalid Scoring Rules\n\nThe file '{path}' must "
+                         "hold a JSON object of settings.")
+    try:
+        return Scoring(rules)
+    except ValueError as err:
+        raise ValueError(f"Invalid Scoring Rules\n\nThe file '{path}' can't "
+                         f"be used.\n\n{err}")
+
+
+def active(path: str = SCORING_FILE) -> Scoring:
+    """ Returns the scoring rules in use: those in the file at path if there
+    is one, or else the defaults. The file is only read again once it
+    changes. """
+    try:
+        modified = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        modified = None
+    key = (os.path.abspath(path), modified)
+    if _loaded.get('key') != key:
+        rules = Scoring() if modified is None else load(path)
+        _loaded.update(key=key, rules=rules)
+    return _loaded['rules']
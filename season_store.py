@@ -0,0 +1,205 @@
+import os
+import re
+import sqlite3
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+
+from data_functions import FINAL_RATING, FIRST_NAME, GRADE, KEY, LAST_NAME, \
+    SCHOOL, STUDENT_ID, read_data_file
+
+
+STORE_FILENAME = 'Season Ratings.db'
+
+# Stores are stamped with this in PRAGMA user_version, so that a store made
+# before a change to the schema can be told apart and migrated
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS students (
+    student_id INTEGER PRIMARY KEY,
+    last_name TEXT NOT NULL,
+    first_name TEXT NOT NULL,
+    grade INTEGER NOT NULL,
+    school TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meet_ratings (
+    student_id INTEGER NOT NULL,
+    meet INTEGER NOT NULL,
+    rating REAL,
+    PRIMARY KEY (student_id, meet)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS meet_ratings_by_meet ON meet_ratings (meet);
+"""
+
+
+def store_path(year: int) -> str:
+    """ Returns the path of the season store for the given year. """
+    return f'./{year}/{STORE_FILENAME}'
+
+
+def connect(year: int) -> sqlite3.Connection:
+    """ Opens the season store for the given year, creating it if needed. The
+    year's directory must already exist. Close the connection when done, e.g.
+    with contextlib.closing. """
+    connection = sqlite3.connect(store_path(year))
+    try:
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+        if version < SCHEMA_VERSION:
+            with connection:
+                connection.executescript(SCHEMA)
+                connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    except Exception:
+        connection.close()
+        raise
+    return connection
+
+
+def stored_meets(year: int) -> list[int]:
+    """ Returns the meets that have ratings in the given year's store. """
+    if not os.path.exists(store_path(year)):
+        return []
+
+    with closing(connect(year)) as connection, connection:
+        rows = connection.execute(
+            "SELECT DISTINCT meet FROM meet_ratings ORDER BY meet").fetchall()
+    return [row[0] for row in rows]
+
+
+def save_meet_ratings(year: int, meet: int, ratings: pd.DataFrame) -> None:
+    """ Stores each student's rating for the given meet. The ratings DataFrame
+    must have the KEY columns and FINAL_RATING, and STUDENT_ID if it's known;
+    students without one get theirs from the student registry. Any ratings
+    previously stored for this meet are replaced in the same transaction, so
+    rerunning a meet never leaves behind students who were removed from it.
+    """
+    with closing(connect(year)) as connection, connection:
+        _write_meet_ratings(connection, year, meet, ratings)
+
+
+def _write_meet_ratings(connection: sqlite3.Connection, year: int, meet: int,
+                        ratings: pd.DataFrame) -> None:
+    import student_registry
+
+    student_ids = student_registry.assign_ids(ratings, year)
+    grades = pd.to_numeric(ratings[GRADE], errors='coerce').to_numpy(
+        dtype=float)
+    students = zip(student_ids.tolist(),
+                   ratings[LAST_NAME].astype(str),
+                   ratings[FIRST_NAME].astype(str),
+                   np.nan_to_num(grades, nan=0).astype(int).tolist(),
+                   ratings[SCHOOL].astype(str),
+                   [meet] * len(ratings))
+    values = ratings[FINAL_RATING].astype(float).to_numpy()
+    meet_ratings = zip(student_ids.tolist(), [meet] * len(ratings),
+                       [None if np.isnan(value) else value
+                        for value in values.tolist()])
+
+    # A student's details are kept as of their latest meet, so rerunning an
+    # earlier meet doesn't undo a correction made in a later one
+    connection.executemany(
+        "INSERT INTO students (student_id, last_name, first_name, grade, "
+        "school) VALUES (?1, ?2, ?3, ?4, ?5) "
+        "ON CONFLICT (student_id) DO UPDATE SET last_name = ?2, "
+        "first_name = ?3, grade = ?4, school = ?5 "
+        "WHERE NOT EXISTS (SELECT 1 FROM meet_ratings "
+        "WHERE student_id = ?1 AND meet > ?6)", students)
+    connection.execute("DELETE FROM meet_ratings WHERE meet = ?", (meet,))
+    connection.executemany(
+        "INSERT OR REPLACE INTO meet_ratings (student_id, meet, rating) "
+        "VALUES (?, ?, ?)", meet_ratings)
+
+
+def import_cumulative_file(year: int, path: str) -> list[int]:
+    """ Copies every 'Meet N Rating' column of a cumulative ratings file into
+    the season store for any meet the store doesn't already hold. This lets
+    seasons started before the store existed keep going. Returns the meets
+    that were imported. """
+    cumulative = read_data_file(path)
+    already_stored = set(stored_meets(year))
+    student = [column for column in KEY + [STUDENT_ID] if column in cumulative]
+
+    imported = []
+    for column in cumulative.keys():
+        match = re.fullmatch(r'Meet (\d+) Rating', column)
+        if not match or int(match.group(1)) in already_stored:
+            continue
+
+        meet = int(match.group(1))
+        ratings = cumulative[student + [column]].rename(
+            columns={column: FINAL_RATING})
+        save_meet_ratings(year, meet, ratings)
+        imported.append(meet)
+
+    return imported
+
+
+def cumulative_ratings(year: int, meet: int) -> pd.DataFrame:
+    """ Builds the cumulative ratings table as of the given meet: one row per
+    student who took part in any meet up to and including it, with their
+    STUDENT_ID and a 'Meet N Rating' column for each of those meets. Ratings
+    are joined on the integer Student ID and rows are sorted by the student
+    KEY. """
+    with closing(connect(year)) as connection, connection:
+        stored = pd.read_sql_query(
+            "SELECT student_id, meet, rating FROM meet_ratings "
+            "WHERE meet <= ?", connection, params=(meet,))
+        students = pd.read_sql_query(
+            "SELECT student_id, last_name, first_name, grade, school "
+            "FROM students", connection, index_col='student_id')
+
+    cumulative = stored.pivot(index='student_id', columns='meet',
+                              values='rating').sort_index(axis=1)
+    cumulative.columns = [f'Meet {column} Rating'
+                          for column in cumulative.columns]
+
+    students.columns = KEY
+    meet_columns = list(cumulative.columns)
+    cumulative = students.join(cumulative, how='inner')
+    cumulative.index.name = STUDENT_ID
+    cumulative = cumulative.reset_index()[KEY + [STUDENT_ID] + meet_columns]
+    return cumulative.sort_values(KEY, kind='stable', ignore_index=True)
+
+
+def student_ratings(year: int, student_id: int) -> list[tuple[int, float]]:
+    """ Returns (meet, rating) for every meet the student has a rating for in
+    the given year's store, looked up by the store's Student ID key. """
+    if not os.path.exists(store_path(year)):
+        return []
+
+    with closing(connect(year)) as connection, connection:
+        rows = connection.execute(
+            "SELECT meet, rating FROM meet_ratings WHERE student_id = ? "
+            "ORDER BY meet", (student_id,)).fetchall()
+    return rows
+
+
+def rated_meets(year: int) -> pd.DataFrame:
+    """ Returns the student_id and meet of every rating in the given year's
+    store, leaving out students who were listed but didn't compete. """
+    if not os.path.exists(store_path(year)):
+        return pd.DataFrame({'student_id': [], 'meet': []}, dtype=np.int64)
+
+    with closing(connect(year)) as connection, connection:
+        rated = pd.read_sql_query(
+            "SELECT student_id, meet FROM meet_ratings "
+            "WHERE rating IS NOT NULL", connection)
+    return rated
+
+
+def merge_students(year: int, merges: dict[int, int]) -> None:
+    """ Moves the ratings of each Student ID in merges to the ID it maps to.
+    Where both have a rating for the same meet, the one already stored under
+    the ID merged into is kept. """
+    rows = list(merges.items())
+    with closing(connect(year)) as connection, connection:
+        for table in ('meet_ratings', 'students'):
+            connection.executemany(
+                f"UPDATE OR IGNORE {table} SET student_id = ? "
+                "WHERE student_id = ?",
+                [(merged_into, student_id)
+                 for student_id, merged_into in rows])
+            connection.executemany(
+                f"DELETE FROM {table} WHERE student_id = ?",
+                [(student_id,) for student_id, _ in rows])
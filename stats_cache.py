@@ -0,0 +1,148 @@
+""" An on-disk cache of calculate_stats results.
+
+Entries are keyed by a hash of the scores file's contents together with
+everything else that affects the results, so rerunning a meet whose file
+hasn't changed skips parsing and calculating altogether (create_reports
+loads and saves entries itself). Results are pickled, which is much faster
+to load than the csv, so the key includes the pandas version too. The cache
+is kept under MAX_CACHE_BYTES by evicting the least recently used entries.
+"""
+import glob
+import hashlib
+import os
+import pickle
+
+import pandas as pd
+
+import data_functions
+import scoring
+
+
+CACHE_DIRECTORY = './.stats_cache'
+MAX_CACHE_BYTES = 256 * 2**20
+
+# Bump this whenever the results calculate_stats gives for the same file
+# change, so that old entries are no longer used.
+CACHE_VERSION = 2
+
+
+def cache_key(filename: str) -> str:
+    """ Returns the key for the current contents of the given scores file.
+    The key starts with a hash of the file's path so that every entry for a
+    file can be found by invalidate. """
+    content = hashlib.blake2b(digest_size=16)
+    content.update(repr((CACHE_VERSION, scoring.active().fingerprint(),
+                         data_functions.CSV_ENGINE, pd.__version__,
+                         pickle.HIGHEST_PROTOCOL)).encode())
+    with open(filename, 'rb') as infile:
+        for block in iter(lambda: infile.read(2**20), b''):
+            content.update(block)
+    return f'{_path_hash(filename)}-{content.hexdigest()}'
+
+
+def _path_hash(filename: str) -> str:
+    path = os.path.normcase(os.path.abspath(filename))
+    return hashlib.blake2b(path.encode(), digest_size=8).hexdigest()
+
+
+def _entry_path(key: str) -> str:
+    return os.path.join(CACHE_DIRECTORY, f'{key}.pkl')
+
+
+def load(key: str) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """ Returns the cached (student_data, category_data) for the key, or None
+    if there isn't a usable entry for it. An entry that can't be loaded (it
+    was cut short, or pickled by other versions of the code and pandas) is
+    removed so that it's recalculated. """
+    path = _entry_path(key)
+    try:
+        with open(path, 'rb') as infile:
+            results = pickle.load(infile)
+    except OSError:
+        return None
+    except Exception:
+        _remove(path)
+        return None
+
+    # Mark the entry as recently used
+    os.utime(path)
+    return results
+
+
+def save(key: str, student_data: pd.DataFrame,
+         category_data: pd.DataFrame) -> None:
+    """ Caches the results for the key and evicts old entries if the cache has
+    grown too big. """
+    if not os.path.exists(CACHE_DIRECTORY):
+        os.mkdir(CACHE_DIRECTORY)
+
+    # Write to a temporary file first so a reader never sees half an entry
+    path = _entry_path(key)
+    temporary_path = f'{path}.{os.getpid()}.tmp'
+    with open(temporary_path, 'wb') as outfile:
+        pickle.dump((student_data, category_data), outfile,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary_path, path)
+
+    evict()
+
+
+def _entries() -> list[tuple[float, int, str]]:
+    """ Returns (last used, size, path) for every entry, oldest first. """
+    entries = []
+    for path in glob.glob(os.path.join(CACHE_DIRECTORY, '*.pkl')):
+        try:
+            status = os.stat(path)
+        except OSError:
+            continue
+        entries.append((status.st_mtime, status.st_size, path))
+    return sorted(entries)
+
+
+def evict(max_bytes: int = None) -> None:
+    """ Removes the least recently used entries until the cache fits in
+    max_bytes (MAX_CACHE_BYTES by default). """
+    if max_bytes is None:
+        max_bytes = MAX_CACHE_BYTES
+
+    entries = _entries()
+    size = sum(entry[1] for entry in entries)
+    for _, entry_size, path in entries:
+        if size <= max_bytes:
+            break
+        _remove(path)
+        size -= entry_size
+
+
+def invalidate(filename: str) -> int:
+    """ Removes every entry for the given scores file. Returns how many were
+    removed. """
+    paths = glob.glob(os.path.join(CACHE_DIRECTORY,
+                                   f'{_path_hash(filename)}-*.pkl'))
+    for path in paths:
+        _remove(path)
+    return len(paths)
+
+
+def clear() -> int:
+    """ Removes every entry. Returns how many were removed. """
+    entries = _entries()
+    for _, _, path in entries:
+        _remove(path)
+    return len(entries)
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def cache_info() -> dict:
+    """ Returns the number of entries and bytes in the cache and the most
+    it may hold. """
+    entries = _entries()
+    return dict(entries=len(entries),
+                bytes=sum(entry[1] for entry in entries),
+                max_bytes=MAX_CACHE_BYTES)
@@ -0,0 +1,306 @@
+""" A small read-only HTTP service that answers coaches' questions about
+ratings with JSON, straight from the files create_reports writes:
+
+    python -m mcmlstats serve --port 8080
+
+    GET /years                                  the years with results
+    GET /years/2021/meets                       the meets analyzed
+    GET /years/2021/meets/1                     the meet's category ratings
+    GET /years/2021/meets/1/schools/Penfield    a school's scores and ratings
+    GET /years/2021/standings                   the latest season standings
+    GET /years/2021/schools/Penfield            a school's season standings
+    GET /years/2021/students/17                 a student's season standings
+
+Each results file is read once and kept, already split up and encoded as
+JSON, in an LRU cache. A file that has changed since it was read (because a
+meet was re-run, for example) is read again on the next request for it.
+Requests are served concurrently on one asyncio event loop, and files are
+read on worker threads so a slow read never holds up the other requests.
+
+load_test.py measures how many requests a second the service answers. """
+import asyncio
+import json
+import logging
+import os
+import re
+from collections import OrderedDict
+from typing import Callable
+from urllib.parse import unquote, urlsplit
+
+import pandas as pd
+
+from data_functions import SCHOOL, STUDENT_ID, read_data_file
+
+
+HOST = '127.0.0.1'
+PORT = 8080
+
+# How many results files are kept in memory
+CACHE_SIZE = 64
+
+STATUS_TEXT = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    500: 'Internal Server Error',
+}
+
+logger = logging.getLogger('mcmlstats')
+
+
+class NotFound(Exception):
+    ''' Raised for a request that matches no route or no results. The first
+    argument says what wasn't found. '''
+
+
+class ResultCache:
+    ''' The most recently used results files, each as whatever its loader
+    made of it. An entry is only used while the file's modification time and
+    size are the same as when it was read. Requests that arrive while a file
+    is being read wait for that read rather than starting their own. '''
+
+    def __init__(self, size: int = CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, path: str, load: Callable[[str], object]) -> object:
+        """ Returns load(path), from the cache if the file hasn't changed.
+        Raises FileNotFoundError if there is no such file. """
+        status = os.stat(path)
+        signature = (status.st_mtime_ns, status.st_size)
+        entry = self.entries.get(path)
+        if entry is not None and entry[0] == signature:
+            self.entries.move_to_end(path)
+            self.hits += 1
+            loading = entry[1]
+        else:
+            self.misses += 1
+            loading = asyncio.ensure_future(asyncio.to_thread(load, path))
+            self.entries[path] = (signature, loading)
+            self.entries.move_to_end(path)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+        try:
+            # A client hanging up mustn't stop a read others are waiting for
+            return await asyncio.shield(loading)
+        except Exception:
+            if self.entries.get(path, (None, None))[1] is loading:
+                del self.entries[path]
+            raise
+
+
+class Table:
+    ''' A results file encoded as JSON: all of its rows, the rows of each
+    school, and (if it has Student IDs) each student's row. Every row is
+    encoded once and the lists are joined from those. '''
+
+    def __init__(self, path: str):
+        data = read_data_file(path)
+        rows = data.to_json(orient='records', lines=True,
+                            double_precision=15).splitlines()
+        self.all = _join(rows)
+        self.schools = {}
+        if SCHOOL in data:
+            groups = data.groupby(data[SCHOOL].astype(str), sort=False)
+            self.schools = {school: _join([rows[row] for row in positions])
+                            for school, positions in groups.indices.items()}
+        self.students = {}
+        if STUDENT_ID in data:
+            self.students = {
+                int(student_id): rows[position].encode('utf-8')
+                for position, student_id in enumerate(data[STUDENT_ID])
+                if pd.notna(student_id)}
+
+    def school(self, school: str) -> bytes:
+        if school not in self.schools:
+            raise NotFound(f"No students from '{school}'")
+        return self.schools[school]
+
+    def student(self, student_id: int) -> bytes:
+        if student_id not in self.students:
+            raise NotFound(f"No student with the ID {student_id}")
+        return self.students[student_id]
+
+
+def _join(rows: list[str]) -> bytes:
+    """ The JSON list of the given encoded rows. """
+    return ('[' + ','.join(rows) + ']').encode('utf-8')
+
+
+def _json_list(values: list) -> bytes:
+    return ('[' + ','.join(map(str, values)) + ']').encode('utf-8')
+
+
+class StatsService:
+    ''' Answers requests for the results under root, the directory that holds
+    the year folders. '''
+
+    def __init__(self, root: str = '.', cache_size: int = CACHE_SIZE):
+        self.root = root
+        self.cache = ResultCache(cache_size)
+        self.listings = {}
+
+    def listing(self, directory: str) -> list[str]:
+        """ The names in the directory, listed again only once it changes.
+        Raises NotFound if there is no such directory. """
+        try:
+            modified = os.stat(directory).st_mtime_ns
+        except FileNotFoundError:
+            raise NotFound(f"No folder '{os.path.basename(directory)}'")
+        listed = self.listings.get(directory)
+        if listed is None or listed[0] != modified:
+            listed = (modified, os.listdir(directory))
+            self.listings[directory] = listed
+        return listed[1]
+
+    def numbered(self, year: int, pattern: str) -> dict[int, str]:
+        """ The names in the year's folder that match pattern, by the number
+        its group matches. """
+        names = self.listing(os.path.join(self.root, str(year)))
+        return {int(match.group(1)): match.group(0)
+                for match in map(re.compile(pattern).fullmatch, names)
+                if match}
+
+    def years(self) -> list[int]:
+        return sorted(int(name) for name in self.listing(self.root)
+                      if name.isdigit() and
+                      os.path.isdir(os.path.join(self.root, name)))
+
+    def meets(self, year: int) -> list[int]:
+        """ The meets of the year that have been analyzed. """
+        return [meet for meet in sorted(self.numbered(year, r'Meet (\d+)'))
+                if os.path.exists(self.meet_path(year, meet,
+                                                 'with Student Ratings'))]
+
+    def meet_path(self, year: int, meet: int, name: str) -> str:
+        return os.path.join(self.root, str(year), f'Meet {meet}',
+                            f'Meet {meet} {name}.csv')
+
+    def standings_path(self, year: int) -> str:
+        """ The cumulative ratings file of the year's latest meet. """
+        files = self.numbered(year, r'Cumulative Ratings - Meet (\d+)\.csv')
+        if not files:
+            raise NotFound(f"No cumulative ratings for {year}")
+        return os.path.join(self.root, str(year), files[max(files)])
+
+    async def table(self, path: str) -> Table:
+        try:
+            return await self.cache.get(path, Table)
+        except FileNotFoundError:
+            relative = os.path.relpath(path, self.root)
+            raise NotFound(f"No results at '{relative}'")
+
+    async def query(self, path: str) -> bytes:
+        """ Returns the JSON answer to a request for the given URL path. """
+        parts = [unquote(part) for part in path.strip('/').split('/')]
+        if parts == ['years']:
+            return _json_list(self.years())
+        if len(parts) < 3 or parts[0] != 'years' or not parts[1].isdigit():
+            raise NotFound(f"Nothing at '{path}'")
+
+        year = int(parts[1])
+        route = parts[2:]
+        if route == ['meets']:
+            return _json_list(self.meets(year))
+        if route[0] == 'meets' and len(route) in (2, 4) and \
+                route[1].isdigit():
+            meet = int(route[1])
+            if len(route) == 2:
+                table = await self.table(
+                    self.meet_path(year, meet, 'Category Ratings'))
+                return table.all
+            if route[2] == 'schools':
+                table = await self.table(
+                    self.meet_path(year, meet, 'with Student Ratings'))
+                return table.school(route[3])
+        if route == ['standings']:
+            return (await self.table(self.standings_path(year))).all
+        if len(route) == 2 and route[0] == 'schools':
+            table = await self.table(self.standings_path(year))
+            return table.school(route[1])
+        if len(route) == 2 and route[0] == 'students' and route[1].isdigit():
+            table = await self.table(self.standings_path(year))
+            return table.student(int(route[1]))
+        raise NotFound(f"Nothing at '{path}'")
+
+    async def respond(self, method: str, target: str) -> tuple[int, bytes]:
+        """ Returns the status and body of the response to a request. """
+        if method not in ('GET', 'HEAD'):
+            return 405, _error("This service is read-only")
+        try:
+            return 200, await self.query(urlsplit(target).path)
+        except NotFound as err:
+            return 404, _error(err.args[0])
+        except Exception:
+            logger.exception("Error answering %s", target)
+            return 500, _error("The request could not be answered")
+
+    async def handle(self, reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter) -> None:
+        """ Serves the requests on one connection, keeping it open between
+        them unless the client asks otherwise. """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                if 'content-length' in headers:
+                    await reader.readexactly(int(headers['content-length']))
+
+                try:
+                    method, target, version = \
+                        request_line.decode('latin-1').split()
+                except ValueError:
+                    method, target, version = None, None, 'HTTP/1.0'
+                    status, body = 400, _error("Malformed request")
+                else:
+                    status, body = await self.respond(method, target)
+
+                keep_alive = version == 'HTTP/1.1' and \
+                    headers.get('connection', '').lower() != 'close'
+                connection = 'keep-alive' if keep_alive else 'close'
+                head = (f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+                        "Content-Type: application/json\r\n"
+                        f"Content-Length: {len(body)}\r\n"
+                        f"Connection: {connection}\r\n\r\n").encode('latin-1')
+                writer.write(head if method == 'HEAD' else head + body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+def _error(message: str) -> bytes:
+    return json.dumps({'error': message}).encode('utf-8')
+
+
+async def start_server(root: str = '.', host: str = HOST, port: int = PORT,
+                       cache_size: int = CACHE_SIZE) -> asyncio.Server:
+    """ Starts serving the results under root and returns the server. """
+    service = StatsService(root, cache_size)
+    return await asyncio.start_server(service.handle, host, port)
+
+
+def serve(root: str = '.', host: str = HOST, port: int = PORT,
+          cache_size: int = CACHE_SIZE) -> None:
+    """ Serves the results under root until interrupted. """
+    async def run():
+        server = await start_server(root, host, port, cache_size)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(run())
@@ -0,0 +1,222 @@
+""" The student registry gives every student a stable integer Student ID.
+
+A student is identified by their name, school and graduating class (the year
+plus the years of school they have left), which doesn't change when
+update_grades moves them up a grade, so a student keeps the same ID from year
+to year. The registry lives in 'Student Registry.db' next to the year folders
+and is loaded into a dictionary when opened, so looking a student up either
+way is a single hash lookup.
+
+When two IDs turn out to be the same student (see reconcile.py), one is
+merged into the other. The merged ID and its name are kept as aliases that
+resolve to the ID it was merged into. """
+import glob
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from data_functions import FIRST_NAME, GRADE, LAST_NAME, SCHOOL, STUDENT_ID
+
+
+REGISTRY_PATH = './Student Registry.db'
+
+# Students in a grade we can't read get this graduating class
+UNKNOWN_CLASS = -1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS students (
+    student_id INTEGER PRIMARY KEY,
+    last_name TEXT NOT NULL,
+    first_name TEXT NOT NULL,
+    school TEXT NOT NULL,
+    class_of INTEGER NOT NULL,
+    UNIQUE (last_name, first_name, school, class_of)
+);
+CREATE TABLE IF NOT EXISTS merged (
+    student_id INTEGER PRIMARY KEY,
+    merged_into INTEGER NOT NULL
+);
+"""
+
+
+def graduating_class(year: int, grades) -> np.ndarray:
+    """ Returns the year each student will finish 12th grade. """
+    grades = pd.to_numeric(pd.Series(grades), errors='coerce').to_numpy(
+        dtype=float)
+    classes = year + 12 - grades
+    return np.where(np.isnan(classes), UNKNOWN_CLASS, classes).astype(np.int64)
+
+
+class StudentRegistry:
+    ''' The registry of every student the program has seen. Use it as a
+    context manager, or call close() when done. '''
+
+    def __init__(self, path: str = REGISTRY_PATH):
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+        # The hash indexes, both ways
+        self.ids = {}
+        self.students = {}
+        rows = self.connection.execute(
+            "SELECT student_id, last_name, first_name, school, class_of "
+            "FROM students")
+        for student_id, *key in rows:
+            self.ids[tuple(key)] = student_id
+            self.students[student_id] = tuple(key)
+
+        self.merged = dict(self.connection.execute(
+            "SELECT student_id, merged_into FROM merged"))
+        self.next_id = max([*self.students, *self.merged], default=0) + 1
+        for key, student_id in self.ids.items():
+            self.ids[key] = self.canonical(student_id)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def canonical(self, student_id: int) -> int:
+        """ Returns the ID the given one was merged into, if it was, or the
+        ID itself. """
+        while student_id in self.merged:
+            student_id = self.merged[student_id]
+        return student_id
+
+    def merge(self, merges: dict[int, int]) -> None:
+        """ Records that each ID in merges is the same student as the ID it
+        maps to, which must be in the registry. """
+        for student_id, merged_into in merges.items():
+            merged_into = self.canonical(merged_into)
+            if merged_into != student_id:
+                self.merged[student_id] = merged_into
+        for key, student_id in self.ids.items():
+            self.ids[key] = self.canonical(student_id)
+
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO merged (student_id, merged_into) "
+                "VALUES (?, ?)",
+                [(student_id, self.canonical(student_id))
+                 for student_id in self.merged])
+
+    def frame(self) -> pd.DataFrame:
+        """ Returns every student who hasn't been merged into another, with
+        their student_id, last_name, first_name, school and class_of. """
+        rows = [(student_id, *key) for student_id, key in
+                self.students.items() if student_id not in self.merged]
+        return pd.DataFrame(rows, columns=['student_id', 'last_name',
+                                           'first_name', 'school',
+                                           'class_of'])
+
+    def student(self, student_id: int) -> dict:
+        """ Returns the name, school and graduating class of the student with
+        the given ID, or None if there isn't one. """
+        key = self.students.get(student_id)
+        if key is None:
+            return None
+        return dict(zip(['last_name', 'first_name', 'school', 'class_of'],
+                        key))
+
+    def assign_ids(self, students: pd.DataFrame, year: int) -> np.ndarray:
+        """ Returns the Student ID of each row of students, which needs the
+        LAST_NAME, FIRST_NAME, GRADE and SCHOOL columns of the given year.
+        Rows that already have a STUDENT_ID keep it. Students the registry
+        hasn't seen before are added to it. An ID typed in for a student the
+        registry already knows by another ID is kept as an alias of that ID,
+        so it resolves to the student and is never given to anyone else. """
+        if STUDENT_ID in students:
+            ids = pd.to_numeric(students[STUDENT_ID], errors='coerce') \
+                .to_numpy(dtype=float)
+        else:
+            ids = np.full(len(students), np.nan)
+
+        keys = list(zip(students[LAST_NAME].astype(str),
+                        students[FIRST_NAME].astype(str),
+                        students[SCHOOL].astype(str),
+                        graduating_class(year, students[GRADE]).tolist()))
+
+        new_students = []
+        for row in np.flatnonzero(np.isnan(ids)):
+            key = keys[row]
+            student_id = self.ids.get(key)
+            if student_id is None:
+                student_id = self.next_id
+                self.next_id += 1
+                self.ids[key] = student_id
+                self.students[student_id] = key
+                new_students.append((student_id, *key))
+            ids[row] = student_id
+
+        # IDs typed into a file by hand are registered too
+        aliases = {}
+        for row in np.flatnonzero(~np.isin(ids, [*self.students,
+                                                 *self.merged])):
+            student_id = int(ids[row])
+            self.next_id = max(self.next_id, student_id + 1)
+            if student_id in self.students or student_id in aliases:
+                continue
+            if keys[row] in self.ids:
+                aliases[student_id] = self.ids[keys[row]]
+            else:
+                self.students[student_id] = keys[row]
+                self.ids[keys[row]] = student_id
+                new_students.append((student_id, *keys[row]))
+        if aliases:
+            self.merge(aliases)
+
+        if self.merged:
+            ids = np.array([self.canonical(int(student_id))
+                            for student_id in ids], dtype=float)
+
+        if new_students:
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT OR IGNORE INTO students (student_id, last_name, "
+                    "first_name, school, class_of) VALUES (?, ?, ?, ?, ?)",
+                    new_students)
+
+        return ids.astype(np.int64)
+
+
+def assign_ids(students: pd.DataFrame, year: int) -> np.ndarray:
+    """ Opens the registry and returns StudentRegistry.assign_ids. """
+    with StudentRegistry() as registry:
+        return registry.assign_ids(students, year)
+
+
+def with_ids(students: pd.DataFrame, year: int) -> pd.DataFrame:
+    """ Returns a copy of students with a STUDENT_ID column filled in, placed
+    right after the student KEY columns if it wasn't there already. """
+    ids = assign_ids(students, year)
+    students = students.copy()
+    if STUDENT_ID in students:
+        students[STUDENT_ID] = ids
+    else:
+        students.insert(students.columns.get_loc(SCHOOL) + 1, STUDENT_ID, ids)
+    return students
+
+
+def student_history(student_id: int) -> pd.DataFrame:
+    """ Returns every rating the student has received in every year's season
+    store, as Year, Meet and Rating columns. Each store is searched by its
+    Student ID index. """
+    import season_store
+
+    history = []
+    for path in sorted(glob.glob(f'./*/{season_store.STORE_FILENAME}')):
+        year = os.path.basename(os.path.dirname(path))
+        if not year.isdigit():
+            continue
+        for meet, rating in season_store.student_ratings(int(year),
+                                                         student_id):
+            history.append((int(year), meet, rating))
+
+    return pd.DataFrame(history, columns=['Year', 'Meet', 'Rating'])
@@ -1,12 +1,24 @@
 import pandas as pd
-import names
+import numpy as np
 import random
 import os
 
 
+SCHOOLS = ['HA', 'HAC', 'Pittsford-Mendon', 'Greece Olympia', 'Penfield',
+           'Brighton']
+CATEGORY_COUNT = 6
+CATEGORIES_PLAYED = 3
+SYLLABLES = np.array(['an', 'bel', 'car', 'dan', 'el', 'fin', 'gar', 'har',
+                      'is', 'jo', 'kel', 'lin', 'mar', 'nor', 'ol', 'per',
+                      'quin', 'ros', 'sam', 'tor', 'ul', 'ven', 'wil', 'zan'])
+
+
 def generate_fake_roster(file_path: str) -> None:
-    schools = ['HA', 'HAC', 'Pittsford-Mendon', 'Greece Olympia',
-               'Penfield', 'Brighton']
+    # Only this function needs the names package, so the vectorized
+    # generators below work without it.
+    import names
+
+    schools = SCHOOLS
 
     with open(file_path, 'w') as outfile:
         outfile.write('Last Name,First Name,Grade,School\n')
@@ -18,12 +30,12 @@ def generate_fake_roster(file_path: str) -> None:
                 outfile.write(f'{l_name},{f_name},{grade},{school}\n')
 
 
-def generate_test_data(file_path: str) -> None:
+def generate_test_data(file_path: str, seed: int = None) -> None:
     empty_stats = pd.read_csv(file_path)
     categories = empty_stats.keys()[4:10]
 
-    for row in empty_stats.index:
-        empty_stats.loc[row, categories] = get_random_score()
+    rng = np.random.default_rng(seed)
+    empty_stats[categories] = get_random_scores(len(empty_stats), rng)
 
     os.remove(file_path)
     empty_stats.to_csv(file_path, index=False)
@@ -43,6 +55,60 @@ def get_random_score():
     return scores
 
 
+def get_random_scores(count: int, rng: np.random.Generator) -> np.ndarray:
+    """ The vectorized version of get_random_score. Returns a count x 6 matrix
+    in which each row has 3 scores from 0 to 6 in random categories and NaN
+    in the rest, except for about 10% of rows that are all NaN (students who
+    didn't compete). """
+    scores = rng.integers(0, 7, (count, CATEGORY_COUNT)).astype(float)
+
+    # Rank random keys to pick each row's categories without replacement
+    ranks = rng.random((count, CATEGORY_COUNT)).argsort(axis=1).argsort(axis=1)
+    scores[ranks >= CATEGORIES_PLAYED] = np.nan
+    scores[rng.random(count) > .9] = np.nan
+    return scores
+
+
+def get_random_names(count: int, rng: np.random.Generator) -> np.ndarray:
+    """ Returns count made up names, each built from 2 or 3 syllables. """
+    parts = SYLLABLES[rng.integers(0, len(SYLLABLES), (3, count))]
+    three = rng.random(count) < .5
+    built = np.char.add(parts[0], parts[1])
+    built = np.where(three, np.char.add(built, parts[2]), built)
+    return np.char.capitalize(built)
+
+
+def generate_league(directory: str, students: int, meets: int = 1,
+                    seed: int = 0, students_per_school: int = 10) -> None:
+    """ Writes a made up roster and scored 'Meet N.csv' files for meets
+    1 through meets into directory. The same seed always produces the same
+    league, so runs at any size can be compared. """
+    rng = np.random.default_rng(seed)
+    school_count = max(len(SCHOOLS), -(-students // students_per_school))
+    schools = SCHOOLS + [f'School {number}'
+                         for number in range(len(SCHOOLS) + 1,
+                                             school_count + 1)]
+
+    roster = pd.DataFrame({
+        'Last Name': get_random_names(students, rng),
+        'First Name': get_random_names(students, rng),
+        'Grade': rng.integers(8, 13, students),
+        'School': np.array(schools)[rng.integers(0, school_count, students)],
+    })
+
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    roster.to_csv(os.path.join(directory, 'roster.csv'), index=False)
+
+    for meet in range(1, meets + 1):
+        meet_data = roster.copy()
+        categories = [f'Meet {meet} Category {number}'
+                      for number in range(1, CATEGORY_COUNT + 1)]
+        meet_data[categories] = get_random_scores(students, rng)
+        meet_data.to_csv(os.path.join(directory, f'Meet {meet}.csv'),
+                         index=False)
+
+
 if __name__ == "__main__":
     # generate_fake_roster('./2021/roster.csv')
     generate_test_data('./2021/Meet 2.csv')
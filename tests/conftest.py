@@ -0,0 +1,49 @@
+""" Shared fixtures for the tests. Each test runs in its own copy of a small
+made up league, since the program works on the year folders in the current
+directory. """
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import test_data_generator  # noqa: E402
+
+
+YEAR = 2021
+STUDENTS = 200
+MEETS = 3
+
+
+def make_league(directory, seed: int = 0) -> None:
+    """ Writes the made up league's roster and meet files under directory. """
+    test_data_generator.generate_league(os.path.join(directory, str(YEAR)),
+                                        STUDENTS, MEETS, seed=seed)
+
+
+def read_file(path) -> bytes:
+    """ Returns the contents of the file at path. """
+    with open(path, 'rb') as infile:
+        return infile.read()
+
+
+def read_files(directory, pattern: str = '.csv') -> dict[str, bytes]:
+    """ Returns the contents of every file under directory whose name ends
+    with pattern, by path relative to directory. """
+    contents = {}
+    for folder, _, filenames in os.walk(directory):
+        for filename in filenames:
+            if filename.endswith(pattern) and 'Timings' not in filename:
+                path = os.path.join(folder, filename)
+                contents[os.path.relpath(path, directory)] = read_file(path)
+    return contents
+
+
+@pytest.fixture
+def league(tmp_path, monkeypatch):
+    """ A made up league in a temporary directory, which is made the current
+    directory. """
+    make_league(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,38 @@
+import pandas as pd
+
+import batch_stats
+import data_functions
+from conftest import MEETS, YEAR, make_league, read_files
+
+
+def correct_scores(directory) -> None:
+    """ Makes a scoring correction to the first meet: the first student who
+    scored 2 or less in a category gets a point more. """
+    path = directory / str(YEAR) / 'Meet 1.csv'
+    meet_data = pd.read_csv(path)
+    category = data_functions.score_columns(meet_data.keys())[0]
+    row = meet_data.index[meet_data[category] <= 2][0]
+    meet_data.loc[row, category] += 1
+    meet_data.to_csv(path, index=False)
+
+
+def test_rebuild_matches_fresh_analysis(league, tmp_path_factory,
+                                        monkeypatch):
+    for meet in range(1, MEETS + 1):
+        data_functions.create_reports(YEAR, meet, use_cache=False)
+    correct_scores(league)
+    written = batch_stats.write_batch_stats(
+        batch_stats.calculate_batch_stats([YEAR]))
+    assert any('Cumulative Ratings' in path for path in written)
+
+    fresh = tmp_path_factory.mktemp('fresh')
+    make_league(fresh)
+    correct_scores(fresh)
+    monkeypatch.chdir(fresh)
+    for meet in range(1, MEETS + 1):
+        data_functions.create_reports(YEAR, meet, use_cache=False)
+
+    rebuilt = read_files(league)
+    assert rebuilt == read_files(fresh)
+    ratings = rebuilt[f'{YEAR}/Meet 1/Meet 1 with Student Ratings.csv']
+    assert b',School,Student ID,' in ratings.splitlines()[0]
@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+
+import data_functions
+from conftest import MEETS, YEAR
+
+
+def expected_ratings(path: str) -> list[float]:
+    """ Each student's Final Individual Rating by the MCML's rules, adding
+    up their points and category ratings in column order. """
+    meet_data = pd.read_csv(path)
+    categories = data_functions.score_columns(meet_data.keys())
+    ratings = [meet_data[category].sum() / meet_data[category].count() * 5
+               for category in categories]
+
+    final = []
+    for scores in meet_data[categories].itertuples(index=False):
+        total = rating_sum = relative_sum = 0.0
+        for score, rating in zip(scores, ratings):
+            if not np.isnan(score):
+                total += score
+                rating_sum += rating
+                relative_sum += score / rating
+        final.append((total / rating_sum + relative_sum / 3) / 2
+                     if rating_sum else np.nan)
+    return final
+
+
+def test_ratings_add_up_in_column_order(league):
+    for meet in range(1, MEETS + 1):
+        path = f'{YEAR}/Meet {meet}.csv'
+        student_data, _ = data_functions.calculate_stats(path)
+        final = student_data[data_functions.FINAL_RATING].to_numpy()
+        np.testing.assert_array_equal(final, expected_ratings(path))
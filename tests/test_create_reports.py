@@ -0,0 +1,32 @@
+import pytest
+
+import data_functions
+from conftest import YEAR, read_file
+
+
+PREFIX = f'{YEAR}/Meet 1/Meet 1'
+ROSTER_PATH = f'{YEAR}/roster.csv'
+
+
+def test_a_failed_first_run_still_backs_up_the_roster(league, monkeypatch):
+    roster = read_file(ROSTER_PATH)
+
+    def fail(*args):
+        raise OSError("The reports couldn't be written.")
+
+    # The ratings files are written before the run fails
+    with monkeypatch.context() as patch:
+        patch.setattr(data_functions, 'generate_reports', fail)
+        with pytest.raises(OSError):
+            data_functions.create_reports(YEAR, 1)
+    assert read_file(f'{PREFIX} with Student Ratings.csv')
+
+    data_functions.create_reports(YEAR, 1)
+    assert read_file(f'{PREFIX} Roster Backup.csv') == roster
+    assert read_file(ROSTER_PATH) != roster
+
+    # Once finished, the meet is only run again when asked
+    with pytest.raises(FileExistsError):
+        data_functions.create_reports(YEAR, 1)
+    data_functions.create_reports(YEAR, 1, rerun=True)
+    assert read_file(f'{PREFIX} Roster Backup.csv') == roster
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import leaderboards
+from data_functions import FINAL_RATING, FIRST_NAME, GRADE, LAST_NAME, \
+    SCHOOL, STUDENT_ID
+
+
+CATEGORIES = [f'Category {number}' for number in range(1, 7)]
+
+
+def student_data(finals: list[float], schools: list[str]) -> pd.DataFrame:
+    rows = len(finals)
+    scores = np.full((rows, len(CATEGORIES)), np.nan)
+    scores[:, :3] = 2
+    data = pd.DataFrame({LAST_NAME: [f'Last {row}' for row in range(rows)],
+                         FIRST_NAME: 'First', GRADE: 9, SCHOOL: schools,
+                         STUDENT_ID: np.arange(1, rows + 1)})
+    data[CATEGORIES] = scores
+    data[FINAL_RATING] = finals
+    return data
+
+
+def test_ties_for_last_place_are_all_included():
+    # Three students tie for 10th
+    finals = [2.0 - row / 10 for row in range(9)] + [0.5, 0.5, 0.5, 0.1]
+    boards = leaderboards.leaderboards(student_data(finals,
+                                                    ['Penfield'] * 13))
+    overall = boards[boards[leaderboards.BOARD] == leaderboards.OVERALL]
+    assert overall[STUDENT_ID].tolist() == list(range(1, 13))
+    assert overall[leaderboards.RANK].tolist() == \
+        list(range(1, 10)) + [10, 10, 10]
+
+
+def test_top_rows_ranks_ties_alike():
+    values = np.array([3.0, 5.0, 5.0, 1.0, np.nan, 4.0])
+    groups = np.array([0, 0, 0, 0, 0, 1])
+    rows, ranks = leaderboards.top_rows(values, groups, 2)
+    assert rows.tolist() == [1, 2, 5]
+    assert ranks.tolist() == [1, 1, 1]
+
+
+def test_team_rating_counts_every_student_by_default():
+    finals = [0.5, 0.4, 0.3, 0.2, 0.9]
+    schools = ['Penfield'] * 4 + ['Webster']
+    totals = leaderboards.team_totals(student_data(finals, schools))
+    assert totals[SCHOOL].tolist() == ['Penfield', 'Webster']
+    assert totals[leaderboards.TEAM_RATING].tolist() == \
+        pytest.approx([1.4, 0.9])
+    assert totals['Students'].tolist() == [4, 1]
+
+
+def test_team_size_counts_only_the_best():
+    finals = [0.5, 0.4, 0.4, 0.2, 0.9, 0.1]
+    schools = ['Penfield'] * 4 + ['Webster'] * 2
+    totals = leaderboards.team_totals(student_data(finals, schools),
+                                      team_size=2)
+    # A tie at the last place counts once
+    assert totals[SCHOOL].tolist() == ['Webster', 'Penfield']
+    assert totals[leaderboards.TEAM_RATING].tolist() == \
+        pytest.approx([1.0, 0.9])
+    assert totals[leaderboards.RANK].tolist() == [1, 2]
+    assert totals['Students'].tolist() == [2, 4]
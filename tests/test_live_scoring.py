@@ -0,0 +1,91 @@
+import pandas as pd
+
+import data_functions
+import live_scoring
+from conftest import YEAR, read_file
+
+
+SCORES_PATH = f'{YEAR}/Meet 1.csv'
+
+
+def assert_matches_recompute(live: live_scoring.LiveMeet,
+                             meet_data: pd.DataFrame) -> None:
+    meet_data.to_csv(SCORES_PATH, index=False)
+    student_data, category_data = data_functions.calculate_stats(SCORES_PATH)
+    assert live.student_data().to_csv(index=False) == \
+        student_data.to_csv(index=False)
+    assert live.category_data().to_csv(index=False) == \
+        category_data.to_csv(index=False)
+
+
+def test_updates_match_a_full_recompute(league):
+    meet_data = pd.read_csv(SCORES_PATH)
+    categories = data_functions.score_columns(meet_data.keys())
+    live = live_scoring.LiveMeet()
+
+    # The first rows are entered, then the rest
+    first = meet_data.iloc[:120].copy()
+    changes = live.update(first)
+    assert changes['inserted'] == 120
+    assert_matches_recompute(live, first)
+
+    changes = live.update(meet_data)
+    assert changes['inserted'] == len(meet_data) - 120
+    assert_matches_recompute(live, meet_data)
+
+    # A score is corrected
+    edited = meet_data.copy()
+    row = edited[categories[0]].notna().idxmax()
+    edited.loc[row, categories[0]] = (edited.loc[row, categories[0]] + 1) % 7
+    changes = live.update(edited)
+    assert changes['edited'] == 1
+    assert changes['inserted'] == changes['deleted'] == 0
+    assert_matches_recompute(live, edited)
+
+    # Rows are deleted, and a late student is added
+    late = edited.iloc[[7]].copy()
+    late[late.keys()[0]] = 'Late'
+    edited = pd.concat([edited.drop(index=[3, 50, 51]), late],
+                       ignore_index=True)
+    changes = live.update(edited)
+    assert changes['deleted'] == 3
+    assert changes['inserted'] == 1
+    assert_matches_recompute(live, edited)
+
+    # Nothing changed
+    changes = live.update(edited.copy())
+    assert changes['inserted'] == changes['edited'] == \
+        changes['deleted'] == 0
+    assert_matches_recompute(live, edited)
+
+
+def test_watch_keeps_going_past_a_bad_score(league):
+    meet_data = pd.read_csv(SCORES_PATH)
+    paths = live_scoring.provisional_paths(YEAR, 1)
+    live_scoring.watch(YEAR, 1, polls=1)
+    provisional = [read_file(path) for path in paths]
+
+    # A score typed in wrong is reported and the provisional files are kept
+    categories = data_functions.score_columns(meet_data.keys())
+    row = meet_data[categories[0]].notna().idxmax()
+    mistyped = meet_data.astype({categories[0]: object})
+    mistyped.loc[row, categories[0]] = '4a'
+    mistyped.to_csv(SCORES_PATH, index=False)
+
+    messages = []
+
+    def fix(message: str) -> None:
+        messages.append(message)
+        assert [read_file(path) for path in paths] == provisional
+        meet_data.loc[row, categories[0]] = 4
+        meet_data.to_csv(SCORES_PATH, index=False)
+
+    live = live_scoring.watch(YEAR, 1, interval=0, polls=2, on_problem=fix)
+    assert len(messages) == 1
+    assert f"Row {row + 2}, '{categories[0]}': the score isn't a number" \
+        in messages[0]
+
+    # Once it's fixed, the next poll picks it up
+    student_data, _ = data_functions.calculate_stats(SCORES_PATH)
+    assert live.student_data().to_csv(index=False) == \
+        student_data.to_csv(index=False)
@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+
+import data_functions
+import reconcile
+import season_store
+from data_functions import FIRST_NAME, GRADE, LAST_NAME, SCHOOL, STUDENT_ID
+from conftest import YEAR
+from student_registry import StudentRegistry
+
+
+def test_candidate_pairs_cover_blocks_and_sorted_neighbors(monkeypatch):
+    students = pd.DataFrame({
+        'last_name': ['Lee', 'Lee', 'Zorn', 'Abbot', 'Ng'],
+        'first_name': ['Ann', 'Anne', 'Bo', 'Cy', 'Di'],
+        'school': ['Penfield', 'Webster', 'Penfield', 'Webster', 'Penfield'],
+        'class_of': [2025, 2026, 2025, 2027, 2030]})
+    pairs = {tuple(pair) for pair in reconcile.candidate_pairs(students)}
+
+    # Rows 0 and 2 share a block; rows 0 and 1 sort next to each other
+    assert (0, 2) in pairs
+    assert (0, 1) in pairs
+    assert all(left < right for left, right in pairs)
+    assert (1, 3) in pairs and (0, 4) in pairs
+
+    # Students in different blocks who don't sort within the window of each
+    # other either way aren't compared
+    monkeypatch.setattr(reconcile, 'WINDOW', 1)
+    pairs = {tuple(pair) for pair in reconcile.candidate_pairs(students)}
+    assert (0, 2) in pairs and (0, 1) in pairs
+    assert (1, 3) not in pairs and (0, 4) not in pairs
+
+
+def played(meet_data: pd.DataFrame) -> np.ndarray:
+    categories = data_functions.score_columns(meet_data.keys())
+    return meet_data[categories].notna().any(axis=1).to_numpy()
+
+
+def test_a_typo_is_suggested_and_merged(league):
+    first_meet = pd.read_csv(f'{YEAR}/Meet 1.csv')
+    second_meet = pd.read_csv(f'{YEAR}/Meet 2.csv')
+    row = np.flatnonzero(played(first_meet) & played(second_meet))[0]
+    student = second_meet.loc[row].copy()
+
+    # Meet 2 has the student's last name typed with one letter wrong, and a
+    # different student with their exact name at another school and grade
+    name = student[LAST_NAME]
+    second_meet.loc[row, LAST_NAME] = name[:-1] + \
+        ('x' if name[-1] != 'x' else 'y')
+    namesake = student.copy()
+    namesake[SCHOOL] = 'Namesake School'
+    namesake[GRADE] = 12 if student[GRADE] <= 10 else 9
+    second_meet = pd.concat([second_meet, namesake.to_frame().T],
+                            ignore_index=True)
+    second_meet.to_csv(f'{YEAR}/Meet 2.csv', index=False)
+
+    data_functions.create_reports(YEAR, 1)
+    data_functions.create_reports(YEAR, 2)
+    rated = pd.read_csv(f'{YEAR}/Meet 1/Meet 1 with Student Ratings.csv')
+    kept_id = rated.loc[row, STUDENT_ID]
+    rated = pd.read_csv(f'{YEAR}/Meet 2/Meet 2 with Student Ratings.csv')
+    merged_id = rated.loc[row, STUDENT_ID]
+
+    suggestions = reconcile.suggest_merges()
+    assert suggestions[[reconcile.KEEP_ID, reconcile.MERGE_ID]] \
+        .values.tolist() == [[kept_id, merged_id]]
+
+    written = reconcile.apply_merges(suggestions)
+    assert f'./{YEAR}/roster.csv' in written
+    assert f'./{YEAR}/Cumulative Ratings - Meet 2.csv' in written
+
+    # The old ID resolves to the kept one everywhere
+    with StudentRegistry() as registry:
+        assert registry.canonical(int(merged_id)) == kept_id
+    roster = pd.read_csv(f'{YEAR}/roster.csv')
+    assert merged_id not in roster[STUDENT_ID].values
+    assert kept_id in roster[STUDENT_ID].values
+    cumulative = pd.read_csv(f'{YEAR}/Cumulative Ratings - Meet 2.csv',
+                             index_col=STUDENT_ID)
+    assert merged_id not in cumulative.index
+    assert cumulative.loc[kept_id, ['Meet 1 Rating', 'Meet 2 Rating']] \
+        .notna().all()
+    assert [meet for meet, _ in
+            season_store.student_ratings(YEAR, int(kept_id))] == [1, 2]
+    assert cumulative.loc[kept_id, FIRST_NAME] == student[FIRST_NAME]
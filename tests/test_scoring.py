@@ -0,0 +1,78 @@
+import json
+
+import numpy as np
+import pytest
+
+import data_functions
+import scoring
+from conftest import YEAR
+
+
+SCORES_PATH = f'{YEAR}/Meet 1.csv'
+
+
+def write_rules(rules: dict) -> None:
+    with open(scoring.SCORING_FILE, 'w') as outfile:
+        json.dump(rules, outfile)
+
+
+def test_default_rules_are_the_mcmls():
+    rules = scoring.Scoring()
+    np.testing.assert_array_equal(
+        rules.category_ratings(np.array([4, 0]), np.array([10.0, 0.0])),
+        [12.5, np.nan])
+
+    # Rating A is points over the ratings of the categories played, Rating B
+    # the average score relative to the category rating
+    results = rules.student_ratings({
+        'total': np.array([10.0]), 'rating_sum': np.array([40.0]),
+        'relative_sum': np.array([0.9]), 'played': np.array([3])})
+    assert results['rating_a'][0] == 10.0 / 40.0
+    assert results['rating_b'][0] == 0.9 / 3
+    assert results['final'][0] == (10.0 / 40.0 + 0.9 / 3) / 2
+
+
+def test_rules_file_with_the_defaults_changes_nothing(league):
+    student_data, category_data = data_functions.calculate_stats(SCORES_PATH)
+    write_rules(scoring.DEFAULT_SCORING)
+    same = data_functions.calculate_stats(SCORES_PATH)
+    assert same[0].to_csv(index=False) == student_data.to_csv(index=False)
+    assert same[1].to_csv(index=False) == category_data.to_csv(index=False)
+
+
+def test_custom_category_formula_is_applied(league):
+    write_rules({'category_formula': 'total / count * 4'})
+    _, category_data = data_functions.calculate_stats(SCORES_PATH)
+    np.testing.assert_array_equal(
+        category_data[data_functions.RATINGS],
+        category_data[data_functions.TOTAL] /
+        category_data[data_functions.COUNT] * 4)
+
+
+@pytest.mark.parametrize('formula', [
+    "__import__('os').system('true')",
+    'total.real',
+    "open('Scoring.json')",
+    'sqrt(total, out=total)',
+    '(lambda: 1)()',
+    'total[0]',
+    "total + 'a'",
+    'unknown * 2',
+    'total +',
+])
+def test_formulas_outside_the_allowed_syntax_are_rejected(formula):
+    with pytest.raises(ValueError):
+        scoring.Scoring({'category_formula': formula})
+    with pytest.raises(ValueError):
+        scoring.Scoring({'student_formulas': {'final': formula}})
+
+
+def test_bad_rules_files_are_rejected(league):
+    with open(scoring.SCORING_FILE, 'w') as outfile:
+        outfile.write('{"score_columns": ')
+    with pytest.raises(ValueError, match='Invalid Scoring Rules'):
+        scoring.active()
+
+    write_rules({'score_colums': 6})
+    with pytest.raises(ValueError, match='score_colums'):
+        scoring.active()
@@ -0,0 +1,28 @@
+import pandas as pd
+
+import data_functions
+from conftest import MEETS, YEAR
+
+
+def test_rerunning_an_earlier_meet_keeps_a_later_correction(league):
+    for meet in range(1, MEETS + 1):
+        data_functions.create_reports(YEAR, meet)
+
+    # The last meet's sheet is saved with its Student IDs and a name fixed
+    scores_path = f'{YEAR}/Meet {MEETS}.csv'
+    rated = pd.read_csv(
+        f'{YEAR}/Meet {MEETS}/Meet {MEETS} with Student Ratings.csv')
+    student_id = rated.loc[0, data_functions.STUDENT_ID]
+    rated.loc[0, data_functions.LAST_NAME] = 'Corrected'
+    rated.drop(columns=data_functions.FINAL_RATING).to_csv(scores_path,
+                                                           index=False)
+    data_functions.create_reports(YEAR, MEETS, rerun=True)
+    data_functions.create_reports(YEAR, 1, rerun=True)
+
+    for meet in range(1, MEETS + 1):
+        cumulative = pd.read_csv(
+            f'{YEAR}/Cumulative Ratings - Meet {meet}.csv',
+            index_col=data_functions.STUDENT_ID)
+        if student_id in cumulative.index:
+            assert cumulative.loc[student_id, data_functions.LAST_NAME] == \
+                'Corrected'
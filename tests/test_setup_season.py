@@ -0,0 +1,23 @@
+import os
+
+import pytest
+
+import data_functions
+from conftest import YEAR, read_file
+
+
+@pytest.mark.parametrize('linesep', ['\n', '\r\n'])
+def test_season_files_are_written_as_pandas_writes_them(league, monkeypatch,
+                                                        linesep):
+    # Every line ends as the platform's do, on Windows too
+    monkeypatch.setattr(os, 'linesep', linesep)
+    categories = {4: ['Algebra', 'Geometry'],
+                  5: ['Algebra', 'Geometry', 'Number Theory']}
+    paths = data_functions.setup_season(YEAR, categories)
+
+    roster = data_functions.load_roster(YEAR)
+    for meet, path in zip(categories, paths):
+        expected = roster.copy()
+        expected[categories[meet]] = None
+        expected.to_csv('expected.csv', index=False)
+        assert read_file(path) == read_file('expected.csv')
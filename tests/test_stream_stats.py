@@ -0,0 +1,56 @@
+import os
+
+import pandas as pd
+import pytest
+
+import data_functions
+import mcmlstats
+import validation
+from conftest import YEAR, read_file
+
+
+SCORES_PATH = f'{YEAR}/Meet 1.csv'
+
+
+@pytest.mark.parametrize('chunksize', [37, 100_000])
+def test_streamed_files_match_meet_stats(league, chunksize):
+    student_data, category_data = data_functions.calculate_stats(SCORES_PATH)
+    data_functions.stream_stats(SCORES_PATH, 'ratings.csv', 'categories.csv',
+                                chunksize)
+
+    assert read_file('ratings.csv') == \
+        student_data.to_csv(index=False).encode('utf-8')
+    assert read_file('categories.csv') == \
+        category_data.to_csv(index=False).encode('utf-8')
+
+
+def test_duplicates_across_chunks_stop_the_stream(league):
+    meet_data = pd.read_csv(SCORES_PATH)
+    meet_data = pd.concat([meet_data, meet_data.iloc[[0]]],
+                          ignore_index=True)
+    meet_data.loc[5, meet_data.keys()[4]] = 9
+    meet_data.to_csv(SCORES_PATH, index=False)
+
+    with pytest.raises(validation.InvalidMeetData) as raised:
+        data_functions.stream_stats(SCORES_PATH, 'ratings.csv',
+                                    'categories.csv', chunksize=50)
+    assert not os.path.exists('ratings.csv')
+    assert not os.path.exists('categories.csv')
+
+    whole = validation.validate(data_functions.read_data_file(
+        SCORES_PATH, has_scores=True))
+    pd.testing.assert_frame_equal(raised.value.report.problems(),
+                                  whole.problems())
+    problems = set(raised.value.report.problems()['Problem'])
+    assert validation.PROBLEMS[validation.DUPLICATE_STUDENT] in problems
+
+
+def test_analyze_stream(league):
+    mcmlstats.main(['analyze', str(YEAR), '1', '--stream',
+                    '--chunksize', '50'])
+    student_data, _ = data_functions.calculate_stats(SCORES_PATH)
+    assert read_file(f'{YEAR}/Meet 1/Meet 1 with Student Ratings.csv') == \
+        student_data.to_csv(index=False).encode('utf-8')
+
+    with pytest.raises(SystemExit):
+        mcmlstats.main(['analyze', str(YEAR), '1', '--stream'])
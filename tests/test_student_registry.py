@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+
+import student_registry
+from data_functions import FIRST_NAME, GRADE, LAST_NAME, SCHOOL, STUDENT_ID
+
+
+YEAR = 2021
+
+
+def students(*names, student_ids=None) -> pd.DataFrame:
+    frame = pd.DataFrame({LAST_NAME: [name[0] for name in names],
+                          FIRST_NAME: [name[1] for name in names],
+                          GRADE: 10, SCHOOL: 'Penfield'})
+    if student_ids is not None:
+        frame.insert(4, STUDENT_ID, student_ids)
+    return frame
+
+
+def test_a_typed_id_for_a_known_student_is_never_reused(tmp_path,
+                                                        monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ann = ('Lee', 'Ann')
+    assert student_registry.assign_ids(students(ann), YEAR).tolist() == [1]
+
+    # Ann's ID is typed in wrong; it resolves to her and isn't handed out
+    typed = students(ann, student_ids=[5])
+    assert student_registry.assign_ids(typed, YEAR).tolist() == [1]
+    new = student_registry.assign_ids(students(('Moss', 'Bo')), YEAR)
+    assert new.tolist() == [6]
+
+    with student_registry.StudentRegistry() as registry:
+        assert registry.canonical(5) == 1
+        assert registry.next_id == 7
+        assert np.array_equal(registry.assign_ids(typed, YEAR), [1])
@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+
+import validation
+from data_functions import FIRST_NAME, GRADE, LAST_NAME, SCHOOL, STUDENT_ID
+
+
+CATEGORIES = [f'Category {number}' for number in range(1, 7)]
+
+
+def sheet(rows: list[tuple]) -> pd.DataFrame:
+    """ A meet's scores: each row is the student's last and first name,
+    grade, school, Student ID and six scores. """
+    return pd.DataFrame(rows, columns=[LAST_NAME, FIRST_NAME, GRADE, SCHOOL,
+                                       STUDENT_ID] + CATEGORIES)
+
+
+def good_rows(count: int) -> list[tuple]:
+    return [(f'Last {row}', f'First {row}', 9, 'Penfield', row,
+             3, 4, 5, None, None, None) for row in range(count)]
+
+
+def flagged(report: validation.ValidationReport, bit: int) -> list[int]:
+    return np.flatnonzero(report.row_masks & bit).tolist()
+
+
+def flagged_cells(report: validation.ValidationReport,
+                  bit: int) -> list[tuple[int, int]]:
+    return [tuple(cell) for cell in
+            np.argwhere(report.cell_masks & bit).tolist()]
+
+
+def test_a_good_sheet_passes():
+    report = validation.validate(sheet(good_rows(5)))
+    assert report.ok
+    assert not report.row_masks.any() and not report.cell_masks.any()
+    assert report.problems().empty
+
+
+def test_duplicate_students_and_ids():
+    rows = good_rows(6)
+    rows[4] = rows[1][:4] + (40,) + rows[1][5:]
+    rows[5] = rows[5][:4] + (2,) + rows[5][5:]
+    report = validation.validate(sheet(rows))
+    assert flagged(report, validation.DUPLICATE_STUDENT) == [1, 4]
+    assert flagged(report, validation.DUPLICATE_ID) == [2, 5]
+    assert not report.cell_masks.any()
+
+
+def test_missing_details_and_bad_grades():
+    rows = good_rows(6)
+    rows[0] = (None,) + rows[0][1:]
+    rows[2] = rows[2][:3] + (None,) + rows[2][4:]
+    rows[3] = rows[3][:2] + (13,) + rows[3][3:]
+    rows[4] = rows[4][:2] + (9.5,) + rows[4][3:]
+    report = validation.validate(sheet(rows))
+    assert flagged(report, validation.MISSING_DETAILS) == [0, 2]
+    assert flagged(report, validation.BAD_GRADE) == [3, 4]
+
+
+def test_scores_that_are_not_numbers_or_out_of_range():
+    rows = good_rows(5)
+    rows[1] = rows[1][:5] + ('4a', 4, 5, None, None, None)
+    rows[3] = rows[3][:5] + (3, 7, -1, None, None, None)
+    report = validation.validate(sheet(rows))
+    assert flagged_cells(report, validation.NOT_A_NUMBER) == [(1, 0)]
+    assert flagged_cells(report, validation.OUT_OF_RANGE) == [(3, 1), (3, 2)]
+    assert flagged(report, validation.NOT_A_NUMBER) == [1]
+    assert flagged(report, validation.OUT_OF_RANGE) == [3]
+
+    problems = report.problems()
+    assert problems['Row'].tolist() == [3, 5, 5]
+    assert problems['Column'].tolist() == ['Category 1', 'Category 2',
+                                           'Category 3']
+
+
+def test_wrong_number_of_categories():
+    rows = good_rows(4)
+    rows[0] = rows[0][:5] + (3, 4, None, None, None, None)
+    rows[1] = rows[1][:5] + (3, 4, 5, 6, None, None)
+    # A student who didn't compete has no scores at all
+    rows[2] = rows[2][:5] + (None,) * 6
+    report = validation.validate(sheet(rows))
+    assert flagged(report, validation.WRONG_CATEGORY_COUNT) == [0, 1]
+
+
+def test_wrong_number_of_score_columns():
+    meet_data = sheet(good_rows(3)).drop(columns=CATEGORIES[-1])
+    report = validation.validate(meet_data)
+    assert not report.ok
+    assert report.sheet_problems == [
+        'The sheet has 5 score columns but needs 6']
+    # Every row would be wrong, so none is blamed for it
+    assert flagged(report, validation.WRONG_CATEGORY_COUNT) == []
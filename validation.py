@@ -0,0 +1,316 @@
+""" Checks a meet's scores before they're rated.
+
+One bad row changes the category ratings, and so the ratings of every student
+in the meet, so calculate_stats and create_reports refuse a sheet that
+doesn't pass. The whole sheet is checked at once: each check sets its bit in
+a mask for every row (and, for the scores, every cell) it finds a problem
+in, and the report lists each problem with its spreadsheet row and column.
+"""
+import numpy as np
+import pandas as pd
+
+import scoring
+from data_functions import FIRST_NAME, GRADE, KEY, LAST_NAME, SCHOOL, \
+    STUDENT_ID, score_columns
+
+
+# The problems a row or score can have, as bits of its mask
+DUPLICATE_STUDENT = 1 << 0
+DUPLICATE_ID = 1 << 1
+MISSING_DETAILS = 1 << 2
+BAD_GRADE = 1 << 3
+NOT_A_NUMBER = 1 << 4
+OUT_OF_RANGE = 1 << 5
+WRONG_CATEGORY_COUNT = 1 << 6
+
+PROBLEMS = {
+    DUPLICATE_STUDENT: "the same student is listed more than once",
+    DUPLICATE_ID: "the same Student ID is listed more than once",
+    MISSING_DETAILS: "the student's name or school is blank",
+    BAD_GRADE: "the grade isn't a whole number from 1 to 12",
+    NOT_A_NUMBER: "the score isn't a number",
+    OUT_OF_RANGE: "the score isn't from {min_score} to {max_score}",
+    WRONG_CATEGORY_COUNT: "the student has scores in a number of categories "
+    "other than {categories_played} (or none, if they didn't compete)",
+}
+
+# The most problems an error message lists
+MESSAGE_LINES = 15
+
+
+class ValidationReport:
+    ''' The problems found in a meet's scores. row_masks has a bit set for
+    each problem in each row, cell_masks one for each problem in each score,
+    and sheet_problems describes any problems with the sheet as a whole. A
+    report of only some of the rows gives each one's position in the sheet
+    in rows. '''
+
+    def __init__(self, categories: list[str], row_masks: np.ndarray,
+                 cell_masks: np.ndarray, sheet_problems: list[str],
+                 rows: np.ndarray = None):
+        self.categories = categories
+        self.row_masks = row_masks
+        self.cell_masks = cell_masks
+        self.sheet_problems = sheet_problems
+        self.rows = rows
+
+    @property
+    def ok(self) -> bool:
+        return not self.sheet_problems and not self.row_masks.any()
+
+    def problems(self) -> pd.DataFrame:
+        """ Returns a row for each problem found: the spreadsheet row (the
+        header is row 1) and column it's in and what's wrong. Problems with
+        the sheet as a whole have no row or column. """
+        rules = scoring.active().rules
+        rows, columns, descriptions = [], [], []
+        for problem in self.sheet_problems:
+            rows.append(None)
+            columns.append(None)
+            descriptions.append(problem)
+
+        for bit, description in PROBLEMS.items():
+            if bit in (NOT_A_NUMBER, OUT_OF_RANGE):
+                found, category = np.nonzero(self.cell_masks & bit)
+                column = np.array(self.categories, dtype=object)[category]
+            else:
+                found = np.flatnonzero(self.row_masks & bit)
+                column = np.full(len(found), None)
+            if self.rows is not None:
+                found = self.rows[found]
+            rows.extend((found + 2).tolist())
+            columns.extend(column.tolist())
+            descriptions.extend([description.format(**rules)] * len(found))
+
+        problems = pd.DataFrame({'Row': pd.array(rows, dtype='Int64'),
+                                 'Column': columns, 'Problem': descriptions})
+        return problems.sort_values('Row', kind='stable', na_position='first',
+                                    ignore_index=True)
+
+    def message(self, filename: str) -> str:
+        """ Describes the problems for the user, listing the first few. """
+        problems = self.problems()
+        lines = []
+        for row, column, description in problems.head(MESSAGE_LINES) \
+                .itertuples(index=False):
+            if pd.isna(row):
+                lines.append(f"{description}.")
+            elif pd.isna(column):
+                lines.append(f"Row {row}: {description}.")
+            else:
+                lines.append(f"Row {row}, '{column}': {description}.")
+        if len(problems) > MESSAGE_LINES:
+            lines.append(f"...and {len(problems) - MESSAGE_LINES} more.")
+
+        return (f"Invalid Meet Data\n\nThe file '{filename}' has "
+                f"{len(problems)} problem(s) that would throw off the "
+                "ratings. Please correct them and try again.\n\n"
+                + "\n".join(lines))
+
+
+class InvalidMeetData(ValueError):
+    ''' Raised for a scores file that doesn't pass validation. The first
+    argument is the message for the user; report holds the details. '''
+
+    def __init__(self, message: str, report: ValidationReport):
+        super().__init__(message)
+        self.report = report
+
+
+def validate(meet_data: pd.DataFrame) -> ValidationReport:
+    """ Checks every row of a meet's scores and returns what was found. """
+    rules = scoring.active()
+    columns = meet_data.keys()
+    categories = score_columns(columns)
+    sheet_problems = []
+    missing = [column for column in KEY if column not in columns]
+    if missing:
+        sheet_problems.append(
+            "The sheet is missing the column(s) " +
+            ", ".join(f"'{column}'" for column in missing))
+    expected = rules.score_columns
+    if len(categories) != expected:
+        sheet_problems.append(
+            f"The sheet has {len(categories)} score columns but needs "
+            f"{expected}")
+
+    rows = len(meet_data)
+    row_masks = np.zeros(rows, dtype=np.uint8)
+
+    # Students
+    present = [column for column in KEY if column in columns]
+    if present:
+        row_masks[_duplicated(meet_data, present)] |= DUPLICATE_STUDENT
+    if STUDENT_ID in columns:
+        ids = meet_data[STUDENT_ID]
+        row_masks[(ids.notna() & ids.duplicated(keep=False)).to_numpy()] \
+            |= DUPLICATE_ID
+
+    details = [column for column in (LAST_NAME, FIRST_NAME, SCHOOL)
+               if column in columns]
+    if details:
+        row_masks[meet_data[details].isna().any(axis=1).to_numpy()] \
+            |= MISSING_DETAILS
+
+    if GRADE in columns:
+        grades = _numbers(meet_data[GRADE])
+        with np.errstate(invalid='ignore'):
+            good = (grades >= 1) & (grades <= 12) & \
+                (grades == np.round(grades))
+        row_masks[~good] |= BAD_GRADE
+
+    # Scores
+    entered = meet_data[categories].notna().to_numpy()
+    scores = np.empty((rows, len(categories)), order='F')
+    for i, category in enumerate(categories):
+        scores[:, i] = _numbers(meet_data[category])
+    played = ~np.isnan(scores)
+    not_a_number = entered & ~played
+    with np.errstate(invalid='ignore'):
+        out_of_range = (scores < rules.min_score) | \
+            (scores > rules.max_score)
+    cell_masks = not_a_number * np.uint8(NOT_A_NUMBER) \
+        | out_of_range * np.uint8(OUT_OF_RANGE)
+    row_masks[not_a_number.any(axis=1)] |= NOT_A_NUMBER
+    row_masks[out_of_range.any(axis=1)] |= OUT_OF_RANGE
+
+    # Every row would be wrong if the score columns are
+    if len(categories) == expected:
+        played_count = entered.sum(axis=1)
+        row_masks[(played_count != 0) &
+                  (played_count != rules.categories_played)] \
+            |= WRONG_CATEGORY_COUNT
+
+    return ValidationReport(categories, row_masks, cell_masks, sheet_problems)
+
+
+def _numbers(values: pd.Series) -> np.ndarray:
+    """ Returns the values as floats, with NaN for blanks and anything that
+    isn't a number. """
+    if not pd.api.types.is_numeric_dtype(values):
+        values = pd.to_numeric(values, errors='coerce')
+    return values.to_numpy(dtype=float, na_value=np.nan)
+
+
+def _duplicated(meet_data: pd.DataFrame, columns: list[str]) -> np.ndarray:
+    """ Marks every row whose values in the given columns match another
+    row's. Each column is reduced to integer codes and the codes are folded
+    into one integer key per row, so only that key has to be hashed. """
+    key = np.zeros(len(meet_data), dtype=np.int64)
+    key_size = 1
+    for column in columns:
+        values = meet_data[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # Blanks have the code -1
+            codes = values.cat.codes.to_numpy(dtype=np.int64) + 1
+            size = len(values.cat.categories) + 1
+        else:
+            codes, uniques = pd.factorize(values, use_na_sentinel=False)
+            size = max(len(uniques), 1)
+
+        # Renumber the keys first if folding in the codes could overflow
+        if key_size * size >= 2**62:
+            key, uniques = pd.factorize(key)
+            key_size = max(len(uniques), 1)
+        key = key * size + codes
+        key_size *= size
+
+    return pd.Series(key).duplicated(keep=False).to_numpy()
+
+
+def check(meet_data: pd.DataFrame, filename: str) -> None:
+    """ Raises InvalidMeetData if the meet's scores don't pass validation. """
+    report = validate(meet_data)
+    if not report.ok:
+        raise InvalidMeetData(report.message(filename), report)
+
+
+class ChunkedValidation:
+    ''' Validates a scores file read a chunk at a time, for stream_stats.
+    Each chunk is checked as it comes and only its rows with problems are
+    kept. Students and Student IDs listed more than once are found across
+    chunks from a hash of each row's details, so only 16 bytes a row are
+    kept for those. The report lists the problems validate would find in the
+    whole file. '''
+
+    def __init__(self, columns: pd.Index):
+        self.columns = columns
+        self.categories = None
+        self.sheet_problems = []
+        self.rows = 0
+        # Each chunk's rows with problems, by position in the file, and their
+        # masks
+        self.flagged = []
+        self.row_masks = []
+        self.cell_masks = []
+        self.student_hashes = []
+        self.student_ids = []
+
+    def add(self, chunk: pd.DataFrame) -> bool:
+        """ Checks the file's next chunk. Returns whether it passed on its
+        own. """
+        report = validate(chunk)
+        if self.categories is None:
+            self.categories = report.categories
+            self.sheet_problems = report.sheet_problems
+        flagged = np.flatnonzero(report.row_masks)
+        self.flagged.append(flagged + self.rows)
+        self.row_masks.append(report.row_masks[flagged])
+        self.cell_masks.append(report.cell_masks[flagged])
+        self.rows += len(chunk)
+
+        present = [column for column in KEY if column in chunk]
+        if present:
+            details = pd.DataFrame({column: _comparable(chunk[column])
+                                    for column in present})
+            self.student_hashes.append(pd.util.hash_pandas_object(
+                details, index=False).to_numpy())
+        if STUDENT_ID in chunk:
+            self.student_ids.append(_numbers(chunk[STUDENT_ID]))
+        return report.ok
+
+    def report(self) -> ValidationReport:
+        """ Returns the report of the rows with problems. """
+        if self.categories is None:
+            return validate(pd.DataFrame(columns=self.columns))
+
+        # Duplicates within a chunk were found already; find them all again
+        duplicates = {}
+        if self.student_hashes:
+            hashes = pd.Series(np.concatenate(self.student_hashes))
+            duplicates[DUPLICATE_STUDENT] = np.flatnonzero(
+                hashes.duplicated(keep=False).to_numpy())
+        if self.student_ids:
+            ids = pd.Series(np.concatenate(self.student_ids))
+            duplicates[DUPLICATE_ID] = np.flatnonzero(
+                (ids.notna() & ids.duplicated(keep=False)).to_numpy())
+
+        flagged = np.concatenate(self.flagged)
+        rows = np.unique(np.concatenate([flagged, *duplicates.values()]))
+        row_masks = np.zeros(len(rows), dtype=np.uint8)
+        cell_masks = np.zeros((len(rows), len(self.categories)),
+                              dtype=np.uint8)
+        found = np.searchsorted(rows, flagged)
+        row_masks[found] = np.concatenate(self.row_masks) & \
+            np.uint8(~(DUPLICATE_STUDENT | DUPLICATE_ID) & 0xFF)
+        cell_masks[found] = np.concatenate(self.cell_masks)
+        for bit, duplicated in duplicates.items():
+            row_masks[np.searchsorted(rows, duplicated)] |= bit
+
+        return ValidationReport(self.categories, row_masks, cell_masks,
+                                self.sheet_problems, rows)
+
+    def check(self, filename: str) -> None:
+        """ Raises InvalidMeetData if the file doesn't pass validation. """
+        report = self.report()
+        if not report.ok:
+            raise InvalidMeetData(report.message(filename), report)
+
+
+def _comparable(values: pd.Series) -> pd.Series:
+    """ The values in a form that compares the same whichever types a chunk
+    of the file was read with: numbers as floats, anything else as text. """
+    if pd.api.types.is_numeric_dtype(values) and \
+            not isinstance(values.dtype, pd.CategoricalDtype):
+        return values.astype(float)
+    return values.astype(str)